@@ -0,0 +1,140 @@
+"""
+Codecs entries can be stored with, selected by the WIKI_ENTRY_COMPRESSION
+setting. Every codec has its own file suffix after '.md', so entries stored
+with different codecs can coexist while they are being migrated (`manage.py
+compress_entries`) and are always read with the right one.
+
+- None, plain UTF-8 Markdown ('.md').
+- 'gzip' ('.md.gz'), which can be sent as is to clients accepting gzip.
+- 'zstd' ('.md.zst', zstandard package), optionally with a dictionary trained
+  on the entries (WIKI_ZSTD_DICTIONARY), which compresses small pages much
+  better. Entries compressed with a dictionary can only be read with that same
+  dictionary, whose id zstd writes in every frame. Trained dictionaries are
+  also kept as '<WIKI_ZSTD_DICTIONARY>.<id>', so entries compressed with a
+  replaced one stay readable until `compress_entries zstd` recompresses them,
+  reading an entry whose dictionary is gone raises UnreadableEntry.
+"""
+import functools
+import gzip
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+SUFFIXES = {
+    None: '.md',
+    'gzip': '.md.gz',
+    'zstd': '.md.zst',
+}
+FILENAME_RE = re.compile(r'^(.*)\.md(?:\.gz|\.zst)?$')
+
+
+def entry_title(filename):
+    """
+    Returns the title of the entry stored in the file, None for other files.
+    """
+    match = FILENAME_RE.match(filename)
+    return match.group(1) if match else None
+
+
+def configured_codec():
+    codec = getattr(settings, 'WIKI_ENTRY_COMPRESSION', None) or None
+    if codec not in SUFFIXES:
+        raise ImproperlyConfigured(f"Unknown entry compression '{codec}', expected gzip, zstd or none.")
+    return codec
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImproperlyConfigured("zstd compression of entries requires the zstandard package.")
+    return zstandard
+
+
+class UnreadableEntry(ImproperlyConfigured):
+    """
+    Raised for entries compressed with a zstd dictionary which is not available.
+    """
+
+
+@functools.lru_cache(maxsize=None)
+def _load_dictionary(path, mtime_ns):
+    with open(path, 'rb') as f:
+        return _zstandard().ZstdCompressionDict(f.read())
+
+
+def _dictionary_at(path):
+    """
+    Returns the dictionary stored at 'path', None if there is none. A file
+    replaced in the meantime is read again.
+    """
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+    return _load_dictionary(path, mtime_ns)
+
+
+def _zstd_dictionary():
+    return _dictionary_at(getattr(settings, 'WIKI_ZSTD_DICTIONARY', None))
+
+
+def _zstd_dictionary_by_id(dict_id):
+    """
+    Returns the dictionary with the given id, the configured one or one kept
+    when it was replaced.
+    """
+    dictionary = _zstd_dictionary()
+    if dictionary is not None and dictionary.dict_id() == dict_id:
+        return dictionary
+    path = getattr(settings, 'WIKI_ZSTD_DICTIONARY', None)
+    dictionary = _dictionary_at(f'{path}.{dict_id}') if path else None
+    if dictionary is None:
+        raise UnreadableEntry(
+            f"The entry was compressed with the zstd dictionary {dict_id}, which is neither "
+            f"WIKI_ZSTD_DICTIONARY nor kept next to it."
+        )
+    return dictionary
+
+
+def compress(content, codec):
+    """
+    Returns the stored form of the Markdown content.
+    """
+    data = content.encode('utf-8')
+    if codec == 'gzip':
+        # No timestamp, the same content is always stored the same way.
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if codec == 'zstd':
+        zstandard = _zstandard()
+        return zstandard.ZstdCompressor(level=19, dict_data=_zstd_dictionary()).compress(data)
+    return data
+
+
+def decompress(data, codec):
+    """
+    Returns the Markdown content of the stored form.
+    """
+    if codec == 'gzip':
+        data = gzip.decompress(data)
+    elif codec == 'zstd':
+        zstandard = _zstandard()
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        dictionary = _zstd_dictionary_by_id(dict_id) if dict_id else None
+        data = zstandard.ZstdDecompressor(dict_data=dictionary).decompress(data)
+    return data.decode('utf-8')
+
+
+def train_zstd_dictionary(samples, path, size=16 * 1024):
+    """
+    Trains a dictionary on the given Markdown samples and writes it to 'path',
+    and to 'path.<id>' where it is found once replaced.
+    """
+    dictionary = _zstandard().train_dictionary(size, [sample.encode('utf-8') for sample in samples])
+    for destination in (f'{path}.{dictionary.dict_id()}', path):
+        with open(destination, 'wb') as f:
+            f.write(dictionary.as_bytes())
+    _load_dictionary.cache_clear()
@@ -0,0 +1,84 @@
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from encyclopedia import util
+from encyclopedia.renderers import available_renderers, differences, get_renderer
+
+
+def sample(size):
+    """
+    Returns about 'size' bytes of Markdown made of whole entries, repeated as
+    often as needed.
+    """
+    entries = [util.get_entry(title) for title in util.list_entries()]
+    if not entries:
+        raise CommandError("There are no entries to build samples from.")
+    parts, length = [], 0
+    while length < size:
+        entry = entries[len(parts) % len(entries)]
+        parts.append(entry)
+        length += len(entry.encode('utf-8')) + 2
+    return '\n\n'.join(parts)
+
+
+def best_time(render, text, seconds):
+    """
+    Renders the text repeatedly for about 'seconds' and returns the fastest
+    rendering, the least disturbed by the rest of the system.
+    """
+    render(text)
+    best, deadline = float('inf'), time.perf_counter() + seconds
+    while True:
+        start = time.perf_counter()
+        render(text)
+        now = time.perf_counter()
+        best = min(best, now - start)
+        if now >= deadline:
+            return best
+
+
+class Command(BaseCommand):
+    help = ("Measures how fast the installed Markdown renderers convert entries of several sizes. "
+            "Speedups are relative to the first renderer. Fails first if a renderer does not render "
+            "every entry as markdown2 does.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('renderers', nargs='*', help="Renderers to measure, all installed ones by default.")
+        parser.add_argument('--sizes', default='1,10,100',
+                            help="Comma separated sizes of the samples in KiB.")
+        parser.add_argument('--seconds', type=float, default=0.5,
+                            help="Time spent measuring every renderer on every sample.")
+
+    def handle(self, *args, **options):
+        names = options['renderers'] or available_renderers()
+        for name in names:
+            try:
+                get_renderer(name)
+            except ImproperlyConfigured as e:
+                raise CommandError(e)
+        entries = [(title, util.get_entry(title)) for title in util.list_entries()]
+        for name in names:
+            differing = differences(name, entries)
+            if differing:
+                raise CommandError(
+                    f"The {name} renderer does not render {', '.join(differing)} as markdown2 does."
+                )
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError("--sizes must be comma separated numbers.")
+
+        self.stdout.write(f"{'renderer':<10} {'size KiB':>9} {'ms':>10} {'MiB/s':>8} {'speedup':>8}")
+        for size in sizes:
+            text = sample(size * 1024)
+            megabytes = len(text.encode('utf-8')) / 1024 / 1024
+            baseline = None
+            for name in names:
+                seconds = best_time(get_renderer(name), text, options['seconds'])
+                baseline = baseline or seconds
+                self.stdout.write(
+                    f"{name:<10} {size:>9} {seconds * 1000:>10.3f} {megabytes / seconds:>8.2f} "
+                    f"{baseline / seconds:>7.1f}x"
+                )
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from encyclopedia import compression, util
+
+
+CODECS = {'none': None, 'gzip': 'gzip', 'zstd': 'zstd'}
+
+
+class Command(BaseCommand):
+    help = ("Stores every entry with the given compression, or uncompressed with 'none'. "
+            "Set WIKI_ENTRY_COMPRESSION to the same value so new entries are stored that way too.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('codec', choices=CODECS)
+        parser.add_argument('--train-dictionary', action='store_true',
+                            help="Train a zstd dictionary on the entries first, written to WIKI_ZSTD_DICTIONARY.")
+        parser.add_argument('--dictionary-size', type=int, default=16 * 1024,
+                            help="Size of the trained dictionary in bytes.")
+
+    def handle(self, *args, **options):
+        codec = CODECS[options['codec']]
+        dictionary_path = getattr(settings, 'WIKI_ZSTD_DICTIONARY', None)
+        if options['train_dictionary'] and (codec != 'zstd' or not dictionary_path):
+            raise CommandError("--train-dictionary needs the zstd codec and WIKI_ZSTD_DICTIONARY to be set.")
+
+        # Copied, storing the entries replaces the table.
+        titles = list(util.list_entries())
+        stored_before = stored_after = 0
+        try:
+            # Entries are all read before a new dictionary could make the ones
+            # compressed with the previous one unreadable.
+            entries = {}
+            for title in titles:
+                data, entry_codec = util.get_stored_entry(title)
+                stored_before += len(data)
+                entries[title] = compression.decompress(data, entry_codec)
+
+            if options['train_dictionary']:
+                compression.train_zstd_dictionary(entries.values(), dictionary_path, options['dictionary_size'])
+                self.stdout.write(f"Trained a dictionary of {options['dictionary_size']} bytes on {len(entries)} entries.")
+
+            for title, content in entries.items():
+                util.store_entry(title, content, codec)
+                stored_after += len(util.get_stored_entry(title)[0])
+        except ImproperlyConfigured as e:
+            raise CommandError(e)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {len(titles)} entries with {options['codec']}: {stored_before} -> {stored_after} bytes."
+        ))
+        if codec != compression.configured_codec():
+            self.stderr.write(self.style.WARNING(
+                f"WIKI_ENTRY_COMPRESSION is {compression.configured_codec()}, new entries will be stored that way."
+            ))
@@ -0,0 +1,128 @@
+"""
+Markdown renderers the entries can be converted to HTML with, selected by the
+WIKI_MARKDOWN_RENDERER setting:
+
+- 'markdown2', pure Python, the one the wiki always used.
+- 'mistune', pure Python as well but several times faster.
+- 'cmark', the C reference implementation of CommonMark (cmarkgfm package),
+  faster still.
+
+Raw HTML in entries is passed through by all of them, as markdown2 does. They
+do not agree on every corner of the syntax though: headings written without a
+space after the '#'s, which CommonMark renders as paragraphs, are given one
+before mistune and cmark see them. The conformance tests in tests.py, and the
+benchmark_markdown command before it measures anything, check that the entries
+render with each of them as with markdown2.
+"""
+import re
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+def _markdown2():
+    import markdown2
+
+    # Markdown instances keep state while converting, one per thread is reused.
+    local = threading.local()
+
+    def render(text):
+        if not hasattr(local, 'markdown'):
+            local.markdown = markdown2.Markdown()
+        return str(local.markdown.convert(text))
+    return render
+
+
+# '#Title', a heading for markdown2, not for CommonMark.
+ATX_HEADING_RE = re.compile(r'^(#{1,6})(?=[^#\s])', re.MULTILINE)
+
+
+def commonmark_headings(text):
+    """
+    Adds the space CommonMark requires after the '#'s of headings.
+    """
+    return ATX_HEADING_RE.sub(r'\1 ', text)
+
+
+def _mistune():
+    import mistune
+
+    markdown = mistune.create_markdown(escape=False)
+
+    def render(text):
+        return markdown(commonmark_headings(text))
+    return render
+
+
+def _cmark():
+    import cmarkgfm
+    from cmarkgfm.cmark import Options
+
+    def render(text):
+        return cmarkgfm.markdown_to_html(commonmark_headings(text), options=Options.CMARK_OPT_UNSAFE)
+    return render
+
+
+RENDERERS = {
+    'markdown2': (_markdown2, 'markdown2'),
+    'mistune': (_mistune, 'mistune'),
+    'cmark': (_cmark, 'cmarkgfm'),
+}
+
+_loaded = {}
+
+
+def get_renderer(name=None):
+    """
+    Returns the function converting Markdown to HTML of the named renderer, by
+    default the configured one. Raises ImproperlyConfigured if it is unknown or
+    its package is not installed.
+    """
+    name = name or getattr(settings, 'WIKI_MARKDOWN_RENDERER', 'markdown2')
+    if name not in _loaded:
+        if name not in RENDERERS:
+            raise ImproperlyConfigured(
+                f"Unknown Markdown renderer '{name}', expected one of {', '.join(RENDERERS)}."
+            )
+        factory, package = RENDERERS[name]
+        try:
+            _loaded[name] = factory()
+        except ImportError:
+            raise ImproperlyConfigured(f"The '{name}' Markdown renderer requires the {package} package.")
+    return _loaded[name]
+
+
+def available_renderers():
+    """
+    Returns the names of the renderers whose package is installed.
+    """
+    names = []
+    for name in RENDERERS:
+        try:
+            get_renderer(name)
+        except ImproperlyConfigured:
+            continue
+        names.append(name)
+    return names
+
+
+def normalize(html):
+    """
+    Puts every tag on a line of its own and drops the differences which do not
+    change how a page looks: whitespace between tags, self-closing slashes.
+    """
+    html = re.sub(r'\s*/>', '>', html)
+    html = re.sub(r'>\s+', '>', html)
+    html = re.sub(r'\s+<', '<', html)
+    return [line for line in re.sub(r'(<[^>]+>)', r'\n\1\n', html).splitlines() if line.strip()]
+
+
+def differences(name, texts):
+    """
+    Returns the names of the (name, Markdown) texts the named renderer does
+    not render as markdown2 does, up to whitespace between tags.
+    """
+    render, reference = get_renderer(name), get_renderer('markdown2')
+    return [text_name for text_name, text in texts
+            if normalize(render(text)) != normalize(reference(text))]
@@ -1,3 +1,199 @@
-from django.test import TestCase
+import gzip
+import os
+import tempfile
+import weakref
+from importlib.util import find_spec
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import markdown2
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from . import compression, titles, util
+from .renderers import commonmark_headings, get_renderer, normalize
+
+
+# Markdown the entries are written with, beyond the entries themselves.
+SAMPLES = [
+    "# Title\n\nSome *emphasis* and **strong** text with `code`.\n",
+    "A [link](/wiki/HTML) and an ![image](/static/logo.png).\n",
+    "- one\n- two\n\n1. first\n2. second\n",
+    "## Section\n\n> quoted\n\nAfter the quote.\n",
+    '<div class="note">Raw <b>HTML</b> is passed through.</div>\n\nFollowed by a paragraph.\n',
+    "    indented code\n\nText & <escaped> entities.\n",
+    "#Heading without a space\n\n###Another one\n",
+]
+
+
+def corpus():
+    """
+    Returns (name, Markdown) of the samples and of every stored entry.
+    """
+    _, filenames = default_storage.listdir("entries")
+    entries = sorted({compression.entry_title(filename) for filename in filenames} - {None})
+    return [(f"sample {i}", text) for i, text in enumerate(SAMPLES)] + [
+        (title, util.get_entry(title)) for title in entries
+    ]
+
+
+class MarkdownConformanceTests(SimpleTestCase):
+    """
+    The renderers must render the entries as markdown2, which the wiki always
+    used, did: the same HTML up to whitespace between tags. Renderers whose
+    package is not installed are skipped.
+    """
+
+    def assertRendersLikeMarkdown2(self, name):
+        render = get_renderer(name)
+        for entry, text in corpus():
+            with self.subTest(entry=entry):
+                self.assertEqual(normalize(render(text)), normalize(markdown2.markdown(text)))
+
+    def test_commonmark_headings(self):
+        self.assertEqual(
+            commonmark_headings("#Title\n\n##Section #1\n\n# Spaced\n\n#\n\n    #code\n"),
+            "# Title\n\n## Section #1\n\n# Spaced\n\n#\n\n    #code\n",
+        )
+
+    def test_markdown2(self):
+        self.assertRendersLikeMarkdown2('markdown2')
+
+    @skipUnless(find_spec('mistune'), "mistune is not installed.")
+    def test_mistune(self):
+        self.assertRendersLikeMarkdown2('mistune')
+
+    @skipUnless(find_spec('cmarkgfm'), "cmarkgfm is not installed.")
+    def test_cmark(self):
+        self.assertRendersLikeMarkdown2('cmark')
+
+
+class TemporaryEntriesMixin:
+    """
+    Runs every test on an empty entries directory of its own.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        os.mkdir(os.path.join(self.directory, 'entries'))
+        wiki_settings = override_settings(
+            MEDIA_ROOT=self.directory,
+            WIKI_TITLE_TABLE=os.path.join(self.directory, 'entries.titles'),
+            WIKI_ZSTD_DICTIONARY=os.path.join(self.directory, 'entries.zstd-dict'),
+            WIKI_ENTRY_COMPRESSION=None,
+        )
+        wiki_settings.enable()
+        self.addCleanup(wiki_settings.disable)
+        titles.reset()
+        self.addCleanup(titles.reset)
+
+
+class CompressionTests(TemporaryEntriesMixin, SimpleTestCase):
+
+    def test_codecs(self):
+        content = "# CSS\n\nCascading Style Sheets, \u00e9t\u00e9.\n"
+        for codec, suffix in compression.SUFFIXES.items():
+            if codec == 'zstd' and not find_spec('zstandard'):
+                continue
+            with self.subTest(codec=codec):
+                util.store_entry("CSS", content, codec)
+                self.assertEqual(util.get_stored_entry("CSS")[1], codec)
+                self.assertEqual(util.get_entry("CSS"), content)
+                self.assertEqual(default_storage.listdir("entries")[1], [f"CSS{suffix}"])
+                self.assertEqual(list(util.list_entries()), ["CSS"])
+
+    def test_gzip_entries_are_sent_as_stored(self):
+        util.store_entry("CSS", "# CSS\n", 'gzip')
+        url = reverse('wiki:entry_source', args=["CSS"])
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), b"# CSS\n")
+        self.assertEqual(self.client.get(url).content, b"# CSS\n")
+
+    @skipUnless(find_spec('zstandard'), "zstandard is not installed.")
+    def test_entries_outlive_their_dictionary(self):
+        samples = [f"# Entry {i}\n\nEntry {i} of the wiki links to [entry {i + 1}](/wiki/{i + 1}).\n" * (1 + i % 3)
+                   for i in range(500)]
+        path = os.path.join(self.directory, 'entries.zstd-dict')
+        compression.train_zstd_dictionary(samples, path, size=4096)
+        util.store_entry("Python", samples[7], 'zstd')
+
+        # Replaced by a new one, the previous dictionary is kept.
+        compression.train_zstd_dictionary(samples[::-1][:300], path, size=2048)
+        self.assertEqual(util.get_entry("Python"), samples[7])
+
+        for filename in os.listdir(self.directory):
+            if filename.startswith('entries.zstd-dict'):
+                os.remove(os.path.join(self.directory, filename))
+        with self.assertRaises(compression.UnreadableEntry):
+            util.get_entry("Python")
+        self.assertEqual(self.client.get(reverse('wiki:entry_page', args=["Python"])).status_code, 503)
+
+        # Entries compressed without a dictionary do not need one.
+        util.store_entry("Python", samples[7], 'zstd')
+        self.assertEqual(util.get_entry("Python"), samples[7])
+
+
+class TitleTableTests(TemporaryEntriesMixin, SimpleTestCase):
+
+    def add_by_hand(self, title):
+        path = os.path.join(self.directory, 'entries', f'{title}.md')
+        with open(path, 'w') as f:
+            f.write(f"# {title}\n")
+        # Modified within the same tick as the last save on coarse clocks.
+        directory = os.path.dirname(path)
+        mtime_ns = os.stat(directory).st_mtime_ns + 1_000_000_000
+        os.utime(directory, ns=(mtime_ns, mtime_ns))
+
+    def test_lookups(self):
+        for title in ["Python", "\u00c9t\u00e9", "CSS", "Git"]:
+            util.save_entry(title, f"# {title}\n")
+        table = util.list_entries()
+        self.assertEqual(list(table), ["CSS", "Git", "Python", "\u00c9t\u00e9"])
+        self.assertEqual((len(table), table[0], table[-1]), (4, "CSS", "\u00c9t\u00e9"))
+        self.assertEqual(table.bisect("H"), 2)
+        self.assertTrue(util.exists_entry("\u00c9t\u00e9"))
+        self.assertFalse(util.exists_entry("Gi"))
+        self.assertEqual(table.generation, 4)
+
+    def test_one_stat_per_lookup(self):
+        util.save_entry("CSS", "# CSS\n")
+        with mock.patch.object(titles.os, 'stat', wraps=os.stat) as stat:
+            self.assertTrue(util.exists_entry("CSS"))
+        self.assertEqual(stat.call_count, 1)
+
+    def test_entries_added_by_hand(self):
+        util.save_entry("CSS", "# CSS\n")
+        self.assertEqual(list(util.list_entries()), ["CSS"])
+        self.add_by_hand("HTML")
+        self.assertEqual(list(util.list_entries()), ["CSS", "HTML"])
+        self.assertEqual(self.client.get(reverse('wiki:entry_page', args=["HTML"])).status_code, 200)
+
+    def test_generation_built_by_another_process(self):
+        util.save_entry("CSS", "# CSS\n")
+        self.add_by_hand("HTML")
+        titles.rebuild()
+        table = titles.titles()
+        # Mapped again as another process would.
+        titles.reset()
+        self.assertEqual(list(titles.titles()), ["CSS", "HTML"])
+        self.assertEqual(titles.titles().generation, table.generation)
+
+    def test_replaced_tables_stay_readable(self):
+        util.save_entry("CSS", "# CSS\n")
+        util.save_entry("Git", "# Git\n")
+        table = util.list_entries()
+        listed = iter(table)
+        self.assertEqual(next(listed), "CSS")
+        # Saved by another thread while a template iterates the table.
+        util.save_entry("HTML", "# HTML\n")
+        self.assertEqual(list(listed), ["Git"])
+        self.assertIn("Git", table)
+        self.assertEqual(list(util.list_entries()), ["CSS", "Git", "HTML"])
+
+        replaced = weakref.ref(table)
+        del table, listed
+        self.assertIsNone(replaced())
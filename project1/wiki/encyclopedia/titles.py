@@ -0,0 +1,188 @@
+"""
+Sorted table of the entry titles, shared by all the processes serving the wiki.
+
+The table is a file (WIKI_TITLE_TABLE) every process maps read-only, so the
+operating system keeps a single copy of it in memory however many workers
+there are. It holds, in native byte order, a header (magic, generation, number
+of titles, modification time of the entries directory it was built from), the
+offsets of the titles in the blob and the blob of UTF-8 titles in code point
+order, which is also the byte order of their encodings. Lookups bisect the
+offsets and compare bytes, nothing is deserialized.
+
+A process saving an entry rebuilds the table under a lock and swaps it in with
+os.replace(), as a new generation. Lookups only stat the entries directory:
+when it was modified since the mapped table was built, the latest generation is
+mapped, or rebuilt first if it is stale too, e.g. after entries were added by
+hand. A replaced table stays mapped as long as it is referred to, e.g. by a
+template still iterating it, and is unmapped once it is not.
+"""
+import mmap
+import os
+import struct
+import threading
+from array import array
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from . import compression
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+MAGIC = b'WTT1'
+HEADER = struct.Struct('=4sQIq')
+
+_lock = threading.Lock()
+_current = None
+
+
+class TitleTable:
+    """
+    Read-only view of a mapped table, a sorted sequence of titles.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            # Raises ValueError for an empty file.
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            raise ValueError("Truncated title table.")
+        magic, self.generation, self.count, self.directory_mtime = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError("Not a title table.")
+        self._blob_start = HEADER.size + 4 * (self.count + 1)
+        self._offsets = memoryview(self._map)[HEADER.size:self._blob_start].cast('I')
+
+    def close(self):
+        # The offsets are a view of the map, which cannot be closed before it.
+        self._offsets.release()
+        self._map.close()
+
+    def _bytes(self, i):
+        return self._map[self._blob_start + self._offsets[i]:self._blob_start + self._offsets[i + 1]]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if not -self.count <= i < self.count:
+            raise IndexError("Title index out of range.")
+        return self._bytes(i % self.count).decode('utf-8')
+
+    def __iter__(self):
+        return (self._bytes(i).decode('utf-8') for i in range(self.count))
+
+    def bisect(self, title):
+        """
+        Returns the position of the first title not less than 'title'.
+        """
+        key = title.encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._bytes(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def __contains__(self, title):
+        i = self.bisect(title)
+        return i < self.count and self._bytes(i) == title.encode('utf-8')
+
+
+def table_path():
+    return getattr(settings, 'WIKI_TITLE_TABLE', None) or default_storage.path('entries.titles')
+
+
+def _directory_mtime():
+    return os.stat(default_storage.path('entries')).st_mtime_ns
+
+
+@contextmanager
+def _exclusive(path):
+    """
+    Serializes the rebuilds of all processes.
+    """
+    with _lock, open(path + '.lock', 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def rebuild():
+    """
+    Publishes the titles of the entries as the next generation of the table.
+    """
+    path = table_path()
+    with _exclusive(path):
+        # Read before listing, a change made meanwhile makes the table stale.
+        mtime = _directory_mtime()
+        try:
+            previous = TitleTable(path)
+        except (OSError, ValueError):
+            generation = 1
+        else:
+            generation = previous.generation + 1
+            previous.close()
+        _, filenames = default_storage.listdir("entries")
+        titles = {compression.entry_title(filename) for filename in filenames} - {None}
+        encoded = [title.encode('utf-8') for title in sorted(titles)]
+        offsets = array('I', [0])
+        for title in encoded:
+            offsets.append(offsets[-1] + len(title))
+
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, generation, len(encoded), mtime))
+            f.write(offsets.tobytes())
+            f.write(b''.join(encoded))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+    _install(TitleTable(path))
+
+
+def _install(table):
+    """
+    Makes 'table' the current table of the process. The previous one is
+    unmapped when the last reference to it goes.
+    """
+    global _current
+    with _lock:
+        _current = table
+
+
+def reset():
+    """
+    Forgets the current table, the next lookup maps the configured one again.
+    """
+    _install(None)
+
+
+def titles():
+    """
+    Returns the current table, mapping its latest generation or building it
+    if needed.
+    """
+    mtime = _directory_mtime()
+    table = _current
+    if table is not None and table.directory_mtime == mtime:
+        return table
+    try:
+        table = TitleTable(table_path())
+    except (OSError, ValueError):
+        table = None
+    if table is not None and table.directory_mtime == mtime:
+        _install(table)
+    else:
+        if table is not None:
+            table.close()
+        # If the directory keeps changing, the table is at most one change behind.
+        rebuild()
+    return _current
@@ -8,5 +8,6 @@ urlpatterns = [
     path("add", views.add_entry, name="add_entry"),
     path("wiki/<str:title>", views.entry_page, name="entry_page"),
     path("edit/<str:title>", views.edit_entry, name="edit_entry"),
+    path("source/<str:title>", views.entry_source, name="entry_source"),
     path("random_page", views.random_page, name="random_page")
 ]
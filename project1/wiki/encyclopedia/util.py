@@ -1,17 +1,17 @@
-import re
-
-import markdown2
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 
+from . import compression, titles
+from .renderers import get_renderer
+
 
 def list_entries():
     """
-    Returns a list of all names of encyclopedia entries.
+    Returns the sorted sequence of all names of encyclopedia entries,
+    the title table shared by the processes (see titles.py), read from
+    the mapped file as it is iterated or indexed.
     """
-    _, filenames = default_storage.listdir("entries")
-    return list(sorted(re.sub(r"\.md$", "", filename)
-                for filename in filenames if filename.endswith(".md")))
+    return titles.titles()
 
 
 def save_entry(title, content):
@@ -20,10 +20,38 @@ def save_entry(title, content):
     content. If an existing entry with the same title already exists,
     it is replaced.
     """
-    filename = f"entries/{title}.md"
+    store_entry(title, content, compression.configured_codec())
+
+
+def store_entry(title, content, codec):
+    """
+    Saves an encyclopedia entry compressed with the given codec (None
+    for plain Markdown), and removes its copies stored with other codecs.
+    """
+    filename = f"entries/{title}{compression.SUFFIXES[codec]}"
     if default_storage.exists(filename):
         default_storage.delete(filename)
-    default_storage.save(filename, ContentFile(content))
+    default_storage.save(filename, ContentFile(compression.compress(content, codec)))
+    for other, suffix in compression.SUFFIXES.items():
+        if other != codec and default_storage.exists(f"entries/{title}{suffix}"):
+            default_storage.delete(f"entries/{title}{suffix}")
+    titles.rebuild()
+
+
+def get_stored_entry(title):
+    """
+    Retrieves an encyclopedia entry as it is stored, returning the
+    bytes and the codec they are compressed with, or None if no such
+    entry exists.
+    """
+    preferred = compression.configured_codec()
+    for codec in [preferred] + [c for c in compression.SUFFIXES if c != preferred]:
+        try:
+            with default_storage.open(f"entries/{title}{compression.SUFFIXES[codec]}") as f:
+                return f.read(), codec
+        except FileNotFoundError:
+            continue
+    return None
 
 
 def get_entry(title):
@@ -31,17 +59,17 @@ def get_entry(title):
     Retrieves an encyclopedia entry by its title. If no such
     entry exists, the function returns None.
     """
-    try:
-        f = default_storage.open(f"entries/{title}.md")
-        return f.read().decode("utf-8")
-    except FileNotFoundError:
+    stored = get_stored_entry(title)
+    if stored is None:
         return None
+    return compression.decompress(*stored)
 
 
 def markdown_to_html(markdown_text: str):
-    """Converts markdown text to an HTML5 format string
+    """Converts markdown text to an HTML5 format string with the renderer
+    selected by the WIKI_MARKDOWN_RENDERER setting.
     """
-    return markdown2.markdown(markdown_text)
+    return get_renderer()(markdown_text)
 
 def exists_entry(title):
-    return title in list_entries()
\ No newline at end of file
+    return title in titles.titles()
\ No newline at end of file
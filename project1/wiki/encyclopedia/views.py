@@ -1,11 +1,16 @@
 import random
+import re
 
 from django import forms
 from django.http import HttpResponseRedirect, HttpResponseBadRequest, HttpRequest, HttpResponse
 from django.shortcuts import render
 from django.urls import reverse
+from django.utils.cache import patch_vary_headers
 
-from . import util
+from . import compression, util
+
+
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
 
 
 class NewEntryForm(forms.Form):
@@ -39,7 +44,10 @@ def entry_page(request: HttpRequest, title: str) -> HttpResponse:
     """
 
     # sanitized_title = re.sub('_', ' ', title)
-    entry_file = util.get_entry(title)
+    try:
+        entry_file = util.get_entry(title)
+    except compression.UnreadableEntry:
+        return render(request, 'encyclopedia/unreadable.html', status=503)
     
     if entry_file is None:
         return render(request, 'encyclopedia/not_found.html', status=404)
@@ -51,6 +59,29 @@ def entry_page(request: HttpRequest, title: str) -> HttpResponse:
     })
 
 
+def entry_source(request: HttpRequest, title: str) -> HttpResponse:
+    """Returns the Markdown source of 'title' entry. An entry stored
+    gzipped is sent as it is stored to clients accepting gzip.
+    """
+
+    stored = util.get_stored_entry(title)
+    if stored is None:
+        return render(request, 'encyclopedia/not_found.html', status=404)
+
+    data, codec = stored
+    if codec == 'gzip' and ACCEPTS_GZIP_RE.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        response = HttpResponse(data, content_type='text/markdown; charset=utf-8')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        try:
+            content = compression.decompress(data, codec)
+        except compression.UnreadableEntry:
+            return render(request, 'encyclopedia/unreadable.html', status=503)
+        response = HttpResponse(content, content_type='text/markdown; charset=utf-8')
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
 def search_entry(request: HttpRequest, query_str: str) -> HttpResponse:
     """Searches through entries. If exect match exists redirects to that page, else
     renders all entries that contain 'query_str' as substring in their title.
@@ -119,7 +150,10 @@ def edit_entry(request: HttpRequest, title: str) -> HttpResponse:
         return HttpResponseRedirect(reverse('wiki:entry_page', args=[title]))
 
     
-    content = util.get_entry(title)
+    try:
+        content = util.get_entry(title)
+    except compression.UnreadableEntry:
+        return render(request, 'encyclopedia/unreadable.html', status=503)
     return render(request, 'encyclopedia/edit.html', {
         "entry_title": title,
         "entry_content": content
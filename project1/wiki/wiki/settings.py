@@ -78,6 +78,7 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
     }
 }
 
@@ -119,3 +120,21 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Markdown renderer of the entries: 'markdown2', 'mistune' or 'cmark', see
+# encyclopedia/renderers.py. The tests compare their output on the entries,
+# `manage.py benchmark_markdown` checks it too, then measures their speed.
+WIKI_MARKDOWN_RENDERER = os.environ.get('WIKI_MARKDOWN_RENDERER', 'markdown2')
+
+
+# Compression of stored entries: None, 'gzip' or 'zstd', see
+# encyclopedia/compression.py. `manage.py compress_entries` converts the
+# existing entries from one to another.
+WIKI_ENTRY_COMPRESSION = os.environ.get('WIKI_ENTRY_COMPRESSION') or None
+# Dictionary of the zstd codec, used when the file exists.
+WIKI_ZSTD_DICTIONARY = os.path.join(BASE_DIR, 'entries.zstd-dict')
+
+# Sorted table of the entry titles mapped by every process, see
+# encyclopedia/titles.py.
+WIKI_TITLE_TABLE = os.path.join(BASE_DIR, 'entries.titles')
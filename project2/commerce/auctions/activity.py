@@ -0,0 +1,109 @@
+"""Queries behind the user activity page and maintenance of ActivitySummary.
+"""
+from collections import Counter
+from typing import Iterable, Optional
+
+from django.db import transaction
+from django.db.models import BooleanField, Count, Exists, ExpressionWrapper, F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import User, Listing, Bid, ActivitySummary, ArchivedListing, ArchivedBid
+
+
+def owned_listings(user: User):
+    return Listing.objects.filter(owner=user).select_related('image').order_by('-created', '-pk')
+
+
+def bidded_listings(user: User):
+    """Listings the user has bid on, each annotated with the user's highest bid
+    ('my_bid') and whether the user placed the top bid ('is_winning'), the one
+    the listing is won with when it closes.
+    """
+    my_bids = Bid.objects.filter(listing=OuterRef('pk'), bidder=user)
+    top_bidder = Bid.objects.filter(listing=OuterRef('pk')).order_by('-amount', 'created').values('bidder')[:1]
+    return (
+        Listing.objects.filter(Exists(my_bids))
+        .select_related('image')
+        .annotate(
+            my_bid=Subquery(my_bids.order_by().values('listing').annotate(top=Max('amount')).values('top')),
+            top_bidder=Subquery(top_bidder),
+        )
+        .annotate(is_winning=ExpressionWrapper(Q(top_bidder=user.pk), output_field=BooleanField()))
+        .order_by('-created', '-pk')
+    )
+
+
+def bump_summary(user_id: int, **deltas):
+    """Adds the given deltas to the counters of a user's ActivitySummary, creating
+    the summary from scratch if the user does not have one yet.
+    """
+    updated = ActivitySummary.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+    if not updated:
+        rebuild_summaries([user_id])
+
+
+def _count(queryset, key: str):
+    return Coalesce(Subquery(
+        queryset.order_by().values(key).annotate(n=Count('pk')).values('n')
+    ), 0)
+
+
+def _count_listings(bids):
+    return Coalesce(Subquery(
+        bids.order_by().values('bidder').annotate(n=Count('listing', distinct=True)).values('n')
+    ), 0)
+
+
+def rebuild_summaries(user_ids: Optional[Iterable[int]] = None) -> int:
+    """Recomputes ActivitySummary rows from scratch, for the given users or for
+    everybody. Returns the number of rebuilt summaries.
+    """
+    users = User.objects.all() if user_ids is None else User.objects.filter(pk__in=list(user_ids))
+    # Totals include the auctions moved to the archive (see auctions.archive).
+    users = users.annotate(
+        listings_count=_count(Listing.objects.filter(owner=OuterRef('pk')), 'owner')
+        + _count(ArchivedListing.objects.filter(owner=OuterRef('pk')), 'owner'),
+        active_listings_count=_count(Listing.objects.filter(owner=OuterRef('pk'), is_active=True), 'owner'),
+        bids_count=_count(Bid.objects.filter(bidder=OuterRef('pk')), 'bidder')
+        + _count(ArchivedBid.objects.filter(bidder=OuterRef('pk')), 'bidder'),
+        bidded_listings_count=_count_listings(Bid.objects.filter(bidder=OuterRef('pk')))
+        + _count_listings(ArchivedBid.objects.filter(bidder=OuterRef('pk'))),
+        won_count=_count(Listing.objects.filter(winner=OuterRef('pk')), 'winner')
+        + _count(ArchivedListing.objects.filter(winner=OuterRef('pk')), 'winner'),
+    ).values_list('pk', 'listings_count', 'active_listings_count', 'bids_count', 'bidded_listings_count', 'won_count')
+
+    summaries = [
+        ActivitySummary(user_id=pk, listings_count=listings, active_listings_count=active,
+                        bids_count=bids, bidded_listings_count=bidded, won_count=won)
+        for pk, listings, active, bids, bidded, won in users
+    ]
+    with transaction.atomic():
+        ActivitySummary.objects.filter(user_id__in=[s.user_id for s in summaries]).delete()
+        ActivitySummary.objects.bulk_create(summaries)
+    return len(summaries)
+
+
+def listing_created(listing: Listing):
+    bump_summary(listing.owner_id, listings_count=1, active_listings_count=int(listing.is_active))
+
+
+def listing_deleted(listing: Listing):
+    bump_summary(listing.owner_id, listings_count=-1, active_listings_count=-int(listing.is_active))
+    if listing.winner_id is not None:
+        bump_summary(listing.winner_id, won_count=-1)
+
+
+def listings_closed(owner_ids: Iterable[int], winner_ids: Iterable[int]):
+    """Called with the owner and winner of every listing closed in a batch.
+    """
+    for owner_id, closed in Counter(owner_ids).items():
+        bump_summary(owner_id, active_listings_count=-closed)
+    for winner_id, won in Counter(winner_ids).items():
+        bump_summary(winner_id, won_count=won)
+
+
+def bid_placed(bid: Bid):
+    first_on_listing = not Bid.objects.filter(listing_id=bid.listing_id, bidder_id=bid.bidder_id).exclude(pk=bid.pk).exists()
+    bump_summary(bid.bidder_id, bids_count=1, bidded_listings_count=int(first_on_listing))
@@ -1,7 +1,55 @@
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.utils.text import Truncator
 
-from .models import User, Listing, Bid
-# Register your models here.
-admin.site.register(User)
-admin.site.register(Listing)
-admin.site.register(Bid)
\ No newline at end of file
+from .models import User, Listing, Bid, Comment
+
+# Changelists of the large tables only show columns stored on the row or
+# select_related() to it, so every page takes the same number of queries. The
+# total count of rows is not shown, counting millions of rows takes longer than
+# rendering the page.
+
+
+@admin.register(User)
+class UserAdmin(BaseUserAdmin):
+    show_full_result_count = False
+
+
+@admin.register(Listing)
+class ListingAdmin(admin.ModelAdmin):
+    list_display = ('title', 'owner', 'category', 'current_price', 'bid_count', 'is_active', 'ends_at', 'created')
+    list_select_related = ('owner',)
+    # is_active leads the (is_active, ends_at) index, category the (category, id)
+    # one, which also lists closed listings in the changelist's order.
+    list_filter = ('is_active', 'category')
+    search_fields = ('title',)
+    autocomplete_fields = ('owner', 'winner')
+    raw_id_fields = ('image',)
+    readonly_fields = ('current_price', 'bid_count', 'closed_at')
+    ordering = ('-pk',)
+    show_full_result_count = False
+
+
+@admin.register(Bid)
+class BidAdmin(admin.ModelAdmin):
+    list_display = ('amount', 'bidder', 'listing', 'created')
+    list_select_related = ('bidder', 'listing')
+    # Covered by the index on created.
+    list_filter = (('created', admin.DateFieldListFilter),)
+    autocomplete_fields = ('bidder', 'listing')
+    # The model's ordering by amount has no index to back it.
+    ordering = ('-pk',)
+    show_full_result_count = False
+
+
+@admin.register(Comment)
+class CommentAdmin(admin.ModelAdmin):
+    list_display = ('owner', 'listing', 'excerpt', 'created', 'edited')
+    list_select_related = ('owner', 'listing')
+    autocomplete_fields = ('owner', 'listing')
+    ordering = ('-pk',)
+    show_full_result_count = False
+
+    @admin.display(description='Content')
+    def excerpt(self, comment: Comment) -> str:
+        return Truncator(comment.content).chars(80)
@@ -0,0 +1,224 @@
+"""Read-only JSON API of listings, bids, comments and categories.
+
+Rows are read with values_list() of only the requested fields (?fields=),
+related usernames joined in SQL, and serialized straight from the tuples with
+orjson when it is installed (the json module otherwise), no model instances are
+built. Lists are paginated by keyset (?after= the cursor of the previous page),
+several listings are fetched in one query with ?ids=. Responses about a listing
+carry an ETag derived from the listing's version, which moves forward on every
+change of the listing, its bids or its comments, so clients revalidate with
+If-None-Match and get a 304 after a query of only the ids and versions, without
+anything else being read or serialized.
+"""
+import json
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import HttpRequest, HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from .comments import decode_cursor, encode_cursor
+from .models import Listing, Bid, Comment, CategoryStats
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+MAX_PAGE_SIZE = 100
+DEFAULT_PAGE_SIZE = 20
+
+# Field name in the API -> lookup.
+LISTING_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'description': 'description',
+    'category': 'category',
+    'owner': 'owner__username',
+    'image_url': 'image_url',
+    'starting_price': 'starting_price',
+    'price': 'current_price',
+    'bid_count': 'bid_count',
+    'is_active': 'is_active',
+    'created': 'created',
+    'ends_at': 'ends_at',
+    'closed_at': 'closed_at',
+    'winner': 'winner__username',
+}
+DEFAULT_LISTING_FIELDS = ['id', 'title', 'category', 'price', 'bid_count', 'is_active', 'ends_at']
+
+BID_FIELDS = {
+    'id': 'id',
+    'bidder': 'bidder__username',
+    'amount': 'amount',
+    'created': 'created',
+}
+COMMENT_FIELDS = {
+    'id': 'id',
+    'owner': 'owner__username',
+    'content': 'content',
+    'created': 'created',
+    'edited': 'edited',
+}
+
+
+def dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+def json_response(data, status: int = 200, etag: Optional[str] = None) -> HttpResponse:
+    response = HttpResponse(dumps(data), content_type='application/json', status=status)
+    if etag is not None:
+        response['ETag'] = etag
+    return response
+
+
+def error(message: str, status: int = 400) -> HttpResponse:
+    return json_response({'error': message}, status=status)
+
+
+def parse_fields(request: HttpRequest, available: Dict[str, str], default: Optional[List[str]] = None) -> List[str]:
+    """Fields requested with ?fields=a,b,c. Raises ValueError for unknown ones.
+    """
+    param = request.GET.get('fields')
+    if not param:
+        return list(default or available)
+    fields = [f for f in param.split(',') if f]
+    unknown = [f for f in fields if f not in available]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown) or param}. Available: {', '.join(available)}.")
+    return list(dict.fromkeys(fields))
+
+
+def page_size(request: HttpRequest) -> int:
+    """Raises ValueError for an invalid ?limit=.
+    """
+    limit = int(request.GET.get('limit', DEFAULT_PAGE_SIZE))
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError
+    return limit
+
+
+def parse_ids(param: str) -> List[int]:
+    """Raises ValueError for malformed or too many ids.
+    """
+    ids = [int(pk) for pk in param.split(',') if pk]
+    if not ids or len(ids) > MAX_PAGE_SIZE:
+        raise ValueError
+    return list(dict.fromkeys(ids))
+
+
+def make_etag(versions: Iterable[Tuple[int, int]]) -> str:
+    """ETag of a response about the listings at the given (id, version). Query
+    parameters are part of the URL, so they need not be part of the ETag.
+    """
+    key = ';'.join(f'{pk}.{version}' for pk, version in versions)
+    return f'"{zlib.crc32(key.encode()):08x}"'
+
+
+def not_modified(request: HttpRequest, etag: str) -> Optional[HttpResponse]:
+    """Returns a 304 response if the client already has the representation.
+    """
+    known = parse_etags(request.headers.get('If-None-Match', ''))
+    if '*' in known or etag in known:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    return None
+
+
+def _rows(queryset, fields: List[str], lookups: Dict[str, str], extra: Tuple[str, ...] = ()):
+    """Yields (dict of the fields, values of the extra lookups) per row.
+    """
+    for row in queryset.values_list(*[lookups[f] for f in fields], *extra):
+        yield dict(zip(fields, row[:len(fields)])), row[len(fields):]
+
+
+def listing_versions(ids: Optional[List[int]] = None, after: Optional[int] = None,
+                     limit: int = DEFAULT_PAGE_SIZE, category: Optional[str] = None,
+                     active: Optional[bool] = None) -> Tuple[List[Tuple[int, int]], Optional[int]]:
+    """Returns the (id, version) of the listings and the cursor of the next
+    page, all the ETag needs. With 'ids' the listings are returned in the
+    requested order and pagination does not apply.
+    """
+    queryset = Listing.objects.all()
+    if ids is not None:
+        queryset = queryset.filter(pk__in=ids)
+    else:
+        if category is not None:
+            queryset = queryset.filter(category=category)
+        if active is not None:
+            queryset = queryset.filter(is_active=active)
+        if after is not None:
+            queryset = queryset.filter(pk__gt=after)
+        queryset = queryset.order_by('pk')[:limit + 1]
+
+    versions = list(queryset.values_list('id', 'version'))
+    next_cursor = None
+    if ids is not None:
+        position = {pk: i for i, pk in enumerate(ids)}
+        versions.sort(key=lambda version: position[version[0]])
+    elif len(versions) > limit:
+        versions = versions[:limit]
+        next_cursor = versions[-1][0]
+    return versions, next_cursor
+
+
+def listings(fields: List[str], ids: List[int]) -> List[dict]:
+    """Returns the fields of the listings, in the order of 'ids'.
+    """
+    rows = {
+        extra[0]: data for data, extra in _rows(Listing.objects.filter(pk__in=ids), fields, LISTING_FIELDS, ('id',))
+    }
+    return [rows[pk] for pk in ids if pk in rows]
+
+
+def bids(listing_id: int, fields: List[str], after: Optional[int] = None,
+         limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[dict], Optional[int]]:
+    """Bids of a listing, oldest first, from the (listing, id) range of the
+    listing index.
+    """
+    queryset = Bid.objects.filter(listing_id=listing_id)
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    rows = list(_rows(queryset.order_by('pk')[:limit + 1], fields, BID_FIELDS, ('id',)))
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return [data for data, _ in rows], rows[-1][1][0]
+    return [data for data, _ in rows], None
+
+
+def comments(listing_id: int, fields: List[str], after: Optional[str] = None,
+             limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[dict], Optional[str]]:
+    """Comments of a listing, oldest first, paginated like the comment thread of
+    the listing page (see auctions.comments). Raises ValueError for a malformed
+    cursor.
+    """
+    queryset = Comment.objects.filter(listing_id=listing_id)
+    if after:
+        created, pk = decode_cursor(after)
+        queryset = queryset.filter(Q(created__gt=created) | Q(created=created, id__gt=pk))
+    rows = list(_rows(queryset.order_by('created', 'id')[:limit + 1], fields, COMMENT_FIELDS, ('created', 'id')))
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return [data for data, _ in rows], encode_cursor(*rows[-1][1])
+    return [data for data, _ in rows], None
+
+
+def categories() -> List[dict]:
+    stats = CategoryStats.objects.in_bulk()
+    return [
+        {
+            'id': code.lower(),
+            'name': name,
+            'active_listings': stats[code].active_listings if code in stats else 0,
+            'min_price': stats[code].min_price if code in stats else None,
+            'max_price': stats[code].max_price if code in stats else None,
+        }
+        for code, name in Listing.LISTING_CATEGORIES
+    ]
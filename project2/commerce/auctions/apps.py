@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class AuctionsConfig(AppConfig):
     name = 'auctions'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,92 @@
+"""Archival of auctions closed long ago.
+
+Closed listings only stay in the live tables for AUCTIONS_ARCHIVE_AFTER_DAYS
+days. archive_listings() then moves them in batches to ArchivedListing, with the
+final price and winner inline and the comments as a list, and their bids to
+ArchivedBid, and deletes the live rows. The live tables and their indexes stay
+bounded by the number of open and recently closed auctions, and the listing view
+falls back to the archive for ids it does not find among them.
+
+Live rows are deleted without sending signals. The denormalized counters
+(activity summaries, category stats, bid statistics) describe the history of
+the auctions, which is kept in the archive, so nothing must be taken back from
+them.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import coalescing
+from .models import Listing, Bid, Comment, ArchivedListing, ArchivedBid
+
+
+def _delete_live(listing_ids: List[int]):
+    """Deletes the listings and every row referencing them, with one DELETE per
+    table.
+    """
+    relations = [f for f in Listing._meta.get_fields(include_hidden=True) if f.auto_created and not f.concrete]
+    for relation in relations:
+        if relation.many_to_many:
+            model = relation.through
+            field = next(f.name for f in model._meta.fields if f.related_model is Listing)
+        else:
+            model, field = relation.related_model, relation.field.name
+        rows = model._base_manager.filter(**{f'{field}__in': listing_ids})
+        rows._raw_delete(rows.db)
+    rows = Listing.objects.filter(pk__in=listing_ids)
+    rows._raw_delete(rows.db)
+
+
+def _archive_batch(listings: List[Listing], chunk_size: int):
+    ids = [listing.pk for listing in listings]
+    comments = defaultdict(list)
+    for listing_id, owner, content, created, edited in (
+        Comment.objects.filter(listing_id__in=ids).order_by('created', 'pk')
+        .values_list('listing_id', 'owner__username', 'content', 'created', 'edited').iterator(chunk_size=chunk_size)
+    ):
+        comments[listing_id].append({'owner': owner, 'content': content, 'created': created.isoformat(), 'edited': edited})
+
+    ArchivedListing.objects.bulk_create([
+        ArchivedListing(
+            id=l.pk, title=l.title, description=l.description, image_url=l.image_url, image_id=l.image_id,
+            category=l.category, owner_id=l.owner_id, starting_price=l.starting_price, final_price=l.current_price,
+            bid_count=l.bid_count, created=l.created, ends_at=l.ends_at, closed_at=l.closed_at, winner_id=l.winner_id,
+            comments=comments[l.pk]
+        )
+        for l in listings
+    ])
+    ArchivedBid.objects.bulk_create((
+        ArchivedBid(listing_id=listing_id, bidder_id=bidder_id, amount=amount, created=created)
+        for listing_id, bidder_id, amount, created in
+        Bid.objects.filter(listing_id__in=ids).order_by('pk')
+        .values_list('listing_id', 'bidder_id', 'amount', 'created').iterator(chunk_size=chunk_size)
+    ), batch_size=chunk_size)
+    _delete_live(ids)
+
+
+def archive_listings(older_than: Optional[timedelta] = None, batch_size: int = 500,
+                     now: Optional[datetime] = None) -> int:
+    """Archives the listings closed more than 'older_than' ago (by default
+    AUCTIONS_ARCHIVE_AFTER_DAYS days), one transaction per batch of 'batch_size'
+    listings. Returns the number of archived listings.
+    """
+    if older_than is None:
+        older_than = timedelta(days=getattr(settings, 'AUCTIONS_ARCHIVE_AFTER_DAYS', 30))
+    cutoff = (now or timezone.now()) - older_than
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            listings = list(
+                Listing.objects.filter(is_active=False, closed_at__lte=cutoff).order_by('closed_at', 'pk')[:batch_size]
+            )
+            if not listings:
+                return archived
+            _archive_batch(listings, batch_size)
+            for listing in listings:
+                coalescing.listing_pages.invalidate_on_commit(listing.pk)
+        archived += len(listings)
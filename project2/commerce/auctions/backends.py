@@ -0,0 +1,60 @@
+"""Authentication backend serving signed in users from an in-process LRU.
+
+AuthenticationMiddleware loads the user of the session on every request. With
+CachedUserBackend the row is only read from the database when it is not among
+the AUCTIONS_USER_CACHE_SIZE most recently used ones. Entries hold field values
+rather than instances, every request gets a fresh User built from them, so no
+state is shared between requests. They are dropped when the user is saved or
+deleted (see signals.py) or the watchlist changes, and expire after
+AUCTIONS_USER_CACHE_TTL seconds so changes made by other processes, such as a
+password change logging other sessions out, are picked up as well.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+
+from .models import User
+
+
+_users = OrderedDict()
+_lock = threading.Lock()
+
+
+def _field_names():
+    return [f.attname for f in User._meta.concrete_fields]
+
+
+def forget_user(user_id: int):
+    with _lock:
+        _users.pop(user_id, None)
+
+
+def clear():
+    with _lock:
+        _users.clear()
+
+
+class CachedUserBackend(ModelBackend):
+
+    def get_user(self, user_id):
+        user_id = User._meta.pk.to_python(user_id)
+        now = time.monotonic()
+        with _lock:
+            cached = _users.get(user_id)
+            if cached is not None and cached[0] > now:
+                _users.move_to_end(user_id)
+                return User.from_db('default', _field_names(), cached[1])
+
+        user = super().get_user(user_id)
+        if user is not None:
+            entry = (now + getattr(settings, 'AUCTIONS_USER_CACHE_TTL', 30),
+                     [getattr(user, name) for name in _field_names()])
+            with _lock:
+                _users[user.pk] = entry
+                _users.move_to_end(user.pk)
+                while len(_users) > getattr(settings, 'AUCTIONS_USER_CACHE_SIZE', 1000):
+                    _users.popitem(last=False)
+        return user
@@ -0,0 +1,336 @@
+"""Reproducible load benchmark of the auctions site.
+
+seed() fills an empty database with synthetic users, listings, bids, comments
+and watchlist entries, split from a total number of rows by fixed ratios and
+generated from a seeded random number generator, so the same scale always
+produces the same data. run() then lets a number of virtual users walk scripted
+journeys through the site with the Django test client, each in its own thread
+with its own database connection, and records the latency, status code and
+number of queries of every request. Reports are plain dicts meant to be dumped
+as JSON and compared across commits (see compare()).
+"""
+import random
+import subprocess
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections
+from django.test import Client
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+
+from .activity import rebuild_summaries
+from . import categories
+from .bidstats import rebuild_stats
+from .models import User, Listing, Bid, Comment
+from .watchlist import Watch
+
+
+USERNAME_PREFIX = 'bench'
+PASSWORD = 'benchmark'
+
+# Share of the seeded rows going to each table, bids take the rest.
+RATIOS = {
+    'users': 0.01,
+    'listings': 0.1,
+    'comments': 0.2,
+    'watches': 0.1,
+}
+
+
+def _insert(model, objects: Iterable, chunk_size: int, **kwargs) -> List[int]:
+    """Inserts objects in chunks and returns the primary keys of the new rows,
+    which bulk_create() does not set on SQLite.
+    """
+    last = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    chunk = []
+    for obj in objects:
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            model.objects.bulk_create(chunk, **kwargs)
+            chunk = []
+    if chunk:
+        model.objects.bulk_create(chunk, **kwargs)
+    return list(model.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True))
+
+
+def seed(rows: int, rng_seed: int = 0, chunk_size: int = 5000) -> Dict[str, int]:
+    """Inserts about 'rows' rows of synthetic data and returns the number of rows
+    per table. Denormalized prices, activity summaries and bid statistics are
+    recomputed once at the end, as bulk inserts send no signals.
+    """
+    rng = random.Random(rng_seed)
+    counts = {table: max(int(rows * ratio), 10) for table, ratio in RATIOS.items()}
+    counts['bids'] = max(rows - sum(counts.values()), 10)
+
+    password = make_password(PASSWORD)
+    user_ids = _insert(User, (
+        User(username=f'{USERNAME_PREFIX}{i}', email=f'{USERNAME_PREFIX}{i}@example.com', password=password,
+             is_staff=i == 0)
+        for i in range(counts['users'])
+    ), chunk_size)
+
+    category_codes = [code for code, _ in Listing.LISTING_CATEGORIES]
+    owners = [rng.choice(user_ids) for _ in range(counts['listings'])]
+    prices = [rng.randint(1, 500) for _ in range(counts['listings'])]
+    listing_ids = _insert(Listing, (
+        Listing(title=f'Benchmark listing {i}', description='Generated by benchmark_auctions.',
+                category=rng.choice(category_codes), owner_id=owners[i], starting_price=prices[i],
+                current_price=prices[i])
+        for i in range(counts['listings'])
+    ), chunk_size)
+
+    def bids() -> Iterator[Bid]:
+        for _ in range(counts['bids']):
+            i = rng.randrange(len(listing_ids))
+            j = rng.randrange(len(user_ids))
+            if user_ids[j] == owners[i]:
+                j = (j + 1) % len(user_ids)
+            yield Bid(listing_id=listing_ids[i], bidder_id=user_ids[j], amount=prices[i] + rng.randint(1, 1000))
+
+    _insert(Bid, bids(), chunk_size)
+    _insert(Comment, (
+        Comment(listing_id=rng.choice(listing_ids), owner_id=rng.choice(user_ids), content='Benchmark comment.')
+        for _ in range(counts['comments'])
+    ), chunk_size)
+    _insert(Watch, (
+        Watch(user_id=rng.choice(user_ids), listing_id=rng.choice(listing_ids))
+        for _ in range(counts['watches'])
+    ), chunk_size, ignore_conflicts=True)
+
+    Listing.objects.all().refresh_prices()
+    rebuild_summaries()
+    rebuild_stats()
+    categories.rebuild_stats()
+    return counts
+
+
+class Recorder:
+    """Collects the measurements of all virtual users.
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def add(self, route: str, seconds: float, status: int, queries: int):
+        with self.lock:
+            self.samples[route].append((seconds, status, queries))
+
+
+class QueryCounter:
+    """Execute wrapper counting the queries of the current thread's connections.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Journey:
+    """Scripted visit of one virtual user. Every step requests one route and
+    records it under the route's URL name.
+    """
+
+    def __init__(self, number: int, recorder: Recorder, listing_ids: List[int], rng: random.Random):
+        self.number = number
+        self.recorder = recorder
+        self.listing_ids = listing_ids
+        self.rng = rng
+        self.client = Client(raise_request_exception=False)
+        self.queries = QueryCounter()
+
+    def request(self, route: str, method: str = 'get', args=(), query: str = '', **kwargs):
+        url = reverse(route, args=args) + (f'?{query}' if query else '')
+        self.queries.count = 0
+        start = time.perf_counter()
+        response = getattr(self.client, method)(url, **kwargs)
+        self.recorder.add(route, time.perf_counter() - start, response.status_code, self.queries.count)
+        return response
+
+    def run(self, iterations: int):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.queries))
+            self.browse()
+            self.sign_in()
+            for _ in range(iterations):
+                self.shop()
+            self.sell()
+            if self.number == 0:
+                self.administer()
+            self.request('logout')
+
+    def browse(self):
+        listing_id = self.rng.choice(self.listing_ids)
+        category = self.rng.choice(Listing.LISTING_CATEGORIES)[0].lower()
+        self.request('index')
+        self.request('categories')
+        self.request('category', args=[category])
+        self.request('listing', args=[listing_id])
+        self.request('listing_comments', args=[listing_id])
+        self.request('listing_events', args=[listing_id])
+        self.request('listing_price_history', args=[listing_id])
+        self.request('category_bid_stats', args=[category])
+        self.request('api_listings', query=f'category={category}')
+        self.request('api_listing', args=[listing_id])
+        self.request('api_listing_bids', args=[listing_id])
+        self.request('api_listing_comments', args=[listing_id])
+        self.request('api_categories')
+        self.request('register')
+        self.request('login')
+
+    def sign_in(self):
+        username = f'{USERNAME_PREFIX}{self.number}'
+        if not User.objects.filter(username=username).exists():
+            self.request('register', 'post', data={
+                'username': username, 'email': f'{username}@example.com',
+                'password': PASSWORD, 'confirmation': PASSWORD
+            })
+        else:
+            self.request('login', 'post', data={'username': username, 'password': PASSWORD})
+
+    def shop(self):
+        # Owners cannot bid on or watch their own listings.
+        username = f'{USERNAME_PREFIX}{self.number}'
+        while True:
+            listing_id = self.rng.choice(self.listing_ids)
+            price, owner = Listing.objects.filter(pk=listing_id).values_list('current_price', 'owner__username').get()
+            if owner != username:
+                break
+        self.request('index')
+        self.request('listing', args=[listing_id])
+        self.request('new_bid', 'post', args=[listing_id], data={'amount': price + self.rng.randint(1, 10)})
+        self.request('post_comment', 'post', args=[listing_id], data={'content': 'Benchmark comment.'})
+        self.request('add_to_watchlist', args=[listing_id])
+        self.request('watchlist')
+        self.request('remove_from_watchlist', args=[listing_id])
+        self.request('update_watchlist', 'post', data={'add': [listing_id]})
+        self.request('activity')
+        self.request('inbox')
+
+    def sell(self):
+        self.request('new_listing')
+        response = self.request('new_listing', 'post', data={
+            'title': f'Journey listing {self.number}', 'description': 'Listed by the benchmark.',
+            'starting_price': 10, 'category': 'OTHR'
+        })
+        if response.status_code != 302:
+            return
+        listing_id = int(response.url.rstrip('/').rsplit('/', 1)[-1])
+        self.request('edit_listing', args=[listing_id])
+        self.request('edit_listing', 'post', args=[listing_id], data={'title': 'Edited journey listing', 'category': 'OTHR'})
+        self.request('close_auction', args=[listing_id])
+        self.request('export', args=['bids'], query='gzip=1')
+
+    def administer(self):
+        self.request('fragment_cache_stats')
+        listing_id = self.rng.choice(self.listing_ids)
+        self.request('bulk_load', 'post', query='type=comment', content_type='application/x-ndjson',
+                     data=f'{{"owner": "{USERNAME_PREFIX}0", "listing": {listing_id}, "content": "Bulk comment."}}\n')
+
+
+def _run_in_thread(journey: Journey, iterations: int):
+    try:
+        journey.run(iterations)
+    finally:
+        # Every thread opened its own connections.
+        connections.close_all()
+
+
+def _percentile(ordered: List[float], p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def _route_names() -> List[str]:
+    return sorted({
+        name for name, value in get_resolver('auctions.urls').reverse_dict.items() if isinstance(name, str)
+    })
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(virtual_users: int, iterations: int, rng_seed: int = 0) -> dict:
+    """Runs one journey per virtual user, all of them concurrently, and returns
+    the report. With a single virtual user the journey runs in the calling thread.
+    """
+    recorder = Recorder()
+    listing_ids = list(Listing.objects.filter(is_active=True).values_list('pk', flat=True))
+    journeys = [
+        Journey(i, recorder, listing_ids, random.Random(rng_seed + i)) for i in range(virtual_users)
+    ]
+
+    start = time.perf_counter()
+    if virtual_users == 1:
+        journeys[0].run(iterations)
+    else:
+        threads = [threading.Thread(target=_run_in_thread, args=(j, iterations)) for j in journeys]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    routes = {}
+    for route, samples in sorted(recorder.samples.items()):
+        latencies = sorted(seconds for seconds, _, _ in samples)
+        queries = [q for _, _, q in samples]
+        statuses = Counter(status for _, status, _ in samples)
+        routes[route] = {
+            'requests': len(samples),
+            'errors': sum(n for status, n in statuses.items() if status >= 500),
+            'statuses': {str(status): n for status, n in sorted(statuses.items())},
+            'p50_ms': round(_percentile(latencies, 50) * 1000, 2),
+            'p99_ms': round(_percentile(latencies, 99) * 1000, 2),
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+            'queries_mean': round(sum(queries) / len(queries), 2),
+            'queries_max': max(queries),
+        }
+
+    requests = sum(r['requests'] for r in routes.values())
+    return {
+        'commit': git_commit(),
+        'finished': timezone.now().isoformat(),
+        'virtual_users': virtual_users,
+        'iterations': iterations,
+        'seed': rng_seed,
+        'duration_seconds': round(elapsed, 3),
+        'requests': requests,
+        'errors': sum(r['errors'] for r in routes.values()),
+        'throughput_rps': round(requests / elapsed, 2) if elapsed else None,
+        # Bids are the writes contending for the database.
+        'bids_per_second': round(routes['new_bid']['requests'] / elapsed, 2) if elapsed and 'new_bid' in routes else None,
+        'routes': routes,
+        'not_covered': [name for name in _route_names() if name not in routes],
+    }
+
+
+def compare(report: dict, baseline: dict) -> List[str]:
+    """Returns one line per route comparing p50, p99 and queries with a baseline
+    report.
+    """
+    lines = [f"{'route':<24} {'p50 ms':>17} {'p99 ms':>17} {'queries':>13}"]
+    for route, now in report['routes'].items():
+        before = baseline.get('routes', {}).get(route)
+        if before is None:
+            lines.append(f"{route:<24} {now['p50_ms']:>17} {now['p99_ms']:>17} {now['queries_mean']:>13}")
+            continue
+        lines.append(
+            f"{route:<24} {before['p50_ms']:>7} -> {now['p50_ms']:<7} {before['p99_ms']:>7} -> {now['p99_ms']:<7}"
+            f" {before['queries_mean']:>5} -> {now['queries_mean']:<5}"
+        )
+    return lines
@@ -0,0 +1,204 @@
+"""Hourly bid statistics per listing and per category.
+
+Every inserted bid is merged into the bucket of its hour (count, sum, min and
+max), so price history and bid velocity charts read a bounded number of bucket
+rows instead of every bid. Deleted bids recompute the two buckets they were
+counted in. rebuild_stats() recomputes everything from the bids, e.g. after
+listings changed category.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import chain
+from typing import Dict, Iterable, Optional, Sequence
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import Greatest, Least, TruncHour
+from django.utils import timezone
+
+from .models import Listing, Bid, ListingBidStats, CategoryBidStats, CategoryPricePercentiles, ArchivedBid
+
+
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90, 99)
+
+
+def truncate_hour(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+class _Totals:
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min_amount = None
+        self.max_amount = None
+
+    def add(self, amount: int):
+        self.count += 1
+        self.total += amount
+        self.min_amount = amount if self.min_amount is None else min(self.min_amount, amount)
+        self.max_amount = amount if self.max_amount is None else max(self.max_amount, amount)
+
+
+def _merge(model, key: dict, totals: _Totals):
+    """Adds the totals to a bucket, creating it if it does not exist yet.
+    """
+    def update():
+        return model.objects.filter(**key).update(
+            count=F('count') + totals.count,
+            total=F('total') + totals.total,
+            min_amount=Least('min_amount', totals.min_amount),
+            max_amount=Greatest('max_amount', totals.max_amount),
+        )
+
+    if update():
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(
+                **key, count=totals.count, total=totals.total,
+                min_amount=totals.min_amount, max_amount=totals.max_amount
+            )
+    except IntegrityError:
+        # Another bid created the bucket in the meantime.
+        update()
+
+
+def record_bids(bids: Iterable[Bid]):
+    """Merges newly inserted bids into their buckets, one UPDATE per touched
+    bucket however many bids fall into it.
+    """
+    bids = list(bids)
+    if not bids:
+        return
+    categories = dict(
+        Listing.objects.filter(pk__in={b.listing_id for b in bids}).values_list('pk', 'category')
+    )
+
+    by_listing = defaultdict(_Totals)
+    by_category = defaultdict(_Totals)
+    for bid in bids:
+        hour = truncate_hour(bid.created)
+        by_listing[(bid.listing_id, hour)].add(bid.amount)
+        by_category[(categories[bid.listing_id], hour)].add(bid.amount)
+
+    for (listing_id, hour), totals in by_listing.items():
+        _merge(ListingBidStats, {'listing_id': listing_id, 'hour': hour}, totals)
+    for (category, hour), totals in by_category.items():
+        _merge(CategoryBidStats, {'category': category, 'hour': hour}, totals)
+
+
+def _recompute(model, key: dict, *bid_sets):
+    """Replaces the bucket with the totals of the bids of all the given sets.
+    """
+    rows = [
+        row for row in (
+            bids.aggregate(count=Count('pk'), total=Sum('amount'), min_amount=Min('amount'), max_amount=Max('amount'))
+            for bids in bid_sets
+        ) if row['count']
+    ]
+    if not rows:
+        model.objects.filter(**key).delete()
+        return
+    model.objects.update_or_create(**key, defaults={
+        'count': sum(row['count'] for row in rows),
+        'total': sum(row['total'] for row in rows),
+        'min_amount': min(row['min_amount'] for row in rows),
+        'max_amount': max(row['max_amount'] for row in rows),
+    })
+
+
+def bid_removed(bid: Bid):
+    """Recomputes the buckets a deleted bid was counted in, min and max cannot be
+    taken back incrementally.
+    """
+    category = Listing.objects.filter(pk=bid.listing_id).values_list('category', flat=True).first()
+    if category is None:
+        # The listing is being deleted, its buckets go with it.
+        return
+
+    hour = truncate_hour(bid.created)
+    in_hour = {'created__gte': hour, 'created__lt': hour + timedelta(hours=1)}
+    _recompute(ListingBidStats, {'listing_id': bid.listing_id, 'hour': hour},
+               Bid.objects.filter(**in_hour, listing_id=bid.listing_id))
+    # Categories keep the history of archived listings as well.
+    _recompute(CategoryBidStats, {'category': category, 'hour': hour},
+               Bid.objects.filter(**in_hour, listing__category=category),
+               ArchivedBid.objects.filter(**in_hour, listing__category=category))
+
+
+def _aggregate_hours(bids, key: str):
+    return (
+        bids.annotate(hour=TruncHour('created'))
+        .order_by()
+        .values(key, 'hour')
+        .annotate(count=Count('pk'), total=Sum('amount'), min_amount=Min('amount'), max_amount=Max('amount'))
+        .iterator()
+    )
+
+
+def rebuild_stats(batch_size: int = 1000) -> int:
+    """Recomputes all buckets from the bids, returns the number of buckets.
+    """
+    listing_stats = [ListingBidStats(**row) for row in _aggregate_hours(Bid.objects.all(), 'listing_id')]
+    # Categories keep the history of archived listings as well.
+    by_category = {}
+    for bids in (Bid.objects.all(), ArchivedBid.objects.all()):
+        for row in _aggregate_hours(bids, 'listing__category'):
+            key = (row.pop('listing__category'), row['hour'])
+            if key in by_category:
+                bucket = by_category[key]
+                bucket.count += row['count']
+                bucket.total += row['total']
+                bucket.min_amount = min(bucket.min_amount, row['min_amount'])
+                bucket.max_amount = max(bucket.max_amount, row['max_amount'])
+            else:
+                by_category[key] = CategoryBidStats(category=key[0], **row)
+    category_stats = list(by_category.values())
+    with transaction.atomic():
+        ListingBidStats.objects.all().delete()
+        CategoryBidStats.objects.all().delete()
+        ListingBidStats.objects.bulk_create(listing_stats, batch_size=batch_size)
+        CategoryBidStats.objects.bulk_create(category_stats, batch_size=batch_size)
+    return len(listing_stats) + len(category_stats)
+
+
+def history(buckets, hours: int, now: Optional[datetime] = None) -> list:
+    """Returns the buckets of the last 'hours' hours, oldest first. The window
+    bounds the number of rows read, whatever the number of bids.
+    """
+    now = now or timezone.now()
+    since = truncate_hour(now) - timedelta(hours=hours - 1)
+    return [b.as_dict() for b in buckets.filter(hour__gte=since).order_by('hour')]
+
+
+def compute_percentiles(percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+                        chunk_size: int = 10000) -> Dict[str, int]:
+    """Computes bid amount percentiles of every category with NumPy, streaming the
+    amounts of one category at a time, archived bids included, into an array.
+    Returns the number of bids per category. Raises ImportError if NumPy is not
+    installed.
+    """
+    import numpy as np
+
+    counted = {}
+    now = timezone.now()
+    for category, _ in Listing.LISTING_CATEGORIES:
+        amounts = np.fromiter(chain.from_iterable(
+            bids.filter(listing__category=category).order_by()
+            .values_list('amount', flat=True).iterator(chunk_size=chunk_size)
+            for bids in (Bid.objects.all(), ArchivedBid.objects.all())
+        ), dtype=np.uint32)
+        if not len(amounts):
+            CategoryPricePercentiles.objects.filter(category=category).delete()
+            continue
+
+        values = np.percentile(amounts, percentiles)
+        CategoryPricePercentiles.objects.update_or_create(category=category, defaults={
+            'bids_count': len(amounts),
+            'percentiles': {f'{p:g}': round(float(v), 2) for p, v in zip(percentiles, values)},
+            'computed': now,
+        })
+        counted[category] = len(amounts)
+    return counted
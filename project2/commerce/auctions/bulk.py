@@ -0,0 +1,270 @@
+"""Bulk loading of listings, bids and comments, used to onboard sellers whose
+catalogues would otherwise have to be submitted one listing at a time.
+
+Records are read from CSV or JSON-lines input. Every record has a 'type' of
+'listing', 'bid' or 'comment' (either as a column/key or given for the whole
+input) and references users by username:
+
+    listing: owner, title, description, starting_price[, image_url, category, ends_at]
+    bid:     bidder, listing, amount
+    comment: owner, listing, content
+
+Bids and comments refer to already existing listings by id. Records are
+validated with the same forms and rules as the views (bids must beat the
+current price, including the bids before them in the input, and listings must
+be open), inserted with bulk_create() one chunk per transaction, and prices of
+the listings touched by a chunk are recomputed once for the whole chunk.
+Malformed rows, including JSON values of the wrong type, are reported as errors
+without stopping the load.
+"""
+import csv
+import json
+import time
+from collections import defaultdict
+from typing import Iterable, Iterator, Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import similar
+from .activity import rebuild_summaries
+from .bidstats import record_bids
+from .categories import listings_created, prices_changed
+from .forms import BiddingForm, CommentForm, ListingForm
+from .models import User, Listing, Bid, Comment
+
+
+RECORD_TYPES = ('listing', 'bid', 'comment')
+
+# Types of the values JSON records may hold, CSV ones are all strings.
+_TEXT = ((str,), 'a string')
+_NUMBER = ((int, float), 'a number')
+JSON_FIELD_TYPES = {
+    'type': _TEXT, 'owner': _TEXT, 'bidder': _TEXT, 'title': _TEXT, 'description': _TEXT,
+    'content': _TEXT, 'image_url': _TEXT, 'category': _TEXT, 'ends_at': _TEXT,
+    'listing': ((int,), 'a listing id'), 'amount': _NUMBER, 'starting_price': _NUMBER,
+}
+
+
+class BulkLoadReport:
+
+    def __init__(self):
+        self.loaded = defaultdict(int)
+        self.errors = []
+        self.started = time.monotonic()
+        self.finished = None
+
+    @property
+    def total(self) -> int:
+        return sum(self.loaded.values())
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.total / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self, max_errors: int = 100) -> dict:
+        return {
+            'loaded': dict(self.loaded),
+            'rejected': len(self.errors),
+            'errors': [{'row': row, 'error': error} for row, error in self.errors[:max_errors]],
+            'seconds': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+class InvalidRecord(dict):
+    """Stands for a row which could not be parsed, it is reported with the error
+    when its turn comes.
+    """
+
+    def __init__(self, error: str):
+        super().__init__()
+        self.error = error
+
+
+def _json_records(stream: Iterable) -> Iterator[dict]:
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield InvalidRecord(f"Invalid JSON: {e}.")
+            continue
+        if not isinstance(record, dict):
+            yield InvalidRecord('Expected a JSON object.')
+            continue
+        yield _typed(record)
+
+
+def _typed(record: dict) -> dict:
+    """Returns the record, or an InvalidRecord if one of its values is not of the
+    type of its field.
+    """
+    for field, value in record.items():
+        types, expected = JSON_FIELD_TYPES.get(field, ((), None))
+        # bool is an int, but no field is a boolean.
+        if expected and value is not None and (not isinstance(value, types) or isinstance(value, bool)):
+            return InvalidRecord(f"{field}: expected {expected}, not {json.dumps(value)}.")
+    return record
+
+
+def read_records(stream: Iterable, fmt: str, record_type: Optional[str] = None) -> Iterator[dict]:
+    """Yields records from a text stream of CSV rows or JSON lines. Blank
+    lines in JSON-lines input are skipped, malformed ones are yielded as
+    InvalidRecord.
+    """
+    if fmt == 'csv':
+        rows = csv.DictReader(stream)
+    elif fmt == 'jsonl':
+        rows = _json_records(stream)
+    else:
+        raise ValueError(f"Unknown input format '{fmt}', expected 'csv' or 'jsonl'.")
+
+    for row in rows:
+        if record_type is not None and not isinstance(row, InvalidRecord):
+            row.setdefault('type', record_type)
+        yield row
+
+
+class _ListingState:
+    """What bids of a chunk are checked against, updated as they are accepted.
+    """
+
+    def __init__(self, owner_id: int, starting_price: int, current_price: int, bid_count: int,
+                 is_active: bool, ends_at):
+        self.owner_id = owner_id
+        self.min_bid = current_price + 1 if bid_count else starting_price
+        self.is_open = is_active and (ends_at is None or ends_at > timezone.now())
+
+
+class BulkLoader:
+
+    def __init__(self, chunk_size: int = 1000, report: Optional[BulkLoadReport] = None):
+        self.chunk_size = chunk_size
+        self.report = report or BulkLoadReport()
+
+    def load(self, records: Iterable[dict]) -> BulkLoadReport:
+        chunk = []
+        for row_number, record in enumerate(records, start=1):
+            chunk.append((row_number, record))
+            if len(chunk) >= self.chunk_size:
+                self._load_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._load_chunk(chunk)
+        self.report.finished = time.monotonic()
+        return self.report
+
+    def _load_chunk(self, chunk: list):
+        usernames = {r.get('owner') or r.get('bidder') for _, r in chunk}
+        users = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        listing_refs = {r['listing'] for _, r in chunk if r.get('listing')}
+        listings = {
+            str(row[0]): _ListingState(*row[1:]) for row in
+            Listing.objects.filter(pk__in=[ref for ref in listing_refs if str(ref).isdigit()])
+            .values_list('pk', 'owner_id', 'starting_price', 'current_price', 'bid_count', 'is_active', 'ends_at')
+        }
+
+        objects = defaultdict(list)
+        for row_number, record in chunk:
+            try:
+                obj = self._build(record, users, listings)
+            except ValueError as e:
+                self.report.errors.append((row_number, str(e)))
+            else:
+                objects[type(obj)].append(obj)
+
+        with transaction.atomic():
+            # bulk_create() does not return the ids of new rows on SQLite.
+            last_listing = Listing.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+            for model, objs in objects.items():
+                model.objects.bulk_create(objs, batch_size=self.chunk_size)
+                self.report.loaded[model._meta.model_name] += len(objs)
+
+            touched = {obj.listing_id for obj in objects[Bid]} | {obj.listing_id for obj in objects[Comment]}
+            if touched:
+                Listing.objects.filter(pk__in=touched).refresh_prices()
+            # bulk_create() sends no signals, summaries are rebuilt once per chunk instead.
+            listings_created(objects[Listing])
+            prices_changed({obj.listing_id for obj in objects[Bid]})
+            record_bids(objects[Bid])
+            rebuild_summaries({obj.owner_id for obj in objects[Listing]} | {obj.bidder_id for obj in objects[Bid]})
+            if objects[Listing]:
+                similar.listings_changed(list(Listing.objects.filter(pk__gt=last_listing).values_list('pk', flat=True)))
+
+    def _build(self, record: dict, users: dict, listings: dict):
+        if isinstance(record, InvalidRecord):
+            raise ValueError(record.error)
+        kind = record.get('type')
+        if kind not in RECORD_TYPES:
+            raise ValueError(f"Unknown record type '{kind}'.")
+
+        user_field = 'bidder' if kind == 'bid' else 'owner'
+        user_id = users.get(record.get(user_field))
+        if user_id is None:
+            raise ValueError(f"{user_field}: no user named '{record.get(user_field)}'.")
+
+        if kind == 'listing':
+            form = ListingForm({'category': Listing._meta.get_field('category').default, **record})
+            obj = self._validated(form)
+            obj.owner_id = user_id
+            obj.current_price = obj.starting_price
+            return obj
+
+        listing_ref = str(record.get('listing', ''))
+        if listing_ref not in listings:
+            raise ValueError(f"listing: no listing with an id={listing_ref}.")
+
+        if kind == 'bid':
+            listing = listings[listing_ref]
+            if listing.owner_id == user_id:
+                raise ValueError('Cannot place a bid for a listing that you are an owner of!')
+            if not listing.is_open:
+                raise ValueError('Auction for this listing has ended. No new bids are allowed!')
+            obj = self._validated(BiddingForm(record))
+            if obj.amount < listing.min_bid:
+                raise ValueError(f'Minimal bid not met! Bid must be at least ${listing.min_bid}')
+            listing.min_bid = obj.amount + 1
+            obj.bidder_id = user_id
+        else:
+            obj = self._validated(CommentForm(record))
+            obj.owner_id = user_id
+        obj.listing_id = int(listing_ref)
+        return obj
+
+    @staticmethod
+    def _validated(form):
+        if not form.is_valid():
+            field, errors = next(iter(form.errors.items()))
+            raise ValueError(f"{field}: {' '.join(errors)}")
+        return form.save(commit=False)
+
+
+def synthetic_listings(count: int, owner: str) -> Iterator[dict]:
+    for i in range(count):
+        yield {
+            'type': 'listing', 'owner': owner, 'title': f'Synthetic listing {i}',
+            'description': 'Generated by auctions_bulk_load --synthetic.', 'starting_price': 1 + i % 500,
+        }
+
+
+def synthetic_bids(count: int, bidder: str, listing_ids: list) -> Iterator[dict]:
+    """Spreads 'count' ascending bids of 'bidder' evenly over the given listings.
+    """
+    for i in range(count):
+        yield {
+            'type': 'bid', 'bidder': bidder, 'listing': listing_ids[i % len(listing_ids)],
+            'amount': 500 + i // len(listing_ids),
+        }
+
+
+def text_stream(binary: Iterable[bytes]) -> Iterator[str]:
+    """Decodes a stream of UTF-8 encoded lines, such as an HttpRequest body.
+    """
+    for line in binary:
+        yield line.decode('utf-8')
@@ -0,0 +1,42 @@
+"""Cache backend for rendered template fragments which keeps track of its hit rate.
+"""
+import threading
+
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class StatsLocMemCache(LocMemCache):
+    """Local memory cache counting hits and misses of get() calls. The eviction
+    budget is the standard MAX_ENTRIES/CULL_FREQUENCY pair of OPTIONS.
+    """
+
+    _missing = object()
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self._missing, version)
+        with self._stats_lock:
+            if value is self._missing:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return default if value is self._missing else value
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._cache),
+            'max_entries': self._max_entries,
+        }
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.hits = self.misses = 0
@@ -0,0 +1,143 @@
+"""Category counters and the facets of category pages.
+
+CategoryStats rows are updated in the transactions that create, close, move or
+delete listings, so category pages never count listings. Price ranges are refreshed
+with two lookups on the (category, current_price) index of active listings
+whenever prices may have changed.
+
+Category pages filter by price band and by whether listings have bids, and are
+ordered by newest or price. Each combination is served in index order by one of
+the (category, current_price, id) and (category, created, id) indexes of active
+listings.
+"""
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from django.db.models import Count, F, OuterRef, Subquery
+
+from .models import Listing, CategoryStats
+
+
+# Price band parameter -> (lowest price, highest price exclusive).
+PRICE_BANDS = {
+    'under-50': (0, 50),
+    '50-100': (50, 100),
+    '100-500': (100, 500),
+    '500-up': (500, None),
+}
+
+SORTS = {
+    'newest': ('-created', '-pk'),
+    'price': ('current_price', 'pk'),
+    'price-desc': ('-current_price', '-pk'),
+}
+
+
+def _bump(category: str, delta: int):
+    if not CategoryStats.objects.filter(category=category).update(active_listings=F('active_listings') + delta):
+        rebuild_stats([category])
+
+
+def refresh_ranges(stats):
+    """Recomputes the price ranges of the given CategoryStats queryset in one
+    UPDATE.
+    """
+    active = Listing.objects.filter(category=OuterRef('category'), is_active=True).values('current_price')
+    stats.update(
+        min_price=Subquery(active.order_by('current_price')[:1]),
+        max_price=Subquery(active.order_by('-current_price')[:1]),
+    )
+
+
+def _apply(changes: Counter):
+    for category, delta in changes.items():
+        if delta:
+            _bump(category, delta)
+    refresh_ranges(CategoryStats.objects.filter(category__in=list(changes)))
+
+
+def listings_created(listings: Iterable[Listing]):
+    _apply(Counter(listing.category for listing in listings if listing.is_active))
+
+
+def listing_moved(old_category: str, listing: Listing):
+    if listing.is_active and old_category != listing.category:
+        _apply(Counter({old_category: -1, listing.category: 1}))
+
+
+def listings_closed(categories: Iterable[str]):
+    """Called with the category of every listing closed in a batch.
+    """
+    _apply(Counter({category: -count for category, count in Counter(categories).items()}))
+
+
+def listing_deleted(listing: Listing):
+    if listing.is_active:
+        _apply(Counter({listing.category: -1}))
+
+
+def prices_changed(listing_ids: Iterable[int]):
+    refresh_ranges(CategoryStats.objects.filter(
+        category__in=Listing.objects.filter(pk__in=list(listing_ids), is_active=True).values('category')
+    ))
+
+
+def rebuild_stats(categories: Optional[Iterable[str]] = None) -> int:
+    """Recomputes the counters from scratch, for the given categories or for all
+    of them. Returns the number of rebuilt rows.
+    """
+    categories = [c for c, _ in Listing.LISTING_CATEGORIES] if categories is None else list(categories)
+    counts = dict(
+        Listing.objects.filter(category__in=categories, is_active=True).order_by()
+        .values('category').annotate(n=Count('pk')).values_list('category', 'n')
+    )
+    for category in categories:
+        CategoryStats.objects.update_or_create(category=category, defaults={'active_listings': counts.get(category, 0)})
+    refresh_ranges(CategoryStats.objects.filter(category__in=categories))
+    return len(categories)
+
+
+def facet_listings(category: str, price: Optional[str] = None, bids: Optional[str] = None, sort: Optional[str] = None):
+    """Returns the active listings of a category narrowed down by the facets.
+    Raises ValueError for unknown facet values.
+    """
+    listings = Listing.objects.filter(category=category, is_active=True)
+    if price:
+        if price not in PRICE_BANDS:
+            raise ValueError(f"Unknown price band '{price}'.")
+        low, high = PRICE_BANDS[price]
+        listings = listings.filter(current_price__gte=low)
+        if high is not None:
+            listings = listings.filter(current_price__lt=high)
+    if bids:
+        if bids not in ('yes', 'no'):
+            raise ValueError("The bids facet must be 'yes' or 'no'.")
+        listings = listings.filter(bid_count__gt=0) if bids == 'yes' else listings.filter(bid_count=0)
+    if (sort or 'newest') not in SORTS:
+        raise ValueError(f"Unknown order '{sort}'.")
+    return listings.order_by(*SORTS[sort or 'newest'])
+
+
+FACET_VALUES = {
+    'price': list(PRICE_BANDS),
+    'bids': ['yes', 'no'],
+    'sort': list(SORTS),
+}
+
+
+def facet_links(facets: Dict[str, str]) -> Dict[str, List[Tuple[str, str, bool]]]:
+    """Returns (value, query string, selected) for every value of every facet. The
+    query string keeps the other selected facets, selecting a filter again clears
+    it.
+    """
+    links = {}
+    for name, values in FACET_VALUES.items():
+        links[name] = []
+        for value in values:
+            selected = facets.get(name) == value
+            query = {k: v for k, v in facets.items() if v and k != name}
+            if not selected or name == 'sort':
+                query[name] = value
+            links[name].append((value, urlencode(query), selected))
+    return links
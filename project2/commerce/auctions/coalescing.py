@@ -0,0 +1,109 @@
+"""Protection of hot listings against stampedes of anonymous page views.
+
+Anonymous visitors all get the same listing page, so it is rendered once and
+kept in a per-process micro-cache for AUCTIONS_LISTING_MICROCACHE_TTL seconds.
+When the page is not cached, concurrent requests for it are coalesced: the
+first one renders it while the others wait for its result, so a listing going
+viral costs one set of queries per TTL and process, however many requests come
+in.
+
+Entries are invalidated as soon as a bid, comment, edit or closing of the
+listing is committed (see signals.py and expiry.py). Other processes drop
+theirs when the TTL runs out, which bounds how stale a page can get.
+"""
+import threading
+import time
+from typing import Callable, Dict, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse
+
+
+# Followers stop waiting for a leader that takes longer than this and render the
+# page themselves.
+WAIT_SECONDS = 5
+
+MAX_PAGES = 1000
+
+
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.page = None
+        # Set when the listing changes during the render, the page must not be stored.
+        self.stale = False
+
+
+class MicroCache:
+    """Short-lived cache of rendered pages with single-flight rendering on misses.
+    Pages are stored as (status, content type, content) and every request gets a
+    response object of its own.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pages: Dict[int, Tuple[float, tuple]] = {}
+        self.flights: Dict[int, _Flight] = {}
+
+    def ttl(self) -> float:
+        return getattr(settings, 'AUCTIONS_LISTING_MICROCACHE_TTL', 2)
+
+    def get_or_render(self, key: int, render: Callable[[], HttpResponse]) -> HttpResponse:
+        with self.lock:
+            cached = self.pages.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                return self._response(cached[1])
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+
+        if not leader:
+            if flight.done.wait(WAIT_SECONDS) and flight.page is not None:
+                return self._response(flight.page)
+            return render()
+
+        try:
+            response = render()
+            if response.status_code < 500 and not response.streaming:
+                flight.page = (response.status_code, response['Content-Type'], response.content)
+            return response
+        finally:
+            with self.lock:
+                del self.flights[key]
+                if flight.page is not None and not flight.stale:
+                    self._store(key, flight.page)
+            flight.done.set()
+
+    def _store(self, key: int, page: tuple):
+        now = time.monotonic()
+        if len(self.pages) >= MAX_PAGES:
+            for expired in [k for k, (expires, _) in self.pages.items() if expires <= now]:
+                del self.pages[expired]
+            if len(self.pages) >= MAX_PAGES:
+                del self.pages[next(iter(self.pages))]
+        self.pages[key] = (now + self.ttl(), page)
+
+    def invalidate(self, key: int):
+        with self.lock:
+            self.pages.pop(key, None)
+            flight = self.flights.get(key)
+            if flight is not None:
+                flight.stale = True
+
+    def invalidate_on_commit(self, key: int):
+        transaction.on_commit(lambda: self.invalidate(key))
+
+    def clear(self):
+        with self.lock:
+            self.pages.clear()
+
+    @staticmethod
+    def _response(page: tuple) -> HttpResponse:
+        status, content_type, content = page
+        return HttpResponse(content, content_type=content_type, status=status)
+
+
+listing_pages = MicroCache()
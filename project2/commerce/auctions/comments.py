@@ -0,0 +1,47 @@
+"""Keyset pagination of listing comments, oldest first.
+
+A page continues after the (created, id) of the last comment of the previous
+page, so fetching any page is a range scan on the (listing, created, id) index
+no matter how far down the thread it is.
+"""
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple
+
+from django.db.models import Q
+
+from .models import Comment
+
+
+COMMENTS_PAGE_SIZE = 20
+
+
+class CommentsPage(NamedTuple):
+    comments: List[Comment]
+    # Cursor of the following page, None on the last page.
+    next_cursor: Optional[str]
+
+
+def encode_cursor(created: datetime, pk: int) -> str:
+    return f'{created.isoformat()}_{pk}'
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError for malformed cursors.
+    """
+    created, _, pk = cursor.rpartition('_')
+    return datetime.fromisoformat(created), int(pk)
+
+
+def comments_page(listing_id: int, after: Optional[str] = None, size: int = COMMENTS_PAGE_SIZE) -> CommentsPage:
+    """Returns up to 'size' comments following the 'after' cursor.
+    """
+    comments = Comment.objects.filter(listing_id=listing_id).select_related('owner').order_by('created', 'id')
+    if after:
+        created, pk = decode_cursor(after)
+        comments = comments.filter(Q(created__gt=created) | Q(created=created, id__gt=pk))
+
+    page = list(comments[:size + 1])
+    if len(page) > size:
+        page = page[:size]
+        return CommentsPage(page, encode_cursor(page[-1].created, page[-1].id))
+    return CommentsPage(page, None)
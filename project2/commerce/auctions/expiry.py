@@ -0,0 +1,120 @@
+"""Automatic closing of auctions once their 'ends_at' time has passed.
+"""
+import heapq
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from . import activity, categories, coalescing, notifications
+from .models import Listing, Bid
+
+
+def close_listings(listing_ids: Iterable[int], now: Optional[datetime] = None, only_due: bool = False) -> int:
+    """Closes the given active listings in a single batch and awards each one to
+    the bidder with the highest bid (earliest bid wins a tie). If only_due is set,
+    listings whose 'ends_at' is still in the future are left open. Returns the
+    number of listings that were closed.
+    """
+    now = now or timezone.now()
+    top_bidder = Bid.objects.filter(listing=OuterRef('pk')).order_by('-amount', 'created').values('bidder')[:1]
+
+    with transaction.atomic():
+        due = Listing.objects.filter(pk__in=list(listing_ids), is_active=True)
+        if only_due:
+            due = due.filter(ends_at__lte=now)
+        # Bids take the lock of their listing first (see proxybids.submit), so
+        # once the listings are locked no bid can commit before they are closed.
+        # The winners are only read afterwards, from the bids committed by then.
+        locked = list(due.select_for_update().values_list('pk', flat=True))
+        listings = list(
+            Listing.objects.filter(pk__in=locked)
+            .annotate(top_bidder=Subquery(top_bidder)).only('id', 'owner', 'category', 'current_price')
+        )
+        for listing in listings:
+            listing.is_active = False
+            listing.closed_at = now
+            listing.winner_id = listing.top_bidder
+            # bulk_update() sends no signals, invalidate cached fragments here.
+            listing.version = F('version') + 1
+        # The UPDATE checks again that the listings are open and due.
+        due.bulk_update(listings, ['is_active', 'closed_at', 'winner', 'version'])
+        activity.listings_closed(
+            [listing.owner_id for listing in listings],
+            [listing.winner_id for listing in listings if listing.winner_id is not None]
+        )
+        categories.listings_closed([listing.category for listing in listings])
+        notifications.enqueue_won(listings)
+        notifications.enqueue_watchers_closed(listings)
+        for listing in listings:
+            coalescing.listing_pages.invalidate_on_commit(listing.id)
+    return len(listings)
+
+
+class ExpiryScheduler:
+    """Keeps a min-heap of (ends_at, listing id) for auctions ending within the
+    next 'horizon', refilled from the (is_active, ends_at) index. Due auctions are
+    popped off the heap and closed in batches of 'batch_size'.
+
+    Heap entries can go stale when an auction is closed by hand or its end time
+    is moved, close_listings() re-checks both so stale entries are harmless.
+    """
+
+    def __init__(self, batch_size: int = 500, horizon: timedelta = timedelta(minutes=5)):
+        self.batch_size = batch_size
+        self.horizon = horizon
+        self._heap = []
+        self._queued = set()
+
+    def refill(self, now: datetime):
+        """Pushes every active auction ending before now + horizon which is not on
+        the heap yet, overdue ones included.
+        """
+        upcoming = (
+            Listing.objects.filter(is_active=True, ends_at__lte=now + self.horizon)
+            .order_by('ends_at')
+            .values_list('ends_at', 'id')
+        )
+        for ends_at, listing_id in upcoming.iterator(chunk_size=self.batch_size):
+            if listing_id not in self._queued:
+                self._queued.add(listing_id)
+                heapq.heappush(self._heap, (ends_at, listing_id))
+
+    def next_due(self) -> Optional[datetime]:
+        return self._heap[0][0] if self._heap else None
+
+    def run_due(self, now: datetime) -> int:
+        """Closes every auction on the heap which ends at or before 'now'.
+        """
+        closed = 0
+        while self._heap and self._heap[0][0] <= now:
+            batch = []
+            while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+                _, listing_id = heapq.heappop(self._heap)
+                self._queued.discard(listing_id)
+                batch.append(listing_id)
+            closed += close_listings(batch, now, only_due=True)
+        return closed
+
+    def run_forever(self, refresh: float = 30.0, on_closed=None):
+        """Worker loop: sleeps until the earliest auction on the heap is due, but
+        at most 'refresh' seconds so newly created auctions are picked up.
+        """
+        next_refill = 0.0
+        while True:
+            if time.monotonic() >= next_refill:
+                self.refill(timezone.now())
+                next_refill = time.monotonic() + refresh
+
+            closed = self.run_due(timezone.now())
+            if closed and on_closed is not None:
+                on_closed(closed)
+
+            sleep_for = next_refill - time.monotonic()
+            due = self.next_due()
+            if due is not None:
+                sleep_for = min(sleep_for, (due - timezone.now()).total_seconds())
+            time.sleep(max(sleep_for, 0.0))
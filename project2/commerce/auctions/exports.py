@@ -0,0 +1,109 @@
+"""Exports of a seller's listings and of the bid history of their listings.
+
+Rows are streamed rather than materialized: they are read with
+QuerySet.iterator() one chunk at a time, with the related usernames and titles
+joined in SQL, and encoded as CSV or JSON lines as they are read. gzip
+compression is applied to the encoded stream on the fly. Memory use stays the
+same however many rows are exported. Archived listings and their bids (see
+auctions.archive) follow the live ones.
+"""
+import csv
+import json
+from datetime import datetime
+from itertools import chain, islice
+from typing import Iterable, Iterator, List
+
+from django.db.models import BooleanField, Value
+from django.utils.text import compress_sequence
+
+from .models import User, Listing, Bid, ArchivedListing, ArchivedBid
+
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+LISTING_FIELDS = [
+    'id', 'title', 'category', 'starting_price', 'price', 'bid_count', 'created', 'ends_at', 'closed_at',
+    'is_active', 'winner'
+]
+BID_FIELDS = ['listing', 'title', 'bidder', 'amount', 'created']
+
+# Encoded rows are sent in batches of this many.
+ROWS_PER_WRITE = 500
+
+
+def listing_rows(owner: User, chunk_size: int = 2000) -> Iterator[tuple]:
+    live = Listing.objects.filter(owner=owner).order_by('pk').values_list(
+        'pk', 'title', 'category', 'starting_price', 'current_price', 'bid_count', 'created', 'ends_at',
+        'closed_at', 'is_active', 'winner__username'
+    )
+    archived = ArchivedListing.objects.filter(owner=owner).order_by('pk').annotate(
+        is_active=Value(False, output_field=BooleanField())
+    ).values_list(
+        'pk', 'title', 'category', 'starting_price', 'final_price', 'bid_count', 'created', 'ends_at',
+        'closed_at', 'is_active', 'winner__username'
+    )
+    return chain(live.iterator(chunk_size=chunk_size), archived.iterator(chunk_size=chunk_size))
+
+
+def bid_rows(owner: User, chunk_size: int = 2000) -> Iterator[tuple]:
+    """Bids on the listings of the owner, listing by listing, oldest first.
+    """
+    fields = ('listing_id', 'listing__title', 'bidder__username', 'amount', 'created')
+    live = Bid.objects.filter(listing__owner=owner).order_by('listing_id', 'created', 'pk').values_list(*fields)
+    archived = ArchivedBid.objects.filter(listing__owner=owner).order_by('listing_id', 'created', 'pk').values_list(*fields)
+    return chain(live.iterator(chunk_size=chunk_size), archived.iterator(chunk_size=chunk_size))
+
+
+def _plain(row: tuple) -> list:
+    return [value.isoformat() if isinstance(value, datetime) else value for value in row]
+
+
+class _Echo:
+    """File-like object handing what csv.writer writes back to the caller.
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def encode(rows: Iterable[tuple], fields: List[str], fmt: str) -> Iterator[str]:
+    """Yields one encoded line per row, after a header line for CSV.
+    """
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow(_plain(row))
+    elif fmt == 'jsonl':
+        for row in rows:
+            yield json.dumps(dict(zip(fields, _plain(row)))) + '\n'
+    else:
+        raise ValueError(f"Unknown export format '{fmt}', expected 'csv' or 'jsonl'.")
+
+
+def stream(kind: str, owner: User, fmt: str = 'csv', gzip: bool = False) -> Iterator[bytes]:
+    """Returns the export of 'listings' or 'bids' of the owner as a stream of
+    bytes. Raises ValueError for an unknown kind or format.
+    """
+    if kind == 'listings':
+        rows, fields = listing_rows(owner), LISTING_FIELDS
+    elif kind == 'bids':
+        rows, fields = bid_rows(owner), BID_FIELDS
+    else:
+        raise ValueError(f"Unknown export '{kind}', expected 'listings' or 'bids'.")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}', expected 'csv' or 'jsonl'.")
+
+    lines = encode(rows, fields, fmt)
+
+    def batches() -> Iterator[bytes]:
+        while True:
+            batch = ''.join(islice(lines, ROWS_PER_WRITE))
+            if not batch:
+                return
+            yield batch.encode()
+
+    return compress_sequence(batches()) if gzip else batches()
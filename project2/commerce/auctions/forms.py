@@ -0,0 +1,43 @@
+from django import forms
+
+from .models import Listing, Bid, Comment
+
+
+class ListingForm(forms.ModelForm):
+    class Meta:
+        model = Listing
+        exclude = ['created', 'owner', 'is_active', 'winner', 'image']
+        widgets = {
+            'ends_at': forms.DateTimeInput(attrs={'type': 'datetime-local'})
+        }
+
+    upload = forms.ImageField(required=False, label='Image file')
+
+class EditListingForm(forms.ModelForm):
+    class Meta:
+        model = Listing
+        fields = ['title', 'image_url', 'category']
+
+class BiddingForm(forms.ModelForm):
+    # Makes the amount a private maximum the site bids up to on the user's behalf.
+    automatic = forms.BooleanField(required=False, label='Bid automatically up to this amount')
+
+    class Meta:
+        model = Bid
+        fields = ['amount']
+        labels = {
+            'amount': ''
+        }
+
+class CommentForm(forms.ModelForm):
+    class Meta:
+        model = Comment
+        fields = ['content']
+        labels = {
+            'content': ''
+        }
+        widgets = {
+            'content': forms.Textarea(
+                attrs={'cols': 45, 'rows': 1, 'placeholder': 'Write a comment...'}
+                )
+        }
@@ -0,0 +1,232 @@
+"""Local storage and thumbnailing of listing images.
+
+Images are stored under MEDIA_ROOT named after the SHA-256 of their content, so
+an image uploaded or linked by many listings is stored once, and its URLs can be
+cached by browsers forever. Thumbnails in AUCTIONS_THUMBNAIL_WIDTHS are
+generated by a small pool of background threads.
+
+Images linked by URL are downloaded by the server, which must not become a way
+into the private network it runs in: only http(s) URLs of hosts resolving to
+public addresses are fetched, from the address that was checked, redirects are
+not followed and downloads stop at MAX_IMAGE_BYTES.
+"""
+import hashlib
+import http.client
+import ipaddress
+import logging
+import socket
+import ssl
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import F
+from PIL import Image, ImageOps
+
+from .models import Listing, ListingImage
+
+
+FORMAT_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+ORIENTATION_TAG = 0x0112
+
+logger = logging.getLogger(__name__)
+
+
+def thumbnail_widths():
+    return getattr(settings, 'AUCTIONS_THUMBNAIL_WIDTHS', (160, 320, 640))
+
+
+def original_path(sha256: str, extension: str) -> str:
+    return f'listing-images/{sha256[:2]}/{sha256}.{extension}'
+
+
+def thumbnail_path(sha256: str, width: int) -> str:
+    return f'listing-images/{sha256[:2]}/{sha256}-{width}w.jpg'
+
+
+def ingest(data: bytes) -> ListingImage:
+    """Stores an image unless an identical one is stored already, and schedules
+    generation of its thumbnails. Raises ValueError if data is not a supported image.
+    """
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ValueError(f'Images must not be larger than {MAX_IMAGE_BYTES // (1024 * 1024)} MB.')
+
+    digest = hashlib.sha256(data).hexdigest()
+    existing = ListingImage.objects.filter(sha256=digest).first()
+    if existing is not None:
+        return existing
+
+    try:
+        with Image.open(BytesIO(data)) as im:
+            im.verify()
+        with Image.open(BytesIO(data)) as im:
+            image_format, (width, height) = im.format, oriented_size(im)
+    except Exception as e:
+        raise ValueError('Not a valid image file.') from e
+    if image_format not in FORMAT_EXTENSIONS:
+        raise ValueError(f'Unsupported image format {image_format}.')
+
+    path = original_path(digest, FORMAT_EXTENSIONS[image_format])
+    if not default_storage.exists(path):
+        default_storage.save(path, ContentFile(data))
+    image, created = ListingImage.objects.get_or_create(
+        sha256=digest, defaults={'original': path, 'width': width, 'height': height}
+    )
+    if created:
+        transaction.on_commit(lambda: schedule(make_thumbnails, image.pk))
+    return image
+
+
+def oriented_size(im: Image.Image) -> tuple:
+    """The size of the image as displayed, turned by its EXIF orientation.
+    """
+    width, height = im.size
+    # Orientations 5 to 8 turn the image by 90 degrees.
+    if im.getexif().get(ORIENTATION_TAG, 1) in (5, 6, 7, 8):
+        return height, width
+    return width, height
+
+
+def public_address(host: str, port: int) -> str:
+    """Resolves the host, raising ValueError unless all its addresses are public
+    ones, and returns the first of them.
+    """
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+    except socket.gaierror as e:
+        raise ValueError(f"Cannot resolve '{host}'.") from e
+    for address in addresses:
+        # Scoped IPv6 addresses end with '%<interface>'.
+        if not ipaddress.ip_address(address.split('%')[0]).is_global:
+            raise ValueError(f"'{host}' is not a public address.")
+    return addresses[0]
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    """Connects to the given address rather than resolving the host again, which
+    could give a different answer the second time.
+    """
+
+    def __init__(self, host: str, port: int, address: str, timeout: float):
+        super().__init__(host, port, timeout=timeout)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class _PinnedHTTPSConnection(_PinnedHTTPConnection):
+    default_port = http.client.HTTPS_PORT
+
+    def connect(self):
+        super().connect()
+        self.sock = ssl.create_default_context().wrap_socket(self.sock, server_hostname=self.host)
+
+
+def fetch(url: str, timeout: float = 10) -> bytes:
+    """Downloads an image, raising ValueError for URLs that are not allowed and
+    responses that are not a downloadable image.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError('Only http and https image URLs are supported.')
+    connection_class = _PinnedHTTPSConnection if parts.scheme == 'https' else _PinnedHTTPConnection
+    port = parts.port or connection_class.default_port
+
+    conn = connection_class(parts.hostname, port, public_address(parts.hostname, port), timeout)
+    try:
+        conn.request('GET', (parts.path or '/') + (f'?{parts.query}' if parts.query else ''))
+        response = conn.getresponse()
+        if 300 <= response.status < 400:
+            raise ValueError('Image URLs must not redirect.')
+        if response.status != 200:
+            raise ValueError(f'Image download failed with status {response.status}.')
+        # Without reading a body announced as too large, the size is checked
+        # again on what is actually sent.
+        if int(response.headers.get('Content-Length') or 0) <= MAX_IMAGE_BYTES:
+            data = response.read(MAX_IMAGE_BYTES + 1)
+            if len(data) <= MAX_IMAGE_BYTES:
+                return data
+    finally:
+        conn.close()
+    raise ValueError(f'Images must not be larger than {MAX_IMAGE_BYTES // (1024 * 1024)} MB.')
+
+
+def ingest_listing_url(listing_id: int):
+    """Downloads the image a listing links to and attaches the stored copy to it.
+    """
+    listing = Listing.objects.filter(pk=listing_id).only('image_url').first()
+    if listing is None or not listing.image_url:
+        return
+    image = ingest(fetch(listing.image_url))
+    Listing.objects.filter(pk=listing_id, image_url=listing.image_url).update(image=image, version=F('version') + 1)
+
+
+def unprocessed_images():
+    """The images make_thumbnails() has not processed yet.
+    """
+    return ListingImage.objects.filter(thumbnail_widths__isnull=True)
+
+
+def make_thumbnails(image_id: int):
+    """Generates the thumbnails narrower than the original and invalidates the
+    cached fragments of every listing using the image.
+    """
+    image = ListingImage.objects.get(pk=image_id)
+    with default_storage.open(image.original) as f:
+        with Image.open(f) as im:
+            im = ImageOps.exif_transpose(im).convert('RGB')
+    original_width, original_height = im.size
+
+    widths = [w for w in thumbnail_widths() if w < original_width]
+    for width in widths:
+        thumb = im.copy()
+        thumb.thumbnail((width, original_height * width // original_width + 1), Image.LANCZOS)
+        out = BytesIO()
+        thumb.save(out, 'JPEG', quality=80, optimize=True, progressive=True)
+
+        path = thumbnail_path(image.sha256, width)
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        default_storage.save(path, ContentFile(out.getvalue()))
+
+    ListingImage.objects.filter(pk=image_id).update(
+        thumbnail_widths=widths, width=original_width, height=original_height
+    )
+    Listing.objects.filter(image_id=image_id).update(version=F('version') + 1)
+
+
+_executor = None
+
+
+def schedule(task, *args):
+    """Runs an image task on the background pool, off the request path.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'AUCTIONS_IMAGE_WORKERS', 2), thread_name_prefix='listing-images'
+        )
+    return _executor.submit(_run, task, *args)
+
+
+def _run(task, *args):
+    try:
+        task(*args)
+    except Exception:
+        logger.exception('Image task %s%r failed', task.__name__, args)
+    finally:
+        # Pool threads outlive requests, do not leave their connections open.
+        connections.close_all()
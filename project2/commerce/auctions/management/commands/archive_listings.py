@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from auctions.archive import archive_listings
+
+
+class Command(BaseCommand):
+    help = "Moves listings closed long ago, with their bids and comments, to the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'AUCTIONS_ARCHIVE_AFTER_DAYS', 30),
+                            help="Archive listings closed more than this many days ago.")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Number of listings archived per transaction.")
+
+    def handle(self, *args, **options):
+        archived = archive_listings(timedelta(days=options['days']), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} listing(s)."))
@@ -0,0 +1,65 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.bulk import BulkLoader, read_records, synthetic_bids, synthetic_listings
+from auctions.models import Listing
+
+
+class Command(BaseCommand):
+    help = "Loads listings, bids and comments from a CSV or JSON-lines file in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?',
+                            help="Input file, '-' reads standard input.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='jsonl')
+        parser.add_argument('--type', choices=['listing', 'bid', 'comment'],
+                            help="Record type of rows that do not specify one.")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Number of rows inserted per transaction.")
+        parser.add_argument('--synthetic', type=int, metavar='ROWS',
+                            help="Instead of reading a file, load ROWS generated rows "
+                                 "(one listing for every four bids), for benchmarking.")
+        parser.add_argument('--owner', help="Username owning the generated listings.")
+        parser.add_argument('--bidder', help="Username placing the generated bids.")
+
+    def handle(self, *args, **options):
+        if options['synthetic']:
+            reports = self.load_synthetic(options)
+        elif options['path']:
+            reports = [self.load_file(options)]
+        else:
+            raise CommandError("Specify an input file or --synthetic.")
+
+        for report in reports:
+            for row, error in report.errors[:20]:
+                self.stderr.write(f"row {row}: {error}")
+            self.stdout.write(json.dumps(report.as_dict(max_errors=0)))
+
+    def load_file(self, options):
+        loader = BulkLoader(chunk_size=options['chunk_size'])
+        if options['path'] == '-':
+            return loader.load(read_records(sys.stdin, options['format'], options['type']))
+        with open(options['path'], newline='', encoding='utf-8') as f:
+            return loader.load(read_records(f, options['format'], options['type']))
+
+    def load_synthetic(self, options):
+        if not options['owner'] or not options['bidder']:
+            raise CommandError("--synthetic requires --owner and --bidder.")
+
+        listings = max(options['synthetic'] // 5, 1)
+        last_id = Listing.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        listing_report = BulkLoader(chunk_size=options['chunk_size']).load(
+            synthetic_listings(listings, options['owner'])
+        )
+        listing_ids = list(
+            Listing.objects.filter(pk__gt=last_id, owner__username=options['owner']).values_list('pk', flat=True)
+        )
+        if not listing_ids:
+            raise CommandError(f"No listings were loaded for '{options['owner']}'.")
+
+        bid_report = BulkLoader(chunk_size=options['chunk_size']).load(
+            synthetic_bids(options['synthetic'] - listings, options['bidder'], listing_ids)
+        )
+        return [listing_report, bid_report]
@@ -0,0 +1,104 @@
+import json
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+)
+
+from auctions import benchmark
+from auctions.models import User
+
+
+# Database settings the benchmark runs with, 'tuned' keeps the configured ones
+# and 'plain' approximates django.db.backends.sqlite3 out of the box: a new
+# connection per request, rollback journal, deferred transactions.
+SQLITE_PROFILES = {
+    'tuned': {},
+    'plain': {
+        'CONN_MAX_AGE': 0,
+        'CONN_HEALTH_CHECKS': False,
+        'PRAGMAS': {'journal_mode': 'DELETE'},
+        'TRANSACTION_MODE': '',
+    },
+}
+
+
+class Command(BaseCommand):
+    help = ("Seeds a separate benchmark database with synthetic data, runs scripted user journeys "
+            "against every route concurrently and writes a JSON report.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000,
+                            help="Number of rows to seed, from 1000 up to 10000000.")
+        parser.add_argument('--virtual-users', type=int, default=8,
+                            help="Number of concurrent clients.")
+        parser.add_argument('--iterations', type=int, default=10,
+                            help="Number of times every client repeats the shopping journey.")
+        parser.add_argument('--seed', type=int, default=0,
+                            help="Seed of the data and journey generators.")
+        parser.add_argument('--database', default='benchmark.sqlite3',
+                            help="Name of the benchmark database, never the configured one.")
+        parser.add_argument('--keepdb', action='store_true',
+                            help="Keep the seeded database and reuse it on the next run.")
+        parser.add_argument('--sqlite-profile', choices=SQLITE_PROFILES, default='tuned',
+                            help="Run with the configured database settings or plain SQLite ones, "
+                                 "to compare bid throughput and read latency.")
+        parser.add_argument('--output', help="Write the report to this file instead of standard output.")
+        parser.add_argument('--compare', metavar='REPORT', help="Print a comparison with an earlier report.")
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1 or options['virtual_users'] < 1 or options['iterations'] < 0:
+            raise CommandError("--rows and --virtual-users must be positive, --iterations must not be negative.")
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        if options['verbosity'] < 2:
+            # Failed requests are counted in the report, their tracebacks would drown the output.
+            logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+        connections['default'].settings_dict.setdefault('TEST', {})['NAME'] = options['database']
+        connections['default'].settings_dict.update(SQLITE_PROFILES[options['sqlite_profile']])
+        setup_test_environment()
+        try:
+            # Replicas would not contain the seeded data.
+            with override_settings(DATABASE_REPLICAS=[]):
+                old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+                try:
+                    report = self.benchmark(options)
+                finally:
+                    teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+        finally:
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if baseline is not None:
+            for line in benchmark.compare(report, baseline):
+                self.stderr.write(line)
+        self.stderr.write(self.style.SUCCESS(
+            f"{report['requests']} requests, {report['errors']} errors, {report['throughput_rps']} requests/s, "
+            f"{report['bids_per_second']} bids/s."
+        ))
+
+    def benchmark(self, options) -> dict:
+        seeded = None
+        if not User.objects.filter(username__startswith=benchmark.USERNAME_PREFIX).exists():
+            start = time.perf_counter()
+            counts = benchmark.seed(options['rows'], options['seed'])
+            seeded = {'rows': counts, 'seconds': round(time.perf_counter() - start, 3)}
+            self.stderr.write(f"Seeded {sum(counts.values())} rows in {seeded['seconds']} s.")
+
+        report = benchmark.run(options['virtual_users'], options['iterations'], options['seed'])
+        report['seeded'] = seeded
+        report['sqlite_profile'] = options['sqlite_profile']
+        return report
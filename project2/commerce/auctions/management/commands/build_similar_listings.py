@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.similar import build_all, update_queued
+
+
+class Command(BaseCommand):
+    help = "Computes the similar listings of listings created or edited since the last run (requires NumPy)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help="Recompute the similar listings of every active listing.")
+
+    def handle(self, *args, **options):
+        try:
+            updated = build_all() if options['full'] else update_queued()
+        except ImportError:
+            raise CommandError("NumPy is required to compute similar listings, install it with 'pip install numpy'.")
+        self.stdout.write(self.style.SUCCESS(f"Updated the similar listings of {updated} listing(s)."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.bidstats import DEFAULT_PERCENTILES, compute_percentiles
+
+
+class Command(BaseCommand):
+    help = "Computes the bid amount percentiles of every category (requires NumPy)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--percentiles', nargs='+', type=float, default=list(DEFAULT_PERCENTILES),
+                            help="Percentiles to compute, between 0 and 100.")
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help="Number of bids fetched from the database at a time.")
+
+    def handle(self, *args, **options):
+        if not all(0 <= p <= 100 for p in options['percentiles']):
+            raise CommandError("Percentiles must be between 0 and 100.")
+        try:
+            counted = compute_percentiles(options['percentiles'], options['chunk_size'])
+        except ImportError:
+            raise CommandError("NumPy is required to compute percentiles, install it with 'pip install numpy'.")
+
+        for category, bids in counted.items():
+            self.stdout.write(f"{category}: {bids} bids")
+        self.stdout.write(self.style.SUCCESS(f"Computed percentiles of {len(counted)} categories."))
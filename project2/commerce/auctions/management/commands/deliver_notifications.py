@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from auctions.notifications import deliver_pending, expand_watcher_events, run_worker
+
+
+class Command(BaseCommand):
+    help = "Delivers pending outbid and auction won notifications as per-user digests."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Deliver what is due and exit.")
+        parser.add_argument('--window', type=int, default=60,
+                            help="Seconds events of a user are held back to be merged into one digest.")
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help="Seconds to wait between polls of the queue when it is drained.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        window = timedelta(seconds=options['window'])
+        if options['once']:
+            while expand_watcher_events(options['batch_size']) == options['batch_size']:
+                pass
+            delivered = deliver_pending(window, options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Delivered {delivered} event(s)."))
+            return
+
+        self.stdout.write("Delivering notifications, press CTRL-C to stop.")
+        try:
+            run_worker(
+                window, options['interval'], options['batch_size'],
+                on_delivered=lambda n: self.stdout.write(f"{timezone.now():%Y-%m-%d %H:%M:%S} delivered {n} event(s)")
+            )
+        except KeyboardInterrupt:
+            pass
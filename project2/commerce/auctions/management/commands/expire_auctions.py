@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from auctions.expiry import ExpiryScheduler
+
+
+class Command(BaseCommand):
+    help = "Closes auctions whose end time has passed. Runs as a worker unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Close the auctions that are currently due and exit (e.g. from cron).")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Number of auctions closed per bulk update.")
+        parser.add_argument('--horizon', type=int, default=300,
+                            help="Seconds ahead for which upcoming auctions are kept in memory.")
+        parser.add_argument('--refresh', type=float, default=30.0,
+                            help="Seconds between reloads of upcoming auctions from the database.")
+
+    def handle(self, *args, **options):
+        scheduler = ExpiryScheduler(batch_size=options['batch_size'],
+                                    horizon=timedelta(seconds=options['horizon']))
+
+        if options['once']:
+            now = timezone.now()
+            scheduler.refill(now)
+            closed = scheduler.run_due(now)
+            self.stdout.write(self.style.SUCCESS(f"Closed {closed} auction(s)."))
+            return
+
+        self.stdout.write(f"Expiring auctions (batch size {options['batch_size']}), press CTRL-C to stop.")
+        try:
+            scheduler.run_forever(
+                refresh=options['refresh'],
+                on_closed=lambda closed: self.stdout.write(f"{timezone.now():%Y-%m-%d %H:%M:%S} closed {closed} auction(s)")
+            )
+        except KeyboardInterrupt:
+            pass
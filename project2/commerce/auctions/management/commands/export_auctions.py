@@ -0,0 +1,32 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.exports import FORMATS, stream
+from auctions.models import User
+
+
+class Command(BaseCommand):
+    help = "Streams the listings of a seller, or the bids on them, as CSV or JSON lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('seller', help="Username of the seller.")
+        parser.add_argument('kind', choices=['listings', 'bids'])
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help="Compress the output with gzip.")
+        parser.add_argument('--output', '-o', default='-', help="File to write to, '-' for standard output.")
+
+    def handle(self, *args, **options):
+        seller = User.objects.filter(username=options['seller']).first()
+        if seller is None:
+            raise CommandError(f"No user named '{options['seller']}'.")
+
+        content = stream(options['kind'], seller, options['format'], gzip=options['gzip'])
+        if options['output'] == '-':
+            for chunk in content:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            with open(options['output'], 'wb') as f:
+                for chunk in content:
+                    f.write(chunk)
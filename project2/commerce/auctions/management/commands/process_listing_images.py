@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from auctions.images import ingest_listing_url, make_thumbnails, unprocessed_images
+from auctions.models import Listing
+
+
+def run(task, *args):
+    try:
+        task(*args)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ("Copies images that listings link to into local storage and generates missing "
+            "thumbnails, using a pool of worker threads.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+
+    def handle(self, *args, **options):
+        linked = Listing.objects.filter(image__isnull=True).exclude(image_url='').values_list('pk', flat=True)
+        self.process(ingest_listing_url, linked, "linked image(s) ingested", options['workers'])
+
+        missing = unprocessed_images().values_list('pk', flat=True)
+        self.process(make_thumbnails, missing, "image(s) thumbnailed", options['workers'])
+
+    def process(self, task, ids, label, workers):
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(run, task, pk): pk for pk in ids.iterator()}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{task.__name__}({futures[future]}) failed: {e}")
+        self.stdout.write(self.style.SUCCESS(f"{done} {label}, {failed} failed."))
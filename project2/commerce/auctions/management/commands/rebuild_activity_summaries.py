@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from auctions.activity import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = "Recomputes the per-user activity summaries from listings and bids."
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int,
+                            help="Only rebuild the summaries of these users.")
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_summaries(options['user_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} activity summaries."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from auctions.bidstats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Recomputes the hourly bid statistics of listings and categories from the bids."
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} bid statistics buckets."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from auctions.categories import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Recomputes the active listing counts and price ranges of categories."
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the counters of {rebuilt} categories."))
@@ -0,0 +1,41 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = ("Copies the primary SQLite database onto the configured replicas, standing in for "
+            "replication in local setups. With --interval it keeps doing so, which simulates "
+            "replicas lagging up to that many seconds behind the primary.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help="Seconds between copies, copy once and exit if not given.")
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError("Only SQLite primaries can be copied onto replicas.")
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No replicas configured, set COMMERCE_DB_REPLICAS.")
+
+        while True:
+            self.sync(primary, [connections[alias].settings_dict['NAME'] for alias in settings.DATABASE_REPLICAS])
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self, primary, replica_paths):
+        # Copied through the primary's own connection, which also reaches the
+        # in-memory databases of tests.
+        primary.ensure_connection()
+        for path in replica_paths:
+            target = sqlite3.connect(path)
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(f"Synced {path}")
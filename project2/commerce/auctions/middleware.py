@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+
+from . import routers
+
+
+class ReplicaStickinessMiddleware:
+    """Pins reads to the primary database for requests that write and, for
+    REPLICA_STICKY_SECONDS afterwards, for every request of the same session.
+    Must come after SessionMiddleware.
+    """
+
+    SESSION_KEY = '_primary_until'
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.reset_state()
+        try:
+            routers.pin_to_primary(
+                request.method not in self.SAFE_METHODS or self._is_sticky(request)
+            )
+            response = self.get_response(request)
+
+            if routers.has_written() and hasattr(request, 'session'):
+                request.session[self.SESSION_KEY] = time.time() + getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+            return response
+        finally:
+            routers.reset_state()
+
+    def _is_sticky(self, request) -> bool:
+        # Anonymous visitors without a session cookie cannot have written anything,
+        # do not load a session just to find that out.
+        if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            return False
+        return request.session.get(self.SESSION_KEY, 0) > time.time()
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0012_comment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
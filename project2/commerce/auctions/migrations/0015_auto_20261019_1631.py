@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:31
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_prices(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    Bid = apps.get_model('auctions', 'Bid')
+    bids = Bid.objects.filter(listing=OuterRef('pk')).order_by().values('listing')
+    Listing.objects.update(
+        current_price=Coalesce(Subquery(bids.annotate(top=Max('amount')).values('top')), F('starting_price')),
+        bid_count=Coalesce(Subquery(bids.annotate(n=Count('pk')).values('n')), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0014_auto_20261019_1630'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='current_price',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0015_auto_20261019_1631'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivitySummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='activity_summary', serialize=False, to='auctions.user')),
+                ('listings_count', models.PositiveIntegerField(default=0)),
+                ('active_listings_count', models.PositiveIntegerField(default=0)),
+                ('bids_count', models.PositiveIntegerField(default=0)),
+                ('bidded_listings_count', models.PositiveIntegerField(default=0)),
+                ('won_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
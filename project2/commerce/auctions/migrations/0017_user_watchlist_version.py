@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0016_activitysummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='watchlist_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0019_auto_20261019_1641'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['listing', 'created', 'id'], name='comment_listing_created_idx'),
+        ),
+    ]
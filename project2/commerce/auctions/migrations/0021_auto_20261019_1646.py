@@ -0,0 +1,63 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0020_comment_comment_listing_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryBidStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveBigIntegerField(default=0)),
+                ('min_amount', models.PositiveIntegerField()),
+                ('max_amount', models.PositiveIntegerField()),
+                ('category', models.CharField(choices=[('FSHN', 'Fashion'), ('TYS', 'Toys'), ('ELCTRNCS', 'Electronics'), ('HM', 'Home'), ('SPRTS', 'Sports'), ('OTHR', 'Other')], max_length=64)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CategoryPricePercentiles',
+            fields=[
+                ('category', models.CharField(choices=[('FSHN', 'Fashion'), ('TYS', 'Toys'), ('ELCTRNCS', 'Electronics'), ('HM', 'Home'), ('SPRTS', 'Sports'), ('OTHR', 'Other')], max_length=64, primary_key=True, serialize=False)),
+                ('bids_count', models.PositiveBigIntegerField()),
+                ('percentiles', models.JSONField(default=dict)),
+                ('computed', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ListingBidStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveBigIntegerField(default=0)),
+                ('min_amount', models.PositiveIntegerField()),
+                ('max_amount', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['created'], name='bid_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='listingbidstats',
+            name='listing',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bid_stats', to='auctions.listing'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='categorybidstats',
+            unique_together={('category', 'hour')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='listingbidstats',
+            unique_together={('listing', 'hour')},
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:59
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def fill_category_stats(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    CategoryStats = apps.get_model('auctions', 'CategoryStats')
+    stats = (
+        Listing.objects.filter(is_active=True).order_by().values('category')
+        .annotate(n=Count('pk'), low=Min('current_price'), high=Max('current_price'))
+    )
+    CategoryStats.objects.bulk_create([
+        CategoryStats(category=row['category'], active_listings=row['n'], min_price=row['low'], max_price=row['high'])
+        for row in stats
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0021_auto_20261019_1646'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.CharField(choices=[('FSHN', 'Fashion'), ('TYS', 'Toys'), ('ELCTRNCS', 'Electronics'), ('HM', 'Home'), ('SPRTS', 'Sports'), ('OTHR', 'Other')], max_length=64, primary_key=True, serialize=False)),
+                ('active_listings', models.PositiveIntegerField(default=0)),
+                ('min_price', models.PositiveIntegerField(blank=True, null=True)),
+                ('max_price', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'current_price', 'id'], name='listing_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'created', 'id'], name='listing_cat_created_idx'),
+        ),
+        migrations.RunPython(fill_category_stats, migrations.RunPython.noop),
+    ]
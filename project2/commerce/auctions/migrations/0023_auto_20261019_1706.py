@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0022_auto_20261019_1659'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='bid',
+            options={'ordering': ['-amount', 'created']},
+        ),
+        migrations.CreateModel(
+            name='ProxyBid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('max_amount', models.PositiveIntegerField()),
+                ('placed', models.DateTimeField(default=django.utils.timezone.now)),
+                ('bidder', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='proxy_bids', to=settings.AUTH_USER_MODEL)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='proxy_bids', to='auctions.listing')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='proxybid',
+            index=models.Index(fields=['listing', '-max_amount', 'placed'], name='proxy_bid_book_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='proxybid',
+            unique_together={('listing', 'bidder')},
+        ),
+    ]
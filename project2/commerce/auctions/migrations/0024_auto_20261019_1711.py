@@ -0,0 +1,70 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0023_auto_20261019_1706'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField()),
+                ('created', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedListing',
+            fields=[
+                ('id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=64)),
+                ('description', models.TextField()),
+                ('image_url', models.URLField(blank=True)),
+                ('category', models.CharField(choices=[('FSHN', 'Fashion'), ('TYS', 'Toys'), ('ELCTRNCS', 'Electronics'), ('HM', 'Home'), ('SPRTS', 'Sports'), ('OTHR', 'Other')], max_length=64)),
+                ('starting_price', models.PositiveIntegerField()),
+                ('final_price', models.PositiveIntegerField()),
+                ('bid_count', models.PositiveIntegerField()),
+                ('created', models.DateTimeField()),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('closed_at', models.DateTimeField(blank=True, null=True)),
+                ('archived', models.DateTimeField(auto_now_add=True)),
+                ('comments', models.JSONField(default=list)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_active', False)), fields=['closed_at'], name='listing_closed_at_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedlisting',
+            name='image',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='auctions.listingimage'),
+        ),
+        migrations.AddField(
+            model_name='archivedlisting',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_listings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedlisting',
+            name='winner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='won_archived_listings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedbid',
+            name='bidder',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bids', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedbid',
+            name='listing',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bids', to='auctions.archivedlisting'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0025_similarityupdate_similarlisting'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notificationevent',
+            name='kind',
+            field=models.CharField(choices=[('outbid', 'Outbid'), ('won', 'Auction won'), ('watched_bid', 'New bid on a watched listing'), ('watched_closed', 'Watched auction ended')], max_length=16),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0026_alter_notificationevent_kind'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationevent',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0027_notificationevent_claimed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingVector',
+            fields=[
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='auctions.listing')),
+                ('dimensions', models.PositiveIntegerField()),
+                ('indices', models.BinaryField()),
+                ('weights', models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SimilarityIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimensions', models.PositiveIntegerField()),
+                ('documents', models.PositiveIntegerField()),
+                ('indices', models.BinaryField()),
+                ('weights', models.BinaryField()),
+                ('built', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0028_listingvector_similarityindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WatcherEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('outbid', 'Outbid'), ('won', 'Auction won'), ('watched_bid', 'New bid on a watched listing'), ('watched_closed', 'Watched auction ended')], max_length=16)),
+                ('amount', models.PositiveIntegerField()),
+                ('excluded', models.JSONField(blank=True, default=list)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('last_watch', models.PositiveBigIntegerField(default=0)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='auctions.listing')),
+            ],
+        ),
+    ]
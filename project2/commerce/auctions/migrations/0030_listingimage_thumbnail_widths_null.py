@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:09
+
+from django.db import migrations, models
+
+
+def mark_unprocessed(apps, schema_editor):
+    # An empty list meant either not processed yet or no thumbnail needed, the
+    # images are processed once more to tell.
+    ListingImage = apps.get_model('auctions', 'ListingImage')
+    ListingImage.objects.filter(thumbnail_widths=[]).update(thumbnail_widths=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0029_watcherevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='listingimage',
+            name='thumbnail_widths',
+            field=models.JSONField(blank=True, default=None, null=True),
+        ),
+        migrations.RunPython(mark_unprocessed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0030_listingimage_thumbnail_widths_null'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='similar_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
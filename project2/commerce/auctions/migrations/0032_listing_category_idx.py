@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0031_listing_similar_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['category', 'id'], name='listing_category_idx'),
+        ),
+    ]
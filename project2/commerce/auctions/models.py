@@ -1,9 +1,46 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 
 class User(AbstractUser):
     watchlist = models.ManyToManyField('Listing', blank=True, related_name='watchlist_users')
+    # Bumped on every watchlist change, invalidates membership sets cached in sessions.
+    watchlist_version = models.PositiveIntegerField(default=0, editable=False)
+
+
+class ListingImage(models.Model):
+    """An image stored locally under MEDIA_ROOT, named after the SHA-256 of its
+    content so the same picture is only ever stored once. Thumbnails are
+    generated in the background (see auctions.images).
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    original = models.CharField(max_length=200)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    # Widths of the generated thumbnails, None until they are ready and empty if
+    # the original is narrower than all of them.
+    thumbnail_widths = models.JSONField(null=True, blank=True, default=None)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.width}x{self.height})"
+
+
+class ListingQuerySet(models.QuerySet):
+
+    def refresh_prices(self) -> int:
+        """Recomputes the stored current price and bid count of the listings from
+        their bids in a single UPDATE, and invalidates their cached fragments.
+        """
+        bids = Bid.objects.filter(listing=OuterRef('pk')).order_by().values('listing')
+        return self.update(
+            current_price=Coalesce(Subquery(bids.annotate(top=Max('amount')).values('top')), F('starting_price')),
+            bid_count=Coalesce(Subquery(bids.annotate(n=Count('pk')).values('n')), 0),
+            version=F('version') + 1
+        )
 
 
 class Listing(models.Model):
@@ -20,15 +57,62 @@ class Listing(models.Model):
     title = models.CharField(max_length=64)
     description = models.TextField()
     image_url = models.URLField(blank=True)
+    image = models.ForeignKey(ListingImage, null=True, blank=True, on_delete=models.SET_NULL, related_name='listings')
     category = models.CharField(max_length=64, choices=LISTING_CATEGORIES, default='OTHR')
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="user_listings")
     starting_price = models.PositiveIntegerField()
+    # Denormalized from bids, kept up to date by refresh_prices().
+    current_price = models.PositiveIntegerField(default=0, editable=False)
+    bid_count = models.PositiveIntegerField(default=0, editable=False)
     created = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+    closed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    winner = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name="won_listings")
+    # Bumped whenever the listing, its bids or its comments change (see signals.py),
+    # used to version cached fragments of the listing.
+    version = models.PositiveIntegerField(default=0, editable=False)
+    # Bumped when the similar listings are recomputed (see auctions.similar),
+    # which must not invalidate the other fragments and ETags of the listing.
+    similar_version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ListingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Lets the expiry scheduler find auctions that are due without scanning the table.
+            models.Index(fields=['is_active', 'ends_at'], name='listing_active_ends_at_idx'),
+            # Category pages by price band and price order, and the price ranges of CategoryStats.
+            models.Index(fields=['category', 'current_price', 'id'], name='listing_cat_price_idx',
+                         condition=models.Q(is_active=True)),
+            # Category pages, newest first.
+            models.Index(fields=['category', 'created', 'id'], name='listing_cat_created_idx',
+                         condition=models.Q(is_active=True)),
+            # The admin's category filter, over open and closed listings, newest first.
+            models.Index(fields=['category', 'id'], name='listing_category_idx'),
+            # Closed listings due for archival, see auctions.archive.
+            models.Index(fields=['closed_at'], name='listing_closed_at_idx', condition=models.Q(is_active=False)),
+        ]
     
     def __str__(self):
-        price = self.starting_price if not self.bids.exists() else self.bids.first().amount
-        return f"{self.title}: ${price}"
+        return f"{self.title}: ${self.current_price}"
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            if not self.bid_count:
+                self.current_price = self.starting_price
+            super().save(*args, **kwargs)
+            return
+        # The version is bumped in SQL, an instance loaded before a concurrent
+        # change must not write its stale version back.
+        self.version = F('version') + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['version'])
+
+    def has_ended(self) -> bool:
+        return self.ends_at is not None and self.ends_at <= timezone.now()
     
 
 class Bid(models.Model):
@@ -38,11 +122,36 @@ class Bid(models.Model):
     created = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        ordering = ['-amount']
+        # Equal amounts go to the earliest bid, as when auctions are closed.
+        ordering = ['-amount', 'created']
+        indexes = [
+            # Lets bid statistics of a category be recomputed for a single hour.
+            models.Index(fields=['created'], name='bid_created_idx')
+        ]
 
     def __str__(self):
         return f"Bidder: {self.bidder}, Listing: {self.listing.title} Bid: ${self.amount}"
 
+class ProxyBid(models.Model):
+    """The private maximum a bidder is willing to pay for a listing. The proxy
+    engine (see auctions.proxybids) bids on their behalf up to it.
+    """
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='proxy_bids')
+    bidder = models.ForeignKey(User, on_delete=models.CASCADE, related_name='proxy_bids')
+    max_amount = models.PositiveIntegerField()
+    # Time the maximum was last raised, equal maxima go to the earliest one.
+    placed = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = [['listing', 'bidder']]
+        indexes = [
+            # Order book of a listing, the two leading maxima are read in index order.
+            models.Index(fields=['listing', '-max_amount', 'placed'], name='proxy_bid_book_idx')
+        ]
+
+    def __str__(self):
+        return f"Bidder: {self.bidder}, Listing: {self.listing_id} Max: ${self.max_amount}"
+
 class Comment(models.Model):
     content = models.TextField(max_length=3000)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user_comments')
@@ -50,5 +159,260 @@ class Comment(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     edited = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a listing's comments, see auctions.comments.
+            models.Index(fields=['listing', 'created', 'id'], name='comment_listing_created_idx')
+        ]
+
+    def __str__(self):
+        return f"{self.owner}: {self.content}"
+
+class ActivitySummary(models.Model):
+    """Per-user totals shown on the activity page, kept up to date incrementally
+    by auctions.activity instead of being counted on every page view.
+    """
+    user = models.OneToOneField(User, primary_key=True, on_delete=models.CASCADE, related_name='activity_summary')
+    listings_count = models.PositiveIntegerField(default=0)
+    active_listings_count = models.PositiveIntegerField(default=0)
+    bids_count = models.PositiveIntegerField(default=0)
+    bidded_listings_count = models.PositiveIntegerField(default=0)
+    won_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Activity of {self.user}"
+
+
+class CategoryStats(models.Model):
+    """Number of active listings of a category and the range of their current
+    prices, kept up to date by auctions.categories as listings are created,
+    closed, moved between categories, deleted and bid on.
+    """
+    category = models.CharField(max_length=64, choices=Listing.LISTING_CATEGORIES, primary_key=True)
+    active_listings = models.PositiveIntegerField(default=0)
+    min_price = models.PositiveIntegerField(null=True, blank=True)
+    max_price = models.PositiveIntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_category_display()}: {self.active_listings} active listings"
+
+
+class NotificationEvent(models.Model):
+    """Queue of events waiting to be delivered to users by the notification worker
+    (see auctions.notifications). Rows are written in the same transaction as the
+    bid or closing that caused them.
+    """
+    OUTBID = 'outbid'
+    WON = 'won'
+    # Sent to the users watching the listing.
+    WATCHED_BID = 'watched_bid'
+    WATCHED_CLOSED = 'watched_closed'
+    KINDS = [
+        (OUTBID, 'Outbid'),
+        (WON, 'Auction won'),
+        (WATCHED_BID, 'New bid on a watched listing'),
+        (WATCHED_CLOSED, 'Watched auction ended'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_events')
+    kind = models.CharField(max_length=16, choices=KINDS)
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='+')
+    amount = models.PositiveIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+    # Set by the worker delivering the event, until it is delivered.
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} for {self.user}: listing {self.listing_id}"
+
+
+class WatcherEvent(models.Model):
+    """Event on a listing for all the users watching it, written with the bid or
+    closing that caused it and expanded into one NotificationEvent per watcher
+    by the notification worker, a batch of watchers at a time.
+    """
+    kind = models.CharField(max_length=16, choices=NotificationEvent.KINDS)
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='+')
+    amount = models.PositiveIntegerField()
+    # Ids of the users not to notify, e.g. the bidder.
+    excluded = models.JSONField(default=list, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    # Watchlist row the expansion continues after, set with every batch.
+    last_watch = models.PositiveBigIntegerField(default=0)
+    # Set by the worker expanding the event.
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} for the watchers of listing {self.listing_id}"
+
+
+class InboxMessage(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inbox')
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    created = models.DateTimeField(auto_now_add=True)
+    is_read = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ['-created']
+        indexes = [
+            models.Index(fields=['user', '-created'], name='inbox_user_created_idx')
+        ]
+
+    def __str__(self):
+        return f"{self.user}: {self.subject}"
+
+
+class BidStatsBucket(models.Model):
+    """Totals of the bids placed within one hour, kept up to date incrementally by
+    auctions.bidstats so charts never have to scan the bids themselves.
+    """
+    hour = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveBigIntegerField(default=0)
+    min_amount = models.PositiveIntegerField()
+    max_amount = models.PositiveIntegerField()
+
+    class Meta:
+        abstract = True
+
+    def as_dict(self) -> dict:
+        return {
+            'hour': self.hour.isoformat(),
+            'count': self.count,
+            'min': self.min_amount,
+            'max': self.max_amount,
+            'avg': round(self.total / self.count, 2),
+        }
+
+
+class ListingBidStats(BidStatsBucket):
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='bid_stats')
+
+    class Meta:
+        unique_together = [['listing', 'hour']]
+
+    def __str__(self):
+        return f"Listing {self.listing_id} at {self.hour}: {self.count} bids"
+
+
+class CategoryBidStats(BidStatsBucket):
+    # Bids count towards the category their listing had when they were placed.
+    category = models.CharField(max_length=64, choices=Listing.LISTING_CATEGORIES)
+
+    class Meta:
+        unique_together = [['category', 'hour']]
+
+    def __str__(self):
+        return f"{self.get_category_display()} at {self.hour}: {self.count} bids"
+
+
+class CategoryPricePercentiles(models.Model):
+    """Bid amount percentiles of a category over all of its bids, computed by the
+    compute_price_percentiles batch job.
+    """
+    category = models.CharField(max_length=64, choices=Listing.LISTING_CATEGORIES, primary_key=True)
+    bids_count = models.PositiveBigIntegerField()
+    # Maps the percentile ('50') to the bid amount.
+    percentiles = models.JSONField(default=dict)
+    computed = models.DateTimeField()
+
+    def __str__(self):
+        return f"Percentiles of {self.get_category_display()}"
+
+
+class ArchivedListing(models.Model):
+    """A listing closed long ago, moved out of the live tables by auctions.archive
+    with its final price and winner kept inline. It keeps the id it had as a
+    Listing, the ids of deleted listings are never reused.
+    """
+    id = models.PositiveIntegerField(primary_key=True)
+    title = models.CharField(max_length=64)
+    description = models.TextField()
+    image_url = models.URLField(blank=True)
+    image = models.ForeignKey(ListingImage, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    category = models.CharField(max_length=64, choices=Listing.LISTING_CATEGORIES)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_listings')
+    starting_price = models.PositiveIntegerField()
+    final_price = models.PositiveIntegerField()
+    bid_count = models.PositiveIntegerField()
+    created = models.DateTimeField()
+    ends_at = models.DateTimeField(null=True, blank=True)
+    closed_at = models.DateTimeField(null=True, blank=True)
+    winner = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='won_archived_listings')
+    archived = models.DateTimeField(auto_now_add=True)
+    # Only ever shown along with the listing, so kept inline as a list of
+    # {'owner', 'content', 'created', 'edited'}, oldest first.
+    comments = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"{self.title}: ${self.final_price} (archived)"
+
+
+class ArchivedBid(models.Model):
+    """A bid of an archived listing, kept as a row for the bid counts of users and
+    the bid statistics of categories.
+    """
+    listing = models.ForeignKey(ArchivedListing, on_delete=models.CASCADE, related_name='bids')
+    bidder = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_bids')
+    amount = models.PositiveIntegerField()
+    created = models.DateTimeField()
+
+    def __str__(self):
+        return f"Bidder: {self.bidder_id}, Listing: {self.listing_id} Bid: ${self.amount}"
+
+
+class SimilarListing(models.Model):
+    """One of the nearest neighbours of a listing by the similarity of their
+    titles and descriptions, computed in batches by auctions.similar.
+    """
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='similar_listings')
+    similar = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='+')
+    # 0 for the most similar listing.
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        # Also the index the listing page reads the neighbours from, in rank order.
+        unique_together = [['listing', 'rank']]
+
+    def __str__(self):
+        return f"{self.listing_id} -> {self.similar_id} ({self.score:.2f})"
+
+
+class SimilarityUpdate(models.Model):
+    """Listing created or edited since the similar listings were last computed.
+    """
+    listing = models.OneToOneField(Listing, primary_key=True, on_delete=models.CASCADE, related_name='+')
+    queued = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Similarity update of {self.listing_id}"
+
+
+class ListingVector(models.Model):
+    """TF-IDF vector of a listing as of its last similarity computation, the
+    hashed dimensions and their weights as packed arrays (see auctions.similar).
+    """
+    listing = models.OneToOneField(Listing, primary_key=True, on_delete=models.CASCADE, related_name='+')
+    dimensions = models.PositiveIntegerField()
+    indices = models.BinaryField()
+    weights = models.BinaryField()
+
+    def __str__(self):
+        return f"Vector of {self.listing_id}"
+
+
+class SimilarityIndex(models.Model):
+    """Inverse document frequencies of the last full build of the similar
+    listings, listings vectorized in between are weighed with them. A single row.
+    """
+    dimensions = models.PositiveIntegerField()
+    documents = models.PositiveIntegerField()
+    indices = models.BinaryField()
+    weights = models.BinaryField()
+    built = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return f"{self.owner}: {self.content}"
\ No newline at end of file
+        return f"Similarity index of {self.documents} listings"
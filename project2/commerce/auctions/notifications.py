@@ -0,0 +1,235 @@
+"""Outbid and auction won notifications.
+
+Views only insert NotificationEvent rows, in the transaction of the bid or
+closing that caused them. The users watching the listing, who can be too many
+to write from a request, get a single WatcherEvent instead. The
+deliver_notifications worker expands those into events for every watcher, a
+batch at a time, merges all pending events of a user into one digest once the
+oldest of them has waited for the coalescing window, and hands the digest to
+every configured sink (AUCTIONS_NOTIFICATION_SINKS).
+"""
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Collection, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import watchlist
+from .models import User, Listing, NotificationEvent, InboxMessage, WatcherEvent
+
+
+DEFAULT_SINKS = [
+    'auctions.notifications.InboxSink',
+    'auctions.notifications.EmailSink',
+]
+
+
+def enqueue_outbid(listing: Listing, outbid_user_id: int, amount: int):
+    NotificationEvent.objects.create(
+        user_id=outbid_user_id, kind=NotificationEvent.OUTBID, listing=listing, amount=amount
+    )
+
+
+def enqueue_won(listings: Iterable[Listing]):
+    """Expects listings with 'winner_id' and 'current_price' set.
+    """
+    NotificationEvent.objects.bulk_create([
+        NotificationEvent(user_id=l.winner_id, kind=NotificationEvent.WON, listing_id=l.id, amount=l.current_price)
+        for l in listings if l.winner_id is not None
+    ])
+
+
+def enqueue_watchers(listing_id: int, kind: str, amount: int, exclude: Collection[int] = ()):
+    """Queues an event for every user watching the listing but the excluded ones,
+    expanded by the worker (see expand_watcher_events()).
+    """
+    excluded = sorted(user_id for user_id in exclude if user_id is not None)
+    WatcherEvent.objects.create(listing_id=listing_id, kind=kind, amount=amount, excluded=excluded)
+
+
+def enqueue_watchers_closed(listings: Iterable[Listing]):
+    """Queues the end of the auctions for their watchers but the winners. Expects
+    listings with 'winner_id' and 'current_price' set.
+    """
+    WatcherEvent.objects.bulk_create([
+        WatcherEvent(listing_id=l.id, kind=NotificationEvent.WATCHED_CLOSED, amount=l.current_price,
+                     excluded=[l.winner_id] if l.winner_id is not None else [])
+        for l in listings
+    ])
+
+
+# One event per listing is shown, the first kind of these the user has one of.
+PRECEDENCE = [NotificationEvent.WON, NotificationEvent.WATCHED_CLOSED, NotificationEvent.OUTBID,
+              NotificationEvent.WATCHED_BID]
+
+
+class Digest:
+    """All pending events of one user, rendered into a single message. Only the
+    latest event per listing and kind is kept, and of those the one that matters
+    most: winning over the auction ending, which goes over being outbid, which
+    goes over new bids on a watched listing.
+    """
+
+    def __init__(self, user: User, events: List[NotificationEvent]):
+        self.user = user
+        self.events = events
+
+        latest = {}
+        for event in events:
+            latest[(event.kind, event.listing_id)] = event
+        shown = {}
+        for event in latest.values():
+            current = shown.get(event.listing_id)
+            if current is None or PRECEDENCE.index(event.kind) < PRECEDENCE.index(current.kind):
+                shown[event.listing_id] = event
+        self.items = [e for e in latest.values() if shown[e.listing_id] is e]
+
+    def _count(self, kind: str) -> int:
+        return sum(1 for e in self.items if e.kind == kind)
+
+    @property
+    def subject(self) -> str:
+        won = self._count(NotificationEvent.WON)
+        outbid = self._count(NotificationEvent.OUTBID)
+        watched = len(self.items) - won - outbid
+        parts = []
+        if won:
+            parts.append(f"you won {won} auction{'s' if won > 1 else ''}")
+        if outbid:
+            parts.append(f"you were outbid on {outbid} listing{'s' if outbid > 1 else ''}")
+        if watched:
+            parts.append(f"{watched} listing{'s' if watched > 1 else ''} you watch changed")
+        return ' and '.join(parts).capitalize()
+
+    @property
+    def body(self) -> str:
+        lines = []
+        for event in self.items:
+            if event.kind == NotificationEvent.WON:
+                lines.append(f"You won '{event.listing.title}' for ${event.amount}.")
+            elif event.kind == NotificationEvent.OUTBID:
+                lines.append(f"You were outbid on '{event.listing.title}', the current bid is ${event.amount}.")
+            elif event.kind == NotificationEvent.WATCHED_BID:
+                lines.append(f"'{event.listing.title}' you are watching has a new bid of ${event.amount}.")
+            else:
+                lines.append(f"The auction of '{event.listing.title}' you are watching has ended at ${event.amount}.")
+        return '\n'.join(lines)
+
+
+class InboxSink:
+
+    def deliver(self, digests: List[Digest]):
+        InboxMessage.objects.bulk_create([
+            InboxMessage(user=d.user, subject=d.subject, body=d.body) for d in digests
+        ])
+
+
+class EmailSink:
+    """Sends digests through the configured EMAIL_BACKEND, skipping users
+    without an e-mail address.
+    """
+
+    def deliver(self, digests: List[Digest]):
+        for d in digests:
+            if d.user.email:
+                send_mail(d.subject, d.body, None, [d.user.email])
+
+
+def get_sinks():
+    return [import_string(path)() for path in getattr(settings, 'AUCTIONS_NOTIFICATION_SINKS', DEFAULT_SINKS)]
+
+
+# Events claimed by a worker which never marked them delivered, e.g. because
+# it died while sending, are picked up again after this long.
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def expand_watcher_events(batch_size: int = 1000, now: Optional[datetime] = None) -> int:
+    """Queues the events of pending WatcherEvents for the watchers of their
+    listing, stopping once about 'batch_size' have been queued. Returns the
+    number of events queued.
+
+    Every batch of watchers is inserted in a transaction of its own, together
+    with the position reached, and an event is claimed while it is expanded,
+    so no watcher is notified twice.
+    """
+    now = now or timezone.now()
+    unclaimed = Q(claimed_at__isnull=True) | Q(claimed_at__lte=now - CLAIM_TIMEOUT)
+    queued = 0
+    while queued < batch_size:
+        event = WatcherEvent.objects.filter(unclaimed).order_by('pk').first()
+        if event is None:
+            break
+        # Claimed by another worker in the meantime.
+        if not WatcherEvent.objects.filter(pk=event.pk, claimed_at=event.claimed_at).update(claimed_at=now):
+            continue
+
+        excluded = set(event.excluded)
+        for last_watch, user_ids in watchlist.watcher_batches(event.listing_id, batch_size, after=event.last_watch):
+            with transaction.atomic():
+                queued += len(NotificationEvent.objects.bulk_create([
+                    NotificationEvent(user_id=user_id, kind=event.kind, listing_id=event.listing_id,
+                                      amount=event.amount)
+                    for user_id in user_ids if user_id not in excluded
+                ]))
+                WatcherEvent.objects.filter(pk=event.pk).update(last_watch=last_watch)
+            if queued >= batch_size:
+                # Continued by the next call, of this worker or another one.
+                WatcherEvent.objects.filter(pk=event.pk).update(claimed_at=None)
+                break
+        else:
+            event.delete()
+    return queued
+
+
+def deliver_pending(window: timedelta = timedelta(minutes=1), batch_size: int = 1000,
+                    now: Optional[datetime] = None, sinks=None) -> int:
+    """Delivers the digests of users whose oldest undelivered event is older than
+    'window', and marks their events as delivered. Returns the number of events
+    delivered.
+
+    The events are claimed in a short transaction of their own and sent outside
+    of any, so the database is not locked while mail is being sent, and other
+    workers skip them meanwhile.
+    """
+    now = now or timezone.now()
+    sinks = sinks if sinks is not None else get_sinks()
+
+    with transaction.atomic():
+        pending = list(
+            NotificationEvent.objects.filter(delivered_at__isnull=True)
+            .filter(Q(claimed_at__isnull=True) | Q(claimed_at__lte=now - CLAIM_TIMEOUT))
+            .select_related('user', 'listing')
+            .order_by('pk')[:batch_size]
+        )
+        by_user = defaultdict(list)
+        for event in pending:
+            by_user[event.user_id].append(event)
+
+        due = [events for events in by_user.values() if events[0].created <= now - window]
+        if not due:
+            return 0
+        claimed = [e.pk for events in due for e in events]
+        NotificationEvent.objects.filter(pk__in=claimed).update(claimed_at=now)
+
+    digests = [Digest(events[0].user, events) for events in due]
+    for sink in sinks:
+        sink.deliver(digests)
+    NotificationEvent.objects.filter(pk__in=claimed).update(delivered_at=now)
+    return len(claimed)
+
+
+def run_worker(window: timedelta, interval: float, batch_size: int = 1000, on_delivered=None):
+    while True:
+        expanded = expand_watcher_events(batch_size)
+        delivered = deliver_pending(window, batch_size)
+        if delivered and on_delivered is not None:
+            on_delivered(delivered)
+        if expanded < batch_size and delivered < batch_size:
+            time.sleep(interval)
@@ -0,0 +1,133 @@
+"""Proxy (automatic) bidding.
+
+Instead of a bid, a bidder can submit the private maximum they are willing to
+pay, and bids are then placed on their behalf up to it. Maxima are kept in a
+per-listing order book, the ProxyBid rows read in (listing, -max_amount, placed)
+index order. Every submission is resolved in one transaction: only the two
+leading maxima matter, the leader pays one more than the runner-up's maximum
+(or the runner-up's maximum itself when both are equal and the leader was
+first), and only the resulting visible bids are written. Two bidders outbidding
+each other with maxima far apart cost at most two Bid rows per submission
+instead of the whole chain of +1 bids.
+
+Plain bids go through the engine too, as maxima that are shown in full right
+away, so proxies respond to them.
+"""
+from typing import List, NamedTuple, Optional
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import User, Listing, Bid, NotificationEvent, ProxyBid
+from .notifications import enqueue_outbid, enqueue_watchers
+from .sqlite import retry_on_busy
+
+
+class Resolution(NamedTuple):
+    # Visible bids written by the submission, oldest first.
+    bids: List[Bid]
+    leader_id: int
+    price: int
+    # Previous leader who lost the lead, they are sent an outbid notification.
+    outbid_id: Optional[int]
+    # Number of bids on the listing, including the new ones.
+    bid_count: int
+
+
+class _Max(NamedTuple):
+    bidder_id: int
+    amount: int
+    # Whether bids are placed on the bidder's behalf, bids placed before proxy
+    # bidding existed only count as maxima equal to themselves.
+    automatic: bool
+
+
+def _leading_maxima(listing: Listing, leader: Optional[Bid]) -> List[_Max]:
+    book = [
+        _Max(bidder_id, amount, True) for bidder_id, amount in
+        ProxyBid.objects.filter(listing=listing).order_by('-max_amount', 'placed').values_list('bidder_id', 'max_amount')[:2]
+    ]
+    if leader is not None and not any(m.bidder_id == leader.bidder_id for m in book):
+        # The visible leader placed its bid first, it wins ties.
+        book.insert(0, _Max(leader.bidder_id, leader.amount, False))
+        book.sort(key=lambda m: -m.amount)
+    return book[:2]
+
+
+@retry_on_busy
+def submit(listing: Listing, user: User, amount: int, automatic: bool = True) -> Resolution:
+    """Records the maximum of the user for the listing and resolves the order
+    book. With automatic=False the amount is bid in full, like a plain bid.
+    Raises ValueError with a message for the user if the bid is not allowed.
+    """
+    with transaction.atomic():
+        # Writing to the listing first takes its row lock (the write lock of the
+        # whole database on SQLite), so the submissions to a listing are resolved
+        # one at a time and always see each other's results.
+        Listing.objects.filter(pk=listing.pk).update(version=F('version') + 1)
+        listing = Listing.objects.get(pk=listing.pk)
+
+        if user.id == listing.owner_id:
+            raise ValueError('Cannot place a bid for a listing that you are an owner of!')
+        if not listing.is_active or listing.has_ended():
+            raise ValueError('Auction for this listing has ended. No new bids are allowed!')
+
+        leader = listing.bids.only('bidder', 'amount').first()
+        price = leader.amount if leader is not None else None
+        min_bid = listing.starting_price if leader is None else price + 1
+        own = ProxyBid.objects.filter(listing=listing, bidder=user).first()
+
+        if automatic and leader is not None and leader.bidder_id == user.id:
+            # The leader only raises their maximum, the price stays the same.
+            current_max = max(price, own.max_amount) if own is not None else price
+            if amount <= current_max:
+                raise ValueError(f'Your maximum bid must be more than ${current_max}')
+        elif amount < min_bid:
+            raise ValueError(f'Minimal bid not met! Bid must be at least ${min_bid}')
+
+        if own is None:
+            ProxyBid.objects.create(listing=listing, bidder=user, max_amount=amount)
+        elif amount > own.max_amount:
+            own.max_amount = amount
+            own.placed = timezone.now()
+            own.save(update_fields=['max_amount', 'placed'])
+
+        first, *rest = _leading_maxima(listing, leader)
+        second = rest[0] if rest else None
+
+        # The leader pays the least that beats the runner-up, never less than the
+        # current price or than what a new leader has to bid.
+        floor = price if leader is not None and first.bidder_id == leader.bidder_id else min_bid
+        new_price = floor
+        if second is not None:
+            new_price = max(new_price, second.amount if second.amount == first.amount else second.amount + 1)
+        if not automatic and first.bidder_id == user.id:
+            new_price = max(new_price, amount)
+        new_price = min(new_price, first.amount)
+
+        bids = []
+        if not automatic and first.bidder_id != user.id:
+            # The plain bid is shown even though a proxy outbids it at once.
+            bids.append(Bid(listing=listing, bidder=user, amount=amount))
+        elif (second is not None and second.automatic and second.bidder_id != first.bidder_id
+              and (price is None or second.amount > price) and second.amount < new_price):
+            # The runner-up's proxy went up to its maximum before being beaten.
+            bids.append(Bid(listing=listing, bidder_id=second.bidder_id, amount=second.amount))
+        if leader is None or first.bidder_id != leader.bidder_id or new_price != price:
+            winning = Bid(listing=listing, bidder_id=first.bidder_id, amount=new_price)
+            # On equal amounts the earliest bid wins, so the winning one goes first.
+            if bids and bids[-1].amount == new_price:
+                bids.insert(0, winning)
+            else:
+                bids.append(winning)
+        for bid in bids:
+            bid.save()
+
+        outbid_id = None
+        if leader is not None and leader.bidder_id != first.bidder_id:
+            outbid_id = leader.bidder_id
+            enqueue_outbid(listing, outbid_id, new_price)
+        if bids:
+            enqueue_watchers(listing.id, NotificationEvent.WATCHED_BID, new_price, exclude={user.id, first.bidder_id})
+        return Resolution(bids, first.bidder_id, new_price, outbid_id, listing.bid_count + len(bids))
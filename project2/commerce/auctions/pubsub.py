@@ -0,0 +1,219 @@
+"""In-process publish/subscribe layer used to push live listing updates to
+browsers. The broker class is selected with the AUCTIONS_PUBSUB setting, in the
+same BACKEND/OPTIONS form as CACHES.
+"""
+import asyncio
+import atexit
+import json
+import os
+import socket
+import threading
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+DEFAULT_PUBSUB = {
+    'BACKEND': 'auctions.pubsub.LocalBroker',
+    'OPTIONS': {},
+}
+
+
+class Subscription:
+    """A single consumer of a channel, bound to the event loop it subscribed from.
+
+    Pending messages are kept in a bounded queue. When a slow consumer lets the
+    queue fill up, the oldest message is dropped to make room for the newest one,
+    since only the latest state of a listing is worth delivering.
+    """
+
+    def __init__(self, broker, channel: str, loop: asyncio.AbstractEventLoop, max_pending: int):
+        self.broker = broker
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.dropped = 0
+
+    def deliver(self, message: dict):
+        """Hands a message over to the subscriber's loop. Safe to call from any thread.
+        """
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The loop has been closed under us, nobody is listening anymore.
+            self.close()
+
+    def _put(self, message: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """Fans messages out to subscribers living in the current process.
+    """
+
+    def __init__(self, max_pending: int = 16):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._channels = defaultdict(set)
+
+    def subscribe(self, channel: str) -> Subscription:
+        """Must be called from a running event loop, messages are delivered to it.
+        """
+        sub = Subscription(self, channel, asyncio.get_running_loop(), self.max_pending)
+        with self._lock:
+            self._channels[channel].add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            subs = self._channels.get(sub.channel)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._channels[sub.channel]
+
+    def publish(self, channel: str, message: dict):
+        self._fanout(channel, message)
+
+    def _fanout(self, channel: str, message: dict):
+        with self._lock:
+            subs = list(self._channels.get(channel, ()))
+        for sub in subs:
+            sub.deliver(message)
+
+
+class SocketBroker(LocalBroker):
+    """Stand-in for an external broker which fans messages out across worker
+    processes on the same host.
+
+    Every process binds a Unix datagram socket inside a shared directory. On
+    start it reads the directory once and announces itself to the sockets found
+    there, which add it to their registry of peers, and it says goodbye and
+    removes its socket on close(). Publishing sends the message to the registered
+    peers only. Sends never block, if a worker is not draining its socket fast
+    enough the message is dropped for that worker only, and peers which are gone
+    are dropped from the registry.
+    """
+
+    def __init__(self, path: str = '/tmp/auctions-pubsub', max_pending: int = 16):
+        super().__init__(max_pending=max_pending)
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        self._address = os.path.join(path, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.sock')
+        self._recv_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._recv_sock.bind(self._address)
+        self._send_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._send_sock.setblocking(False)
+        self._closed = False
+
+        self._peers = {self._address}
+        self._peers_lock = threading.Lock()
+        peers = [os.path.join(path, name) for name in os.listdir(path) if name.endswith('.sock')]
+        self._send({'join': self._address}, [peer for peer in peers if peer != self._address], register=True)
+
+        self._thread = threading.Thread(target=self._receive, name='auctions-pubsub', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def peers(self) -> list:
+        with self._peers_lock:
+            return sorted(self._peers)
+
+    def publish(self, channel: str, message: dict):
+        self._send({'channel': channel, 'message': message}, self.peers())
+
+    def _send(self, data: dict, addresses, register: bool = False):
+        payload = json.dumps(data).encode('utf-8')
+        for address in addresses:
+            try:
+                self._send_sock.sendto(payload, address)
+            except BlockingIOError:
+                pass
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Socket left behind by a worker that is gone.
+                self._forget(address)
+                try:
+                    os.unlink(address)
+                except FileNotFoundError:
+                    pass
+            else:
+                if register:
+                    with self._peers_lock:
+                        self._peers.add(address)
+
+    def _forget(self, address: str):
+        with self._peers_lock:
+            self._peers.discard(address)
+
+    def _receive(self):
+        while True:
+            try:
+                payload = self._recv_sock.recv(65536)
+            except OSError:
+                return
+            if self._closed:
+                return
+            try:
+                data = json.loads(payload)
+            except ValueError:
+                continue
+            if 'join' in data:
+                with self._peers_lock:
+                    self._peers.add(data['join'])
+            elif 'leave' in data:
+                self._forget(data['leave'])
+            else:
+                self._fanout(data['channel'], data['message'])
+
+    def close(self):
+        """Leaves the registry of the other workers and removes the socket.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self._send({'leave': self._address}, [peer for peer in self.peers() if peer != self._address])
+        # Wakes the receiving thread up, it sees the broker is closed.
+        try:
+            self._send_sock.sendto(b'', self._address)
+        except OSError:
+            pass
+        self._thread.join(timeout=1)
+        try:
+            os.unlink(self._address)
+        except FileNotFoundError:
+            pass
+        self._recv_sock.close()
+        self._send_sock.close()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Returns the process wide broker configured by the AUCTIONS_PUBSUB setting.
+    """
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                conf = getattr(settings, 'AUCTIONS_PUBSUB', DEFAULT_PUBSUB)
+                _broker = import_string(conf['BACKEND'])(**conf.get('OPTIONS', {}))
+    return _broker
+
+
+def listing_channel(listing_id: int) -> str:
+    return f'listing-{listing_id}'
@@ -0,0 +1,61 @@
+"""Database routing between the primary database and its read replicas.
+
+Writes always go to the primary ('default'). Reads go to one of the aliases
+listed in the DATABASE_REPLICAS setting, except while the current request is
+pinned to the primary: during unsafe (writing) requests, and for
+REPLICA_STICKY_SECONDS after a session wrote something, so users always read
+their own writes even when the replicas lag behind. Pinning is handled by
+ReplicaStickinessMiddleware.
+"""
+import random
+
+from asgiref.local import Local
+from django.conf import settings
+
+
+PRIMARY = 'default'
+
+_state = Local()
+
+
+def pin_to_primary(pinned: bool = True):
+    _state.pinned = pinned
+
+
+def is_pinned() -> bool:
+    return getattr(_state, 'pinned', False)
+
+
+def reset_state():
+    _state.pinned = False
+    _state.wrote = False
+
+
+def has_written() -> bool:
+    return getattr(_state, 'wrote', False)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        # A lagging replica would log users out right after they logged in.
+        if not replicas or is_pinned() or model._meta.app_label == 'sessions':
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # Saving the session is not a write the user could read back.
+        if model._meta.app_label != 'sessions':
+            _state.wrote = True
+            # Reads later in the same request must see this write.
+            _state.pinned = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication.
+        return db == PRIMARY
@@ -0,0 +1,60 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import activity, backends, bidstats, categories, coalescing, similar
+from .models import User, Listing, Bid, Comment
+
+
+def bump_listing_version(listing_id: int):
+    """Invalidates every cached fragment of a listing by moving its version forward.
+    """
+    Listing.objects.filter(pk=listing_id).update(version=F('version') + 1)
+    coalescing.listing_pages.invalidate_on_commit(listing_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance: User, **kwargs):
+    backends.forget_user(instance.pk)
+
+
+@receiver(post_save, sender=Listing)
+def listing_saved(sender, instance: Listing, created: bool, **kwargs):
+    similar.listing_changed(instance.pk)
+    if created:
+        activity.listing_created(instance)
+        categories.listings_created([instance])
+    else:
+        # Listing.save() has bumped the version.
+        coalescing.listing_pages.invalidate_on_commit(instance.pk)
+
+
+@receiver(post_delete, sender=Listing)
+def listing_deleted(sender, instance: Listing, **kwargs):
+    activity.listing_deleted(instance)
+    categories.listing_deleted(instance)
+
+
+@receiver([post_save, post_delete], sender=Bid)
+def bid_changed(sender, instance: Bid, **kwargs):
+    Listing.objects.filter(pk=instance.listing_id).refresh_prices()
+    categories.prices_changed([instance.listing_id])
+    coalescing.listing_pages.invalidate_on_commit(instance.listing_id)
+
+
+@receiver(post_save, sender=Bid)
+def bid_saved(sender, instance: Bid, created: bool, **kwargs):
+    if created:
+        activity.bid_placed(instance)
+        bidstats.record_bids([instance])
+
+
+@receiver(post_delete, sender=Bid)
+def bid_deleted(sender, instance: Bid, **kwargs):
+    activity.rebuild_summaries([instance.bidder_id])
+    bidstats.bid_removed(instance)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def comment_changed(sender, instance: Comment, **kwargs):
+    bump_listing_version(instance.listing_id)
@@ -0,0 +1,301 @@
+"""Precomputed "similar listings" of every active listing.
+
+Titles and descriptions are turned into hashed n-gram TF-IDF vectors: words and
+pairs of consecutive words (the title counting twice) are hashed into a fixed
+number of dimensions, weighted by their inverse document frequency among the
+active listings and normalized, so the dot product of two vectors is their
+cosine similarity. The top-k nearest neighbours of each listing are found with
+blocked matrix multiplication, one block of rows against all listings at a time,
+so memory stays bounded by the block size, and stored in SimilarListing. The
+listing page then reads them with one indexed query.
+
+build_all() recomputes every list, and stores the IDF weights and the vectors
+(ListingVector, SimilarityIndex). update_queued() only vectorizes the listings
+created or edited since the last run (queued in SimilarityUpdate by
+signals.py), with the stored IDF weights, computes their lists against the
+stored vectors of the others and merges them into the lists of the listings
+they became similar to. Lists a changed listing no longer belongs to, and the
+IDF weights, which drift as listings come and go, are only brought up to date
+by the next full build.
+
+NumPy is required. SciPy sparse matrices are used when SciPy is installed,
+otherwise vectors are dense with fewer hashed dimensions.
+"""
+import math
+import re
+import zlib
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Listing, ListingVector, SimilarListing, SimilarityIndex, SimilarityUpdate
+
+
+SPARSE_DIMENSIONS = 2 ** 18
+DENSE_DIMENSIONS = 2 ** 10
+BLOCK_SIZE = 256
+# Incremental updates offer a changed listing to the lists of its
+# CANDIDATES_FACTOR * k nearest neighbours.
+CANDIDATES_FACTOR = 4
+# Neighbours scoring below this share next to nothing with the listing.
+MIN_SCORE = 0.05
+
+WORD_RE = re.compile(r'\w+')
+
+
+def neighbours_count() -> int:
+    return getattr(settings, 'AUCTIONS_SIMILAR_LISTINGS', 6)
+
+
+def features(title: str, description: str, dimensions: int) -> Counter:
+    """Counts of the hashed words and word pairs of a listing.
+    """
+    words = WORD_RE.findall(f'{title} {title} {description}'.lower())
+    grams = words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+    return Counter(zlib.crc32(gram.encode()) % dimensions for gram in grams)
+
+
+def _sparse():
+    try:
+        from scipy import sparse
+    except ImportError:
+        return None
+    return sparse
+
+
+def dimensions() -> int:
+    return SPARSE_DIMENSIONS if _sparse() is not None else DENSE_DIMENSIONS
+
+
+class Idf:
+    """Inverse document frequencies of the hashed dimensions among 'documents'
+    listings. Dimensions none of them had get the highest weight.
+    """
+
+    def __init__(self, documents: int, weights: Dict[int, float]):
+        self.documents = documents
+        self.weights = weights
+        self.unseen = math.log(1 + documents) + 1
+
+    @classmethod
+    def of(cls, counts: List[Counter]) -> 'Idf':
+        document_frequency = Counter()
+        for c in counts:
+            document_frequency.update(c.keys())
+        return cls(len(counts), {
+            d: math.log((1 + len(counts)) / (1 + n)) + 1 for d, n in document_frequency.items()
+        })
+
+    def vector(self, counts: Counter) -> Tuple[List[int], List[float]]:
+        """The normalized weights of the dimensions of a listing.
+        """
+        weights = {d: tf * self.weights.get(d, self.unseen) for d, tf in counts.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        return list(weights), [w / norm for w in weights.values()]
+
+
+class Vectors:
+    """Normalized TF-IDF vectors of the active listings, one row per listing.
+    """
+
+    def __init__(self, ids: List[int], vectors: Iterable[Tuple[Sequence[int], Sequence[float]]], dimensions: int):
+        import numpy as np
+        sparse = _sparse()
+
+        self.ids = ids
+        self.rows = {listing_id: row for row, listing_id in enumerate(ids)}
+        indptr, indices, data = [0], [], []
+        for row_indices, row_data in vectors:
+            indices.append(np.asarray(row_indices, dtype=np.int32))
+            data.append(np.asarray(row_data, dtype=np.float32))
+            indptr.append(indptr[-1] + len(row_indices))
+        indices = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32)
+        data = np.concatenate(data) if data else np.zeros(0, dtype=np.float32)
+
+        if sparse is not None:
+            self.matrix = sparse.csr_matrix((data, indices, np.array(indptr)), shape=(len(ids), dimensions))
+        else:
+            self.matrix = np.zeros((len(ids), dimensions), dtype=np.float32)
+            for row in range(len(ids)):
+                start, end = indptr[row], indptr[row + 1]
+                self.matrix[row, indices[start:end]] = data[start:end]
+        self.sparse = sparse is not None
+
+    def scores(self, rows: List[int]):
+        """Dense block of the similarities of the given rows with all rows.
+        """
+        block = self.matrix[rows] @ self.matrix.T
+        return block.toarray() if self.sparse else block
+
+    def nearest(self, rows: List[int], k: int) -> Dict[int, List[Tuple[int, float]]]:
+        """Top-k (listing id, score) of the listings of the given rows, computed
+        BLOCK_SIZE rows at a time.
+        """
+        import numpy as np
+
+        result = {}
+        for start in range(0, len(rows), BLOCK_SIZE):
+            block_rows = rows[start:start + BLOCK_SIZE]
+            scores = self.scores(block_rows)
+            for i, row in enumerate(block_rows):
+                scores[i, row] = -1
+            if len(self.ids) > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            else:
+                top = np.tile(np.arange(len(self.ids)), (len(block_rows), 1))
+            for i, row in enumerate(block_rows):
+                candidates = sorted(((float(scores[i, j]), self.ids[j]) for j in top[i]), reverse=True)
+                result[self.ids[row]] = [(pk, score) for score, pk in candidates if score >= MIN_SCORE]
+        return result
+
+
+def _pack(indices: Sequence[int], weights: Sequence[float]) -> Tuple[bytes, bytes]:
+    return array('i', indices).tobytes(), array('f', weights).tobytes()
+
+
+def _unpack(indices: bytes, weights: bytes) -> Tuple[array, array]:
+    unpacked = array('i'), array('f')
+    unpacked[0].frombytes(indices)
+    unpacked[1].frombytes(weights)
+    return unpacked
+
+
+def _vectorize(rows: List[Tuple[int, str, str]], idf: Idf, dims: int) -> Dict[int, Tuple[List[int], List[float]]]:
+    """Vectors of the given (id, title, description) rows, which are stored for
+    later incremental updates.
+    """
+    vectors, stored = {}, []
+    for pk, title, description in rows:
+        vectors[pk] = idf.vector(features(title, description, dims))
+        indices, weights = _pack(*vectors[pk])
+        stored.append(ListingVector(listing_id=pk, dimensions=dims, indices=indices, weights=weights))
+    ListingVector.objects.filter(listing_id__in=list(vectors)).delete()
+    ListingVector.objects.bulk_create(stored, batch_size=1000)
+    return vectors
+
+
+def _store(neighbours: Dict[int, List[Tuple[int, float]]]):
+    SimilarListing.objects.filter(listing_id__in=list(neighbours)).delete()
+    SimilarListing.objects.bulk_create([
+        SimilarListing(listing_id=listing_id, similar_id=similar_id, rank=rank, score=score)
+        for listing_id, similar in neighbours.items()
+        for rank, (similar_id, score) in enumerate(similar)
+    ], batch_size=1000)
+    # The similar listings fragment of the listing page is cached per similar_version.
+    Listing.objects.filter(pk__in=list(neighbours)).update(similar_version=F('similar_version') + 1)
+
+
+def build_all() -> int:
+    """Recomputes the IDF weights, the vectors and the similar listings of every
+    active listing. Returns the number of listings.
+    """
+    dims = dimensions()
+    rows = list(Listing.objects.filter(is_active=True).order_by('pk').values_list('pk', 'title', 'description'))
+    idf = Idf.of([features(title, description, dims) for _, title, description in rows])
+    with transaction.atomic():
+        ListingVector.objects.all().delete()
+        vectors = _vectorize(rows, idf, dims)
+    ids = [pk for pk, _, _ in rows]
+    neighbours = Vectors(ids, (vectors[pk] for pk in ids), dims).nearest(list(range(len(ids))), neighbours_count())
+    indices, weights = _pack(list(idf.weights), list(idf.weights.values()))
+    with transaction.atomic():
+        SimilarityIndex.objects.update_or_create(pk=1, defaults={
+            'dimensions': dims, 'documents': idf.documents, 'indices': indices, 'weights': weights
+        })
+        SimilarListing.objects.all().delete()
+        SimilarityUpdate.objects.all().delete()
+        _store(neighbours)
+    return len(neighbours)
+
+
+def update_queued() -> int:
+    """Computes the similar listings of the queued listings, and adds them to the
+    lists of other listings they score better than the last neighbour of.
+    Only the queued listings are vectorized, with the IDF weights of the last
+    full build, the others are read back as stored. Returns the number of
+    listings whose list changed.
+    """
+    started = timezone.now()
+    queued = set(SimilarityUpdate.objects.filter(queued__lte=started).values_list('listing_id', flat=True))
+    if not queued:
+        return 0
+    dims = dimensions()
+    index = SimilarityIndex.objects.filter(pk=1).first()
+    if index is None or index.dimensions != dims:
+        return build_all()
+    idf = Idf(index.documents, dict(zip(*_unpack(index.indices, index.weights))))
+
+    vectors = {
+        pk: _unpack(indices, weights) for pk, indices, weights in
+        ListingVector.objects.filter(listing__is_active=True, dimensions=dims).exclude(listing_id__in=queued)
+        .values_list('listing_id', 'indices', 'weights').iterator()
+    }
+    # Listings without a vector yet, e.g. loaded in bulk, are vectorized too.
+    ids = list(Listing.objects.filter(is_active=True).order_by('pk').values_list('pk', flat=True))
+    missing = [pk for pk in ids if pk not in vectors]
+    with transaction.atomic():
+        vectors.update(_vectorize(
+            list(Listing.objects.filter(pk__in=missing).values_list('pk', 'title', 'description')), idf, dims
+        ))
+
+    k = neighbours_count()
+    matrix = Vectors(ids, (vectors[pk] for pk in ids), dims)
+    changed_rows = [matrix.rows[pk] for pk in missing]
+    # The wider lists are the candidates for the lists of the other listings.
+    wide = matrix.nearest(changed_rows, k * CANDIDATES_FACTOR)
+    neighbours = {listing_id: similar[:k] for listing_id, similar in wide.items()}
+
+    changed_ids = set(neighbours)
+    candidates = defaultdict(list)
+    for listing_id, similar in wide.items():
+        for similar_id, score in similar:
+            if similar_id not in changed_ids:
+                candidates[similar_id].append((listing_id, score))
+
+    if candidates:
+        current = defaultdict(list)
+        for listing_id, similar_id, score in (
+            SimilarListing.objects.filter(listing_id__in=list(candidates)).order_by('listing_id', 'rank')
+            .values_list('listing_id', 'similar_id', 'score')
+        ):
+            current[listing_id].append((similar_id, score))
+        for listing_id, new in candidates.items():
+            kept = [(pk, score) for pk, score in current[listing_id] if pk not in changed_ids]
+            merged = sorted(kept + new, key=lambda n: -n[1])[:k]
+            if merged != current[listing_id]:
+                neighbours[listing_id] = merged
+
+    with transaction.atomic():
+        _store(neighbours)
+        # Listings queued again while this ran stay queued.
+        SimilarityUpdate.objects.filter(queued__lte=started).delete()
+    return len(neighbours)
+
+
+def listing_changed(listing_id: int):
+    if not SimilarityUpdate.objects.filter(listing_id=listing_id).update(queued=timezone.now()):
+        SimilarityUpdate.objects.bulk_create([SimilarityUpdate(listing_id=listing_id)], ignore_conflicts=True)
+
+
+def listings_changed(listing_ids: List[int]):
+    """Queues many listings at once, e.g. bulk loaded ones.
+    """
+    SimilarityUpdate.objects.filter(listing_id__in=listing_ids).update(queued=timezone.now())
+    SimilarityUpdate.objects.bulk_create(
+        [SimilarityUpdate(listing_id=listing_id) for listing_id in listing_ids], ignore_conflicts=True, batch_size=1000
+    )
+
+
+def similar_listings(listing_id: int) -> List[Listing]:
+    """The active similar listings of a listing, most similar first.
+    """
+    return [
+        s.similar for s in
+        SimilarListing.objects.filter(listing_id=listing_id, similar__is_active=True)
+        .select_related('similar__image').order_by('rank')
+    ]
@@ -0,0 +1,72 @@
+"""SQLite database backend for a site serving concurrent requests.
+
+Use it with ENGINE 'auctions.sqlite'. Every connection is configured when it
+opens with the PRAGMAS of its DATABASES entry (DEFAULT_PRAGMAS otherwise):
+write-ahead logging, so readers and the writer do not block each other,
+synchronous=NORMAL, which stays durable in WAL mode and only syncs at
+checkpoints, a memory-mapped database file, a larger page cache and a busy
+timeout for which a writer waits for the write lock instead of failing with
+"database is locked" right away.
+
+Transactions start with BEGIN IMMEDIATE (TRANSACTION_MODE), taking the write
+lock up front: a deferred transaction that reads before it writes has to
+upgrade its lock later, and SQLite fails the upgrade at once, without waiting
+for the busy timeout, when another connection holds the lock.
+
+Connections are kept across requests for CONN_MAX_AGE seconds. Django only
+checks them after a database error, with CONN_HEALTH_CHECKS a reused connection
+is also checked once per request before its first query, and replaced if it no
+longer works. Statements outside transactions are retried when the database
+stays busy beyond the timeout, transactions can be retried as a whole with
+retry_on_busy().
+"""
+import functools
+import time
+
+from django.db import connections
+from django.db.utils import OperationalError
+
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    # Bytes, pages are read straight from the mapped file.
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative sizes are in KiB.
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+DEFAULT_TRANSACTION_MODE = 'IMMEDIATE'
+
+BUSY_RETRIES = 3
+# Seconds, doubled after every attempt.
+BUSY_BACKOFF = 0.05
+
+
+def is_busy(error: Exception) -> bool:
+    """Whether the error is SQLITE_BUSY, another connection holding a lock. Not
+    to be confused with SQLITE_LOCKED ("database table is locked"), a conflict
+    within a shared cache, which waiting does not resolve.
+    """
+    return str(error).startswith('database is locked')
+
+
+def retry_on_busy(func=None, *, using: str = 'default', retries: int = BUSY_RETRIES):
+    """Runs the decorated function again when it fails on a busy database. Only
+    the outermost transaction can be retried, so within an atomic block the
+    error is raised as is.
+    """
+    if func is None:
+        return functools.partial(retry_on_busy, using=using, retries=retries)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if attempt == retries or not is_busy(e) or connections[using].in_atomic_block:
+                    raise
+                time.sleep(BUSY_BACKOFF * 2 ** attempt)
+    return wrapper
@@ -0,0 +1,73 @@
+import time
+
+from django.db.backends.sqlite3 import base
+
+from . import BUSY_BACKOFF, BUSY_RETRIES, DEFAULT_PRAGMAS, DEFAULT_TRANSACTION_MODE, is_busy
+
+
+Database = base.Database
+
+
+class SQLiteCursorWrapper(base.SQLiteCursorWrapper):
+    """Retries statements run outside a transaction on SQLITE_BUSY. A failed
+    statement of a transaction cannot be retried alone, see retry_on_busy().
+    """
+
+    def _retry(self, method, *args):
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                return method(*args)
+            except Database.OperationalError as e:
+                if attempt == BUSY_RETRIES or not is_busy(e) or self.connection.in_transaction:
+                    raise
+                time.sleep(BUSY_BACKOFF * 2 ** attempt)
+
+    def execute(self, query, params=None):
+        return self._retry(super().execute, query, params)
+
+    def executemany(self, query, param_list):
+        return self._retry(super().executemany, query, param_list)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict.get('PRAGMAS', DEFAULT_PRAGMAS).items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def init_connection_state(self):
+        super().init_connection_state()
+        self.health_check_done = True
+
+    def create_cursor(self, name=None):
+        return self.connection.cursor(factory=SQLiteCursorWrapper)
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict.get('TRANSACTION_MODE', DEFAULT_TRANSACTION_MODE)
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
+
+    def is_usable(self):
+        try:
+            self.connection.execute('SELECT 1')
+        except Database.Error:
+            return False
+        return True
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # Called when a request starts and ends, the next one checks again.
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (self.connection is not None and not self.health_check_done and not self.in_atomic_block
+                and self.settings_dict.get('CONN_HEALTH_CHECKS')):
+            self.health_check_done = True
+            if not self.is_usable():
+                self.close()
+        super().ensure_connection()
@@ -0,0 +1,70 @@
+"""Server-Sent Events endpoint with live bid updates for the listing page.
+
+The events stream is served directly on the ASGI layer, so an open connection
+holds neither a thread nor a database connection while it waits for bids.
+"""
+import asyncio
+import json
+
+from django.urls import Resolver404, resolve
+
+from .pubsub import get_broker, listing_channel
+
+
+# Comment line sent on idle connections so proxies do not time them out.
+KEEPALIVE_INTERVAL = 15
+
+
+async def listing_events(scope, receive, send, listing_id: int):
+    sub = get_broker().subscribe(listing_channel(listing_id))
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+    message = asyncio.ensure_future(sub.get())
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        while True:
+            done, _ = await asyncio.wait(
+                {message, disconnect}, timeout=KEEPALIVE_INTERVAL, return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnect in done:
+                break
+            if message in done:
+                body = f'event: bid\ndata: {json.dumps(message.result())}\n\n'
+                message = asyncio.ensure_future(sub.get())
+            else:
+                body = ': keepalive\n\n'
+            await send({'type': 'http.response.body', 'body': body.encode('utf-8'), 'more_body': True})
+    finally:
+        sub.close()
+        message.cancel()
+        disconnect.cancel()
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def listing_events_router(django_application):
+    """Wraps the Django ASGI application and takes over requests routed to the
+    'listing_events' URL, everything else is passed through to Django.
+    """
+
+    async def application(scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            try:
+                match = resolve(scope['path'])
+            except Resolver404:
+                match = None
+            if match is not None and match.url_name == 'listing_events':
+                return await listing_events(scope, receive, send, **match.kwargs)
+        return await django_application(scope, receive, send)
+
+    return application
@@ -0,0 +1,34 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from ..images import thumbnail_path
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def listing_img(listing, sizes: str = '(min-width: 768px) 33vw, 100vw', css_class: str = 'img-fluid'):
+    """Renders the <img> of a listing. Locally stored images get a srcset of their
+    thumbnails, linked images are used as they are, and listings without an
+    image get the placeholder. Expects 'image' to be select_related().
+    """
+    if listing.image_id is not None:
+        image = listing.image
+        if image.thumbnail_widths:
+            widths = sorted(image.thumbnail_widths)
+            srcset = ', '.join(f'{default_storage.url(thumbnail_path(image.sha256, w))} {w}w' for w in widths)
+            srcset += f', {default_storage.url(image.original)} {image.width}w'
+            return format_html(
+                '<img class="{}" src="{}" srcset="{}" sizes="{}" width="{}" height="{}" loading="lazy" alt="">',
+                css_class, default_storage.url(thumbnail_path(image.sha256, widths[0])), srcset, sizes,
+                image.width, image.height
+            )
+        src = default_storage.url(image.original)
+    elif listing.image_url:
+        src = listing.image_url
+    else:
+        src = static('imgs/no_image_available.jpg')
+    return format_html('<img class="{}" src="{}" loading="lazy" alt="">', css_class, src)
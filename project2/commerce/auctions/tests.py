@@ -1,3 +1,1361 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import http.server
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.db.models import F
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    activity, archive, backends, benchmark, bidstats, categories, coalescing, images, notifications, proxybids, pubsub,
+    similar, streaming, watchlist
+)
+from .comments import comments_page
+from .expiry import ExpiryScheduler, close_listings
+from .models import (
+    User, Listing, ListingImage, Bid, Comment, ActivitySummary, ArchivedListing, CategoryBidStats, CategoryStats,
+    ListingBidStats, ListingVector, NotificationEvent, SimilarityUpdate, WatcherEvent
+)
+from .sqlite import retry_on_busy
+from .sqlite.base import DatabaseWrapper
+
+from PIL import Image
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STICKY_SECONDS=5)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Runs against a replica of its own, a second SQLite database which only
+    catches up with the primary when sync_replicas copies it over, so it is
+    stale whenever the test wants it to be.
+    """
+
+    def setUp(self):
+        coalescing.listing_pages.clear()
+        caches['fragments'].clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connections.databases['replica'] = {
+            'ENGINE': 'auctions.sqlite', 'NAME': os.path.join(directory.name, 'replica.sqlite3'),
+        }
+        self.addCleanup(self.remove_replica)
+
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'pass')
+        self.listing = Listing.objects.create(title='Lamp', description='Desk lamp', owner=self.owner, starting_price=10)
+        self.sync_replicas()
+
+    def remove_replica(self):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+
+    def sync_replicas(self):
+        call_command('sync_replicas', stdout=StringIO())
+
+    def price(self, client) -> str:
+        coalescing.listing_pages.clear()
+        response = client.get(reverse('listing', args=[self.listing.id]))
+        self.assertEqual(response.status_code, 200)
+        return re.search(r'\$\d+', response.content.decode()).group()
+
+    def bid(self, amount: int):
+        self.client.force_login(self.bidder)
+        response = self.client.post(reverse('new_bid', args=[self.listing.id]), {'amount': amount})
+        self.assertEqual(response.status_code, 302)
+
+    def test_anonymous_reads_go_to_replica(self):
+        Listing.objects.filter(pk=self.listing.pk).update(starting_price=12, current_price=12, version=F('version') + 1)
+        self.assertEqual(self.price(self.client_class()), '$10')
+        self.sync_replicas()
+        self.assertEqual(self.price(self.client_class()), '$12')
+
+    def test_session_reads_own_writes_from_primary(self):
+        self.bid(15)
+        # The replica does not have the bid yet, the bidder reads it anyway.
+        self.assertEqual(self.price(self.client), '$15')
+
+    def test_stickiness_expires(self):
+        self.bid(15)
+        with mock.patch('auctions.middleware.time.time', return_value=time.time() + 60):
+            self.assertEqual(self.price(self.client), '$10')
+
+    def test_other_sessions_are_not_pinned(self):
+        self.bid(15)
+        owner = self.client_class()
+        owner.force_login(self.owner)
+        self.assertEqual(self.price(owner), '$10')
+        self.assertEqual(self.price(self.client_class()), '$10')
+
+
+class BenchmarkJourneyTests(TestCase):
+
+    def test_journeys_cover_routes_without_errors(self):
+        caches['fragments'].clear()
+        counts = benchmark.seed(500)
+        self.assertEqual(User.objects.count(), counts['users'])
+
+        report = benchmark.run(virtual_users=1, iterations=2)
+        self.assertEqual(report['errors'], 0)
+        # Serving images needs image files, which the seeded data does not have.
+        self.assertEqual(report['not_covered'], ['listing_image'])
+        self.assertEqual(report['routes']['new_bid']['statuses'], {'302': 2})
+        # Counts and price ranges come from CategoryStats.
+        self.assertEqual(report['routes']['categories']['queries_max'], 1)
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+class SessionAuthQueryTests(TestCase):
+
+    def setUp(self):
+        caches['sessions'].clear()
+        backends.clear()
+        coalescing.listing_pages.clear()
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.listing = Listing.objects.create(title='Lamp', description='Desk lamp', owner=self.owner, starting_price=10)
+
+    def auth_queries(self, url: str) -> list:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # Queries reading or writing the session or user tables themselves, not joins.
+        return [
+            q['sql'] for q in queries
+            if re.search(r'(FROM|UPDATE|INTO) "(django_session|auctions_user)"', q['sql'])
+        ]
+
+    def test_anonymous_views_make_no_auth_queries(self):
+        for url in (reverse('index'), reverse('listing', args=[self.listing.id]), reverse('categories')):
+            self.assertEqual(self.auth_queries(url), [])
+
+    def test_signed_in_user_comes_from_caches(self):
+        self.client.force_login(self.owner)
+        self.client.get(reverse('index'))
+        self.assertEqual(self.auth_queries(reverse('index')), [])
+
+    def test_saving_the_user_invalidates_the_cache(self):
+        self.client.force_login(self.owner)
+        self.client.get(reverse('index'))
+        self.owner.username = 'renamed'
+        self.owner.save()
+        self.assertContains(self.client.get(reverse('index')), 'Signed in as <strong>renamed</strong>')
+
+
+class ListingMicroCacheTests(TestCase):
+
+    def setUp(self):
+        caches['fragments'].clear()
+        coalescing.listing_pages.clear()
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'pass')
+        self.listing = Listing.objects.create(title='Lamp', description='Desk lamp', owner=self.owner, starting_price=10)
+        self.url = reverse('listing', args=[self.listing.id])
+
+    def test_repeated_anonymous_views_make_no_queries(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Lamp')
+
+    def test_signed_in_views_are_not_cached(self):
+        self.client.get(self.url)
+        self.client.force_login(self.bidder)
+        self.assertContains(self.client.get(self.url), 'Make a bid')
+
+    def test_bid_invalidates_page(self):
+        self.assertContains(self.client.get(self.url), '$10')
+
+        bidder = self.client_class()
+        bidder.force_login(self.bidder)
+        with self.captureOnCommitCallbacks(execute=True):
+            bidder.post(reverse('new_bid', args=[self.listing.id]), {'amount': 25})
+        self.assertContains(self.client.get(self.url), '$25')
+
+    def test_expires(self):
+        self.client.get(self.url)
+        with mock.patch('auctions.coalescing.time.monotonic', return_value=time.monotonic() + 60):
+            # Rendered again, the comment thread still comes from the fragment cache.
+            with self.assertNumQueries(1):
+                self.client.get(self.url)
+
+
+class ListingCoalescingTests(TransactionTestCase):
+
+    def setUp(self):
+        caches['fragments'].clear()
+        owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.listing = Listing.objects.create(title='Lamp', description='Desk lamp', owner=owner, starting_price=10)
+
+    def concurrent_queries(self, concurrency: int) -> int:
+        """Lets 'concurrency' anonymous clients request the listing at the same time
+        and returns the number of queries they made altogether.
+        """
+        coalescing.listing_pages.clear()
+        caches['fragments'].clear()
+        url = reverse('listing', args=[self.listing.id])
+        start = threading.Barrier(concurrency)
+        counted = []
+        lock = threading.Lock()
+
+        def count(execute, sql, params, many, context):
+            with lock:
+                counted.append(sql)
+            return execute(sql, params, many, context)
+
+        def visit():
+            try:
+                with connection.execute_wrapper(count):
+                    start.wait()
+                    self.assertEqual(self.client_class().get(url).status_code, 200)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=visit) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return len(counted)
+
+    def test_database_load_is_flat(self):
+        single = self.concurrent_queries(1)
+        self.assertGreater(single, 0)
+        for concurrency in (8, 32):
+            self.assertEqual(self.concurrent_queries(concurrency), single)
+
+
+class CategoryStatsTests(TestCase):
+
+    def setUp(self):
+        caches['fragments'].clear()
+        coalescing.listing_pages.clear()
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'pass')
+        self.lamp = Listing.objects.create(title='Lamp', description='Desk lamp', owner=self.owner,
+                                           starting_price=10, category='HM')
+        self.sofa = Listing.objects.create(title='Sofa', description='Green sofa', owner=self.owner,
+                                           starting_price=300, category='HM')
+
+    def stats(self, category='HM'):
+        stats = CategoryStats.objects.get(category=category)
+        return stats.active_listings, stats.min_price, stats.max_price
+
+    def test_counters_follow_listings(self):
+        self.assertEqual(self.stats(), (2, 10, 300))
+
+        Bid.objects.create(bidder=self.bidder, listing=self.sofa, amount=450)
+        self.assertEqual(self.stats(), (2, 10, 450))
+
+        self.client.force_login(self.owner)
+        self.client.post(reverse('edit_listing', args=[self.lamp.id]), {'title': 'Lamp', 'category': 'ELCTRNCS'})
+        self.assertEqual(self.stats(), (1, 450, 450))
+        self.assertEqual(self.stats('ELCTRNCS'), (1, 10, 10))
+
+        close_listings([self.sofa.id])
+        self.assertEqual(self.stats(), (0, None, None))
+
+    def test_deleted_listings_are_taken_off(self):
+        Bid.objects.create(bidder=self.bidder, listing=self.sofa, amount=450)
+        self.sofa.delete()
+        self.assertEqual(self.stats(), (1, 10, 10))
+
+        close_listings([self.lamp.id])
+        Listing.objects.filter(pk=self.lamp.id).delete()
+        self.assertEqual(self.stats(), (0, None, None))
+        categories.rebuild_stats()
+        self.assertEqual(self.stats(), (0, None, None))
+
+    def test_facets_take_a_fixed_number_of_queries(self):
+        Bid.objects.create(bidder=self.bidder, listing=self.sofa, amount=450)
+        url = reverse('category', args=['hm'])
+
+        response = self.client.get(url)
+        self.assertContains(response, '2 active listings, from $10 to $450.')
+        # Counters, count of the filtered listings and the page of them, which is
+        # not fetched when there are none.
+        for query, queries, shown, hidden in [
+            ({'price': 'under-50'}, 3, 'Lamp', 'Sofa'),
+            ({'bids': 'yes'}, 3, 'Sofa', 'Lamp'),
+            ({'price': '100-500', 'bids': 'no'}, 2, None, 'Sofa'),
+            ({'sort': 'price-desc', 'page': 1}, 2, 'Sofa', None),
+        ]:
+            with self.assertNumQueries(queries):
+                response = self.client.get(url, query)
+            if shown:
+                self.assertContains(response, f'{shown}: $')
+            if hidden:
+                self.assertNotContains(response, f'{hidden}: $')
+
+    def test_unknown_facet_value(self):
+        self.assertEqual(self.client.get(reverse('category', args=['hm']), {'price': 'free'}).status_code, 400)
+
+
+class ProxyBiddingTests(TestCase):
+
+    def setUp(self):
+        coalescing.listing_pages.clear()
+        caches['fragments'].clear()
+        owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+        self.listing = Listing.objects.create(title='Lamp', description='Desk lamp', owner=owner, starting_price=10)
+
+    def visible(self):
+        return list(self.listing.bids.order_by('created').values_list('bidder__username', 'amount'))
+
+    def test_leader_pays_one_more_than_runner_up(self):
+        proxybids.submit(self.listing, self.alice, 100)
+        self.assertEqual(self.visible(), [('alice', 10)])
+
+        resolution = proxybids.submit(self.listing, self.bob, 50)
+        self.assertEqual((resolution.leader_id, resolution.price), (self.alice.id, 51))
+        self.assertEqual(self.visible(), [('alice', 10), ('bob', 50), ('alice', 51)])
+
+        resolution = proxybids.submit(self.listing, self.bob, 150)
+        self.assertEqual((resolution.leader_id, resolution.price), (self.bob.id, 101))
+        self.assertEqual(self.visible()[-2:], [('alice', 100), ('bob', 101)])
+        self.assertTrue(NotificationEvent.objects.filter(user=self.alice, amount=101).exists())
+
+    def test_equal_maxima_go_to_the_earliest(self):
+        proxybids.submit(self.listing, self.alice, 100)
+        resolution = proxybids.submit(self.listing, self.bob, 100)
+        self.assertEqual((resolution.leader_id, resolution.price), (self.alice.id, 100))
+
+        # The price has reached the maximum, a plain bid equal to it is too low.
+        carol = User.objects.create_user('carol', 'carol@example.com', 'pass')
+        with self.assertRaisesRegex(ValueError, 'at least \\$101'):
+            proxybids.submit(self.listing, carol, 100, automatic=False)
+        close_listings([self.listing.id])
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.winner_id, self.listing.current_price), (self.alice.id, 100))
+
+    def test_plain_bids_are_answered_by_proxies(self):
+        proxybids.submit(self.listing, self.alice, 100)
+        self.client.force_login(self.bob)
+        response = self.client.post(reverse('new_bid', args=[self.listing.id]), {'amount': 40})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.visible(), [('alice', 10), ('bob', 40), ('alice', 41)])
+
+        self.client.post(reverse('new_bid', args=[self.listing.id]), {'amount': 120})
+        self.assertEqual(self.visible()[-2:], [('alice', 100), ('bob', 120)])
+
+    def test_raising_own_maximum_writes_no_bid(self):
+        proxybids.submit(self.listing, self.alice, 100)
+        self.assertEqual(proxybids.submit(self.listing, self.alice, 200).bids, [])
+        self.assertEqual(self.listing.proxy_bids.get(bidder=self.alice).max_amount, 200)
+        self.assertRaises(ValueError, proxybids.submit, self.listing, self.alice, 150)
+
+    def test_bidding_war_writes_a_fraction_of_the_bids(self):
+        # Two bidders taking turns at raising their maximum by 100 would write
+        # one bid per dollar if they bid the minimum each time.
+        for maximum in range(100, 1100, 100):
+            proxybids.submit(self.listing, self.alice, maximum)
+            proxybids.submit(self.listing, self.bob, maximum + 50)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_price, 1001)
+        self.assertLessEqual(self.listing.bid_count, 40)
+        self.assertGreater(self.listing.current_price - self.listing.starting_price, 10 * self.listing.bid_count)
+
+
+class ProxyBiddingConcurrencyTests(TransactionTestCase):
+
+    def test_concurrent_submissions_are_resolved_one_at_a_time(self):
+        owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        listing = Listing.objects.create(title='Lamp', description='Desk lamp', owner=owner, starting_price=10)
+        bidders = [User.objects.create_user(f'bidder{i}', f'bidder{i}@example.com', 'pass') for i in range(8)]
+        start = threading.Barrier(len(bidders))
+        errors = []
+
+        def bid(user: User, maximum: int):
+            try:
+                start.wait()
+                while True:
+                    try:
+                        proxybids.submit(listing, user, maximum)
+                        break
+                    except OperationalError as e:
+                        # The in-memory test database fails on locks instead of
+                        # waiting for them, the bidder submits again.
+                        if 'locked' not in str(e):
+                            raise
+                        time.sleep(0.01)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=bid, args=(u, 100 + 10 * i)) for i, u in enumerate(bidders)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Some submissions may come in after a higher maximum and be rejected as
+        # too low, but none is lost or resolved against stale state.
+        self.assertTrue(all(isinstance(e, ValueError) for e in errors), errors)
+        listing.refresh_from_db()
+        top = listing.bids.first()
+        self.assertEqual(top.bidder, bidders[-1])
+        accepted = sorted(listing.proxy_bids.values_list('max_amount', flat=True))
+        self.assertEqual(accepted[-1], 170)
+        self.assertEqual(listing.current_price, accepted[-2] + 1 if len(accepted) > 1 else 10)
+        self.assertLessEqual(listing.bid_count, 2 * len(accepted))
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        coalescing.listing_pages.clear()
+        caches['fragments'].clear()
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'pass')
+        self.old = Listing.objects.create(title='Lamp', description='Desk lamp', owner=self.owner, starting_price=10)
+        self.recent = Listing.objects.create(title='Sofa', description='Green sofa', owner=self.owner, starting_price=10)
+        for listing in (self.old, self.recent):
+            Bid.objects.create(bidder=self.bidder, listing=listing, amount=25)
+            Comment.objects.create(owner=self.bidder, listing=listing, content='Still working?')
+            self.bidder.watchlist.add(listing)
+        close_listings([self.old.id], now=timezone.now() - timedelta(days=40))
+        close_listings([self.recent.id], now=timezone.now() - timedelta(days=1))
+
+    def test_old_closed_listings_leave_the_live_tables(self):
+        self.assertEqual(archive.archive_listings(timedelta(days=30), batch_size=1), 1)
+
+        self.assertEqual(list(Listing.objects.values_list('pk', flat=True)), [self.recent.id])
+        self.assertFalse(Bid.objects.filter(listing_id=self.old.id).exists())
+        self.assertFalse(Comment.objects.filter(listing_id=self.old.id).exists())
+        self.assertEqual(list(self.bidder.watchlist.values_list('pk', flat=True)), [self.recent.id])
+
+        archived = ArchivedListing.objects.get(pk=self.old.id)
+        self.assertEqual((archived.final_price, archived.winner, archived.bid_count), (25, self.bidder, 1))
+        self.assertEqual(archived.comments[0]['owner'], 'bidder')
+        self.assertEqual(list(archived.bids.values_list('bidder', 'amount')), [(self.bidder.id, 25)])
+
+    def test_listing_view_reads_the_archive(self):
+        archive.archive_listings(timedelta(days=30))
+        self.client.force_login(self.bidder)
+        response = self.client.get(reverse('listing', args=[self.old.id]))
+        self.assertContains(response, 'Final price: $25')
+        self.assertContains(response, 'You have won this auction!')
+        self.assertContains(response, 'Still working?')
+        self.assertEqual(self.client.get(reverse('listing', args=[self.recent.id + 1])).status_code, 404)
+
+    def test_history_survives_rebuilds(self):
+        summary = lambda: ActivitySummary.objects.filter(user=self.bidder).values_list(
+            'bids_count', 'bidded_listings_count', 'won_count').get()
+        before = summary()
+        archive.archive_listings(timedelta(days=30))
+        self.assertEqual(summary(), before)
+        activity.rebuild_summaries()
+        self.assertEqual(summary(), before)
+
+        bidstats.rebuild_stats()
+        self.assertEqual(sum(CategoryBidStats.objects.values_list('count', flat=True)), 2)
+
+
+class ActivityTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.first = User.objects.create_user('first', 'first@example.com', 'pass')
+        self.second = User.objects.create_user('second', 'second@example.com', 'pass')
+        self.lamp = Listing.objects.create(title='Lamp', description='Desk lamp', owner=self.owner, starting_price=10)
+
+    def summary(self, user: User):
+        return ActivitySummary.objects.filter(user=user).values_list(
+            'listings_count', 'active_listings_count', 'bids_count', 'bidded_listings_count', 'won_count').get()
+
+    def test_only_the_top_bidder_is_winning(self):
+        # Equal amounts, the earlier bid is the top one.
+        Bid.objects.create(bidder=self.first, listing=self.lamp, amount=20)
+        Bid.objects.create(bidder=self.second, listing=self.lamp, amount=20)
+        self.assertEqual([l.is_winning for l in activity.bidded_listings(self.first)], [True])
+        self.assertEqual([l.is_winning for l in activity.bidded_listings(self.second)], [False])
+
+    def test_deleting_a_listing_updates_the_summaries(self):
+        Bid.objects.create(bidder=self.first, listing=self.lamp, amount=20)
+        close_listings([self.lamp.id])
+        self.lamp.refresh_from_db()
+        self.lamp.delete()
+        counts = self.summary(self.owner), self.summary(self.first)
+        activity.rebuild_summaries()
+        self.assertEqual((self.summary(self.owner), self.summary(self.first)), counts)
+        self.assertEqual(counts, ((0, 0, 0, 0, 0), (0, 0, 0, 0, 0)))
+
+    @mock.patch('auctions.views.ACTIVITY_PAGE_SIZE', 1)
+    def test_pages_of_both_lists_are_kept(self):
+        Listing.objects.create(title='Sofa', description='Green sofa', owner=self.first, starting_price=10)
+        Listing.objects.create(title='Chair', description='Oak chair', owner=self.first, starting_price=10)
+        chair = Listing.objects.create(title='Chair', description='Oak chair', owner=self.owner, starting_price=10)
+        Bid.objects.create(bidder=self.first, listing=self.lamp, amount=20)
+        Bid.objects.create(bidder=self.first, listing=chair, amount=20)
+        self.client.force_login(self.first)
+        response = self.client.get(reverse('activity'), {'owned_page': 2})
+        self.assertContains(response, 'href="?owned_page=2&amp;bidded_page=2"')
+        self.assertContains(response, 'href="?owned_page=1"')
+
+
+class WatchlistTests(TestCase):
+
+    def setUp(self):
+        caches['sessions'].clear()
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'pass')
+        self.watchers = [User.objects.create_user(f'watcher{i}', f'watcher{i}@example.com', 'pass') for i in range(5)]
+        self.lamp = Listing.objects.create(title='Lamp', description='Desk lamp', owner=self.owner, starting_price=10)
+        for user in self.watchers + [self.bidder]:
+            watchlist.add(user, [self.lamp.id])
+
+    def events(self, kind: str):
+        return set(NotificationEvent.objects.filter(kind=kind).values_list('user_id', flat=True))
+
+    def test_fan_out_in_batches(self):
+        batches = []
+        self.assertEqual(watchlist.fan_out(self.lamp.id, batches.append, batch_size=2), 6)
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 2])
+        self.assertEqual(set(sum(batches, [])), {u.id for u in self.watchers + [self.bidder]})
+
+    def test_watchers_are_notified_of_bids_and_closing(self):
+        self.client.force_login(self.bidder)
+        self.client.post(reverse('new_bid', args=[self.lamp.id]), {'amount': 20})
+        # The request only queues one event for all the watchers.
+        self.assertEqual(self.events(NotificationEvent.WATCHED_BID), set())
+        self.assertEqual(WatcherEvent.objects.count(), 1)
+        self.assertEqual(notifications.expand_watcher_events(), 5)
+        self.assertEqual(self.events(NotificationEvent.WATCHED_BID), {u.id for u in self.watchers})
+
+        close_listings([self.lamp.id])
+        notifications.expand_watcher_events()
+        self.assertEqual(self.events(NotificationEvent.WATCHED_CLOSED), {u.id for u in self.watchers})
+        self.assertFalse(WatcherEvent.objects.exists())
+
+        digest = notifications.Digest(self.bidder, list(NotificationEvent.objects.filter(user=self.bidder)))
+        self.assertEqual(digest.subject, 'You won 1 auction')
+
+    def test_watcher_events_are_expanded_in_batches(self):
+        notifications.enqueue_watchers(self.lamp.id, NotificationEvent.WATCHED_BID, 20, exclude={self.bidder.id})
+        self.assertEqual(notifications.expand_watcher_events(batch_size=2), 2)
+        self.assertEqual(WatcherEvent.objects.get().claimed_at, None)
+        self.assertEqual(notifications.expand_watcher_events(batch_size=2), 2)
+        self.assertEqual(notifications.expand_watcher_events(batch_size=2), 1)
+        self.assertEqual(notifications.expand_watcher_events(batch_size=2), 0)
+        self.assertEqual(self.events(NotificationEvent.WATCHED_BID), {u.id for u in self.watchers})
+        self.assertEqual(NotificationEvent.objects.count(), 5)
+        self.assertFalse(WatcherEvent.objects.exists())
+
+    def test_changes_reach_users_served_from_a_stale_row(self):
+        stale = User.objects.get(pk=self.bidder.pk)
+        request = RequestFactory().get('/')
+        request.user = stale
+        request.session = {}
+        self.assertEqual(watchlist.watched_ids(request), {self.lamp.id})
+
+        # Made in another process, which cannot drop the row cached here.
+        watchlist.remove(User.objects.get(pk=self.bidder.pk), [self.lamp.id])
+        self.assertEqual(watchlist.watched_ids(request), frozenset())
+
+
+class RecordingSink:
+
+    def __init__(self, fail: bool = False):
+        self.digests = []
+        self.fail = fail
+
+    def deliver(self, digests):
+        if self.fail:
+            raise ConnectionError('SMTP server unavailable')
+        self.digests.extend(digests)
+
+
+class NotificationDeliveryTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'pass')
+        self.lamp = Listing.objects.create(title='Lamp', description='Desk lamp', owner=self.owner, starting_price=10)
+        self.sofa = Listing.objects.create(title='Sofa', description='Green sofa', owner=self.owner, starting_price=10)
+        for amount in (20, 30):
+            notifications.enqueue_outbid(self.lamp, self.bidder.id, amount)
+        notifications.enqueue_outbid(self.sofa, self.bidder.id, 15)
+        self.later = timezone.now() + timedelta(minutes=2)
+
+    def test_events_are_merged_into_one_digest(self):
+        self.sofa.winner_id, self.sofa.current_price = self.bidder.id, 25
+        notifications.enqueue_won([self.sofa])
+        sink = RecordingSink()
+        self.assertEqual(notifications.deliver_pending(now=self.later, sinks=[sink]), 4)
+
+        [digest] = sink.digests
+        self.assertEqual(digest.subject, 'You won 1 auction and you were outbid on 1 listing')
+        self.assertEqual(digest.body.splitlines(), [
+            "You were outbid on 'Lamp', the current bid is $30.",
+            "You won 'Sofa' for $25.",
+        ])
+        self.assertFalse(NotificationEvent.objects.filter(delivered_at__isnull=True).exists())
+
+    def test_window(self):
+        sink = RecordingSink()
+        self.assertEqual(notifications.deliver_pending(timedelta(minutes=5), now=self.later, sinks=[sink]), 0)
+        self.assertEqual(sink.digests, [])
+        self.assertEqual(notifications.deliver_pending(timedelta(minutes=1), now=self.later, sinks=[sink]), 3)
+
+    def test_claimed_events_are_not_sent_twice(self):
+        with self.assertRaises(ConnectionError):
+            notifications.deliver_pending(now=self.later, sinks=[RecordingSink(fail=True)])
+        self.assertFalse(NotificationEvent.objects.filter(claimed_at__isnull=True).exists())
+
+        sink = RecordingSink()
+        self.assertEqual(notifications.deliver_pending(now=self.later, sinks=[sink]), 0)
+        # Until the claim of the failed worker expires.
+        retry = self.later + notifications.CLAIM_TIMEOUT
+        self.assertEqual(notifications.deliver_pending(now=retry, sinks=[sink]), 3)
+        self.assertEqual(len(sink.digests), 1)
+
+
+def jpeg(width: int, height: int, orientation: int = 1) -> bytes:
+    exif = Image.Exif()
+    exif[images.ORIENTATION_TAG] = orientation
+    out = BytesIO()
+    Image.new('RGB', (width, height), 'green').save(out, 'JPEG', exif=exif)
+    return out.getvalue()
+
+
+class ImageServer(http.server.BaseHTTPRequestHandler):
+    # Paths to (status, headers, body).
+    responses = {}
+
+    def do_GET(self):
+        status, headers, body = self.responses[self.path]
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ListingImageTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = http.server.HTTPServer(('127.0.0.1', 0), ImageServer)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.photo = jpeg(400, 200, orientation=6)
+        ImageServer.responses = {
+            '/photo.jpg': (200, {'Content-Length': len(self.photo)}, self.photo),
+            '/moved.jpg': (302, {'Location': '/photo.jpg'}, b''),
+        }
+
+    def url(self, path: str) -> str:
+        return f'http://images.example.com:{self.server.server_port}{path}'
+
+    def test_ingest_listing_url(self):
+        listing = Listing.objects.create(
+            title='Lamp', description='Desk lamp', owner=self.owner, starting_price=10, image_url=self.url('/photo.jpg')
+        )
+        # The test server stands in for a host that resolved to a public address.
+        with mock.patch.object(images, 'public_address', return_value='127.0.0.1'):
+            with self.captureOnCommitCallbacks() as callbacks:
+                images.ingest_listing_url(listing.id)
+        listing.refresh_from_db()
+        self.assertEqual((listing.image.width, listing.image.height), (200, 400))
+        self.assertEqual(images.ingest(self.photo), listing.image)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_thumbnails_follow_the_exif_orientation(self):
+        with self.captureOnCommitCallbacks():
+            image = images.ingest(self.photo)
+        images.make_thumbnails(image.pk)
+        image.refresh_from_db()
+        self.assertEqual(image.thumbnail_widths, [160])
+        with default_storage.open(images.thumbnail_path(image.sha256, 160)) as f, Image.open(f) as thumb:
+            self.assertEqual(thumb.size, (160, 320))
+
+    def test_images_narrower_than_every_thumbnail_are_processed_once(self):
+        with self.captureOnCommitCallbacks():
+            small, large = images.ingest(jpeg(100, 80)), images.ingest(self.photo)
+        self.assertEqual(set(images.unprocessed_images()), {small, large})
+        images.make_thumbnails(small.pk)
+        small.refresh_from_db()
+        self.assertEqual(small.thumbnail_widths, [])
+        self.assertEqual(list(images.unprocessed_images()), [large])
+
+    def test_rejected_urls(self):
+        for url in ('file:///etc/passwd', 'ftp://example.com/photo.jpg', 'http:///photo.jpg'):
+            with self.assertRaisesRegex(ValueError, 'Only http and https'):
+                images.fetch(url)
+        for host in ('127.0.0.1', 'localhost', '10.0.0.1', '169.254.169.254', '[::1]'):
+            with self.assertRaisesRegex(ValueError, 'not a public address'):
+                images.fetch(f'http://{host}/photo.jpg')
+
+        with mock.patch.object(images, 'public_address', return_value='127.0.0.1'):
+            with self.assertRaisesRegex(ValueError, 'must not redirect'):
+                images.fetch(self.url('/moved.jpg'))
+            with mock.patch.object(images, 'MAX_IMAGE_BYTES', 100):
+                with self.assertRaisesRegex(ValueError, 'must not be larger'):
+                    images.fetch(self.url('/photo.jpg'))
+
+
+class CommentPagesTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.lamp = Listing.objects.create(title='Lamp', description='Desk lamp', owner=self.owner, starting_price=10)
+        self.comments = [
+            Comment.objects.create(owner=self.owner, listing=self.lamp, content=f'Comment {i}') for i in range(5)
+        ]
+        # Comments posted at the same time are ordered by id.
+        Comment.objects.filter(pk__in=[c.pk for c in self.comments[1:4]]).update(created=self.comments[1].created)
+
+    def test_pages_follow_the_cursor(self):
+        seen, cursor = [], None
+        for _ in range(3):
+            page = comments_page(self.lamp.id, cursor, size=2)
+            seen += [c.content for c in page.comments]
+            cursor = page.next_cursor
+        self.assertIsNone(cursor)
+        self.assertEqual(seen, [f'Comment {i}' for i in range(5)])
+
+    def test_view(self):
+        url = reverse('listing_comments', args=[self.lamp.id])
+        response = self.client.get(url, {'after': comments_page(self.lamp.id, size=3).next_cursor})
+        self.assertContains(response, 'Comment 3')
+        self.assertNotContains(response, 'Comment 2')
+        self.assertEqual(self.client.get(url, {'after': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('listing_comments', args=[self.lamp.id + 1])).status_code, 404)
+
+        Comment.objects.all().delete()
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class BidStatsTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'pass')
+        self.lamp = Listing.objects.create(title='Lamp', description='Desk lamp', owner=self.owner, starting_price=10)
+        self.sofa = Listing.objects.create(title='Sofa', description='Green sofa', owner=self.owner, starting_price=10)
+        Bid.objects.create(bidder=self.bidder, listing=self.lamp, amount=25)
+        for amount in (30, 40):
+            Bid.objects.create(bidder=self.bidder, listing=self.sofa, amount=amount)
+        # All in one hour, however close to the next one the test runs.
+        Bid.objects.update(created=bidstats.truncate_hour(timezone.now()) + timedelta(minutes=10))
+        bidstats.rebuild_stats()
+
+    def buckets(self):
+        fields = ('hour', 'count', 'total', 'min_amount', 'max_amount')
+        return (sorted(ListingBidStats.objects.values_list('listing_id', *fields)),
+                sorted(CategoryBidStats.objects.values_list('category', *fields)))
+
+    def test_incremental_updates_match_a_rebuild(self):
+        Bid.objects.get(amount=40).delete()
+        updated = self.buckets()
+        self.assertEqual(updated[1][0][2:], (2, 55, 25, 30))
+        bidstats.rebuild_stats()
+        self.assertEqual(self.buckets(), updated)
+
+    def test_removed_bids_keep_archived_ones_in_the_category(self):
+        close_listings([self.lamp.id], now=timezone.now() - timedelta(days=40))
+        archive.archive_listings(timedelta(days=30))
+        Bid.objects.get(amount=40).delete()
+        [bucket] = CategoryBidStats.objects.all()
+        self.assertEqual((bucket.count, bucket.min_amount, bucket.max_amount), (2, 25, 30))
+
+    def test_endpoints(self):
+        response = self.client.get(reverse('listing_price_history', args=[self.sofa.id]), {'hours': 2})
+        self.assertEqual(response.json()['bid_count'], 2)
+        self.assertEqual([(b['count'], b['min'], b['max'], b['avg']) for b in response.json()['buckets']],
+                         [(2, 30, 40, 35)])
+
+        response = self.client.get(reverse('category_bid_stats', args=['othr']))
+        self.assertEqual([b['count'] for b in response.json()['buckets']], [3])
+        self.assertIsNone(response.json()['percentiles'])
+
+        self.assertEqual(self.client.get(reverse('category_bid_stats', args=['cars'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('listing_price_history', args=[self.sofa.id + 1])).status_code, 404)
+        response = self.client.get(reverse('listing_price_history', args=[self.sofa.id]), {'hours': 0})
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'pass')
+        self.lamp = Listing.objects.create(title='Lamp', description='Desk lamp', owner=self.owner, starting_price=10)
+        self.sofa = Listing.objects.create(title='Sofa', description='Green sofa', owner=self.owner, starting_price=10)
+        Bid.objects.create(bidder=self.bidder, listing=self.lamp, amount=20)
+        Bid.objects.create(bidder=self.bidder, listing=self.sofa, amount=30)
+        self.client.force_login(self.owner)
+
+    def export(self, kind: str, **query) -> bytes:
+        response = self.client.get(reverse('export', args=[kind]), query)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv_and_json_lines(self):
+        lines = self.export('bids').decode().splitlines()
+        self.assertEqual(lines[0], 'listing,title,bidder,amount,created')
+        self.assertTrue(lines[1].startswith(f'{self.lamp.id},Lamp,bidder,20,'))
+
+        rows = [json.loads(line) for line in self.export('listings', format='jsonl').splitlines()]
+        self.assertEqual([(r['title'], r['price'], r['is_active']) for r in rows], [('Lamp', 20, True), ('Sofa', 30, True)])
+
+    def test_archived_listings_follow_live_ones(self):
+        close_listings([self.lamp.id], now=timezone.now() - timedelta(days=40))
+        archive.archive_listings(timedelta(days=30))
+        rows = [json.loads(line) for line in self.export('listings', format='jsonl').splitlines()]
+        self.assertEqual([(r['title'], r['is_active'], r['winner']) for r in rows], [('Sofa', True, None), ('Lamp', False, 'bidder')])
+        self.assertEqual(len(self.export('bids').splitlines()), 3)
+
+    def test_gzip(self):
+        self.assertEqual(gzip.decompress(self.export('bids', gzip=1)), self.export('bids'))
+
+    def test_queries_do_not_depend_on_the_number_of_rows(self):
+        def queries() -> int:
+            with CaptureQueriesContext(connection) as captured:
+                self.export('bids')
+            return len(captured)
+
+        # The first request also loads the session and the user.
+        queries()
+        before = queries()
+        for amount in range(31, 131):
+            Bid.objects.create(bidder=self.bidder, listing=self.sofa, amount=amount)
+        self.assertEqual(queries(), before)
+
+    def test_unknown_export(self):
+        self.assertEqual(self.client.get(reverse('export', args=['comments'])).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export', args=['bids']), {'format': 'xml'}).status_code, 400)
+
+
+class BulkLoadTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'pass')
+        self.lamp = Listing.objects.create(title='Lamp', description='Desk lamp', owner=self.admin, starting_price=10)
+        self.client.force_login(self.admin)
+
+    def load(self, *lines: str) -> dict:
+        response = self.client.post(
+            reverse('bulk_load'), '\n'.join(lines), content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_malformed_lines_are_row_errors(self):
+        report = self.load(
+            '{"type": "listing", "owner": "admin", "title": "Sofa", "description": "Green sofa", "starting_price": 5',
+            '[1, 2]',
+            '{"type": "listing", "owner": "admin", "title": "Sofa", "description": "Green sofa", "starting_price": 5}',
+        )
+        self.assertEqual(report['loaded']['listing'], 1)
+        self.assertEqual([error['row'] for error in report['errors']], [1, 2])
+        self.assertIn('Expected a JSON object', report['errors'][1]['error'])
+
+    def test_values_of_the_wrong_type_are_row_errors(self):
+        report = self.load(
+            '{"type": "bid", "bidder": ["bidder"], "listing": %d, "amount": 20}' % self.lamp.id,
+            '{"type": "bid", "bidder": "bidder", "listing": [%d], "amount": 20}' % self.lamp.id,
+            '{"type": "bid", "bidder": "bidder", "listing": %d, "amount": true}' % self.lamp.id,
+            '{"type": "bid", "bidder": "bidder", "listing": %d, "amount": 20}' % self.lamp.id,
+        )
+        self.assertEqual(report['loaded']['bid'], 1)
+        self.assertEqual([error['row'] for error in report['errors']], [1, 2, 3])
+        self.assertEqual(report['errors'][1]['error'], 'listing: expected a listing id, not [%d].' % self.lamp.id)
+
+    def test_bids_must_beat_the_price_and_earlier_rows(self):
+        bid = '{{"type": "bid", "bidder": "bidder", "listing": %d, "amount": {}}}' % self.lamp.id
+        report = self.load(bid.format(9), bid.format(10), bid.format(10), bid.format(12))
+        self.assertEqual(report['loaded']['bid'], 2)
+        self.assertEqual([error['row'] for error in report['errors']], [1, 3])
+        self.lamp.refresh_from_db()
+        self.assertEqual((self.lamp.current_price, self.lamp.bid_count), (12, 2))
+
+    def test_bids_on_closed_listings_are_rejected(self):
+        close_listings([self.lamp.id])
+        report = self.load('{"type": "bid", "bidder": "bidder", "listing": %d, "amount": 20}' % self.lamp.id)
+        self.assertEqual(report['rejected'], 1)
+        self.assertIn('has ended', report['errors'][0]['error'])
+
+    def test_loaded_listings_are_queued_for_similarity(self):
+        SimilarityUpdate.objects.all().delete()
+        self.load(*(
+            '{"type": "listing", "owner": "admin", "title": "Chair %d", "description": "Oak chair", "starting_price": 5}' % i
+            for i in range(3)
+        ))
+        self.assertEqual(
+            set(SimilarityUpdate.objects.values_list('listing_id', flat=True)),
+            set(Listing.objects.exclude(pk=self.lamp.pk).values_list('pk', flat=True)),
+        )
+
+
+@skipIf(numpy is None, 'NumPy is not installed.')
+class SimilarListingsTests(TestCase):
+
+    def setUp(self):
+        coalescing.listing_pages.clear()
+        caches['fragments'].clear()
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.listings = {
+            title: Listing.objects.create(title=title, description=description, owner=self.owner, starting_price=10)
+            for title, description in [
+                ('Desk lamp', 'Brass desk lamp with a green shade.'),
+                ('Reading lamp', 'Floor lamp, brass, with a reading light.'),
+                ('Mountain bike', 'Aluminium mountain bike, 29 inch wheels.'),
+                ('Road bike', 'Carbon road bike, 28 inch wheels.'),
+                ('Sofa', 'Three seat sofa in green velvet.'),
+            ]
+        }
+
+    def titles(self, title: str):
+        return [listing.title for listing in similar.similar_listings(self.listings[title].id)]
+
+    def test_full_build(self):
+        self.assertEqual(similar.build_all(), 5)
+        self.assertFalse(SimilarityUpdate.objects.exists())
+        self.assertEqual(self.titles('Desk lamp')[0], 'Reading lamp')
+        self.assertEqual(self.titles('Road bike')[0], 'Mountain bike')
+        with self.assertNumQueries(1):
+            self.titles('Sofa')
+
+        response = self.client.get(reverse('listing', args=[self.listings['Road bike'].id]))
+        self.assertContains(response, 'Similar listings')
+        self.assertContains(response, '<small>Mountain bike</small>', html=True)
+
+    def test_new_listings_are_merged_in(self):
+        similar.build_all()
+        self.listings['Kids bike'] = Listing.objects.create(
+            title='Kids bike', description='Kids bike with 20 inch wheels.', owner=self.owner, starting_price=10
+        )
+        self.assertEqual(SimilarityUpdate.objects.count(), 1)
+
+        similar.update_queued()
+        self.assertFalse(SimilarityUpdate.objects.exists())
+        self.assertIn('Road bike', self.titles('Kids bike')[:2])
+        self.assertIn('Kids bike', self.titles('Road bike'))
+
+    def test_updates_vectorize_only_the_queued_listings(self):
+        versions = dict(Listing.objects.values_list('pk', 'version'))
+        similar.build_all()
+        # Only the similar listings fragment is invalidated.
+        self.assertEqual(dict(Listing.objects.values_list('pk', 'version')), versions)
+        self.assertEqual(ListingVector.objects.count(), 5)
+        url = reverse('listing', args=[self.listings['Road bike'].id])
+        self.assertNotContains(self.client.get(url), 'Kids bike')
+
+        Listing.objects.create(title='Kids bike', description='Kids bike with 20 inch wheels.', owner=self.owner,
+                               starting_price=10)
+        with mock.patch.object(similar, 'features', wraps=similar.features) as features:
+            similar.update_queued()
+        self.assertEqual(features.call_count, 1)
+        self.assertEqual(ListingVector.objects.count(), 6)
+        # The cached fragment of the listing page goes with the old list.
+        coalescing.listing_pages.clear()
+        self.assertContains(self.client.get(url), '<small>Kids bike</small>', html=True)
+
+    def test_closed_listings_are_not_recommended(self):
+        similar.build_all()
+        close_listings([self.listings['Reading lamp'].id])
+        self.assertNotIn('Reading lamp', self.titles('Desk lamp'))
+
+
+class AdminChangelistTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'pass')
+        self.client.force_login(self.admin)
+
+    def add_listings(self, count: int):
+        for i in range(count):
+            listing = Listing.objects.create(title=f'Lamp {i}', description='Desk lamp', owner=self.admin, starting_price=10)
+            Bid.objects.create(bidder=self.bidder, listing=listing, amount=20)
+            Comment.objects.create(owner=self.bidder, listing=listing, content='Still working?')
+
+    def changelist_queries(self, model: str) -> int:
+        url = reverse(f'admin:auctions_{model}_changelist')
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(captured)
+
+    def test_queries_do_not_depend_on_the_number_of_rows(self):
+        self.add_listings(2)
+        # The first request also loads the session and the user.
+        self.changelist_queries('user')
+        before = {model: self.changelist_queries(model) for model in ('user', 'listing', 'bid', 'comment')}
+        self.add_listings(20)
+        for model, queries in before.items():
+            self.assertEqual(self.changelist_queries(model), queries, model)
+
+    def test_category_filter_is_indexed(self):
+        self.add_listings(2)
+        close_listings(Listing.objects.values_list('pk', flat=True)[:1])
+        url = reverse('admin:auctions_listing_changelist')
+        with CaptureQueriesContext(connection) as captured:
+            self.assertContains(self.client.get(url, {'category__exact': 'OTHR', 'is_active__exact': '0'}), 'Lamp 0')
+        [query] = [q['sql'] for q in captured if 'FROM "auctions_listing"' in q['sql'] and 'ORDER BY' in q['sql']]
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {query}')
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('listing_category_idx', plan)
+
+    def test_listing_str_makes_no_queries(self):
+        self.add_listings(1)
+        listing = Listing.objects.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(str(listing), 'Lamp 0: $20')
+
+    def test_autocomplete(self):
+        self.add_listings(1)
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'term': 'Lamp', 'app_label': 'auctions', 'model_name': 'bid', 'field_name': 'listing'
+        })
+        self.assertEqual([r['text'] for r in response.json()['results']], ['Lamp 0: $20'])
+
+
+class ApiTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.bidder = User.objects.create_user('bidder', 'bidder@example.com', 'pass')
+        self.listings = [
+            Listing.objects.create(title=f'Lamp {i}', description='Desk lamp', owner=self.owner, starting_price=10)
+            for i in range(5)
+        ]
+        self.lamp = self.listings[0]
+        for amount in (20, 30, 40):
+            Bid.objects.create(bidder=self.bidder, listing=self.lamp, amount=amount)
+
+    def test_field_selection(self):
+        url = reverse('api_listing', args=[self.lamp.id])
+        with CaptureQueriesContext(connection) as captured:
+            data = self.client.get(url, {'fields': 'title,price,owner'}).json()
+        self.assertEqual(data, {'title': 'Lamp 0', 'price': 40, 'owner': 'owner'})
+        self.assertNotIn('description', captured[-1]['sql'])
+
+        response = self.client.get(url, {'fields': 'title,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+        self.assertEqual(self.client.get(reverse('api_listing', args=[0])).status_code, 404)
+
+    def test_batch_of_ids(self):
+        ids = [self.listings[3].id, self.listings[1].id, self.lamp.id]
+        # The versions for the ETag, then the fields.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('api_listings'), {'ids': ','.join(map(str, ids)), 'fields': 'id'})
+        self.assertEqual([r['id'] for r in response.json()['results']], ids)
+        self.assertEqual(self.client.get(reverse('api_listings'), {'ids': '1,x'}).status_code, 400)
+
+    def test_keyset_pagination(self):
+        url = reverse('api_listings')
+        first = self.client.get(url, {'limit': 3, 'fields': 'title'}).json()
+        self.assertEqual([r['title'] for r in first['results']], ['Lamp 0', 'Lamp 1', 'Lamp 2'])
+        second = self.client.get(url, {'limit': 3, 'after': first['next'], 'fields': 'title'}).json()
+        self.assertEqual([r['title'] for r in second['results']], ['Lamp 3', 'Lamp 4'])
+        self.assertIsNone(second['next'])
+
+        bids_url = reverse('api_listing_bids', args=[self.lamp.id])
+        page = self.client.get(bids_url, {'limit': 2}).json()
+        page = self.client.get(bids_url, {'limit': 2, 'after': page['next']}).json()
+        self.assertEqual(page, {'results': [{'id': page['results'][0]['id'], 'bidder': 'bidder', 'amount': 40,
+                                             'created': page['results'][0]['created']}], 'next': None})
+        self.assertEqual(self.client.get(bids_url, {'limit': 1000}).status_code, 400)
+
+    def test_conditional_get(self):
+        url = reverse('api_listing_comments', args=[self.lamp.id])
+        response = self.client.get(url)
+        self.assertEqual(response.json(), {'results': [], 'next': None})
+        etag = response['ETag']
+
+        # Only the version of the listing is read.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Comment.objects.create(owner=self.bidder, listing=self.lamp, content='Still working?')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c['content'] for c in response.json()['results']], ['Still working?'])
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_conditional_get_of_listings(self):
+        url = reverse('api_listings')
+        etag = self.client.get(url, {'limit': 3})['ETag']
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get(url, {'limit': 3}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(len(captured), 1)
+        self.assertNotIn('title', captured[0]['sql'])
+
+        self.listings[2].title = 'Lamp two'
+        self.listings[2].save()
+        response = self.client.get(url, {'limit': 3, 'fields': 'title'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual([r['title'] for r in response.json()['results']], ['Lamp 0', 'Lamp 1', 'Lamp two'])
+
+
+class SQLiteBackendTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'db.sqlite3')
+
+    def wrapper(self, **settings) -> DatabaseWrapper:
+        wrapper = DatabaseWrapper(dict(connection.settings_dict, NAME=self.path, CONN_HEALTH_CHECKS=True, **settings), 'scratch')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_connections_are_configured_when_they_open(self):
+        wrapper = self.wrapper()
+        with wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+        # What atomic() runs to open a transaction.
+        statements = []
+        wrapper.connection.set_trace_callback(statements.append)
+        wrapper._start_transaction_under_autocommit()
+        self.assertEqual(statements, ['BEGIN IMMEDIATE'])
+        wrapper.connection.execute('COMMIT')
+
+    def test_statements_are_retried_while_the_database_is_busy(self):
+        wrapper = self.wrapper(PRAGMAS={'journal_mode': 'WAL', 'busy_timeout': 10})
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x)')
+
+        holder = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.addCleanup(holder.close)
+        holder.execute('BEGIN IMMEDIATE')
+        release = threading.Timer(0.05, holder.execute, ['COMMIT'])
+        release.start()
+        self.addCleanup(release.join)
+        with wrapper.cursor() as cursor:
+            cursor.execute('INSERT INTO t VALUES (1)')
+            cursor.execute('SELECT count(*) FROM t')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_health_check_replaces_a_broken_connection(self):
+        wrapper = self.wrapper()
+        wrapper.ensure_connection()
+        broken = wrapper.connection
+        broken.close()
+        # A new request starts.
+        wrapper.close_if_unusable_or_obsolete()
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.assertIsNot(wrapper.connection, broken)
+
+    def test_retry_on_busy(self):
+        calls = []
+
+        @retry_on_busy
+        def write():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return 'written'
+
+        self.assertEqual(write(), 'written')
+        self.assertEqual(len(calls), 3)
+
+        @retry_on_busy
+        def conflict():
+            calls.append(1)
+            raise OperationalError('database table is locked')
+
+        calls.clear()
+        with self.assertRaises(OperationalError):
+            conflict()
+        self.assertEqual(len(calls), 1)
+
+
+class PubSubTests(SimpleTestCase):
+
+    def test_slow_subscribers_keep_the_latest_messages(self):
+        broker = pubsub.LocalBroker(max_pending=2)
+
+        async def scenario():
+            sub = broker.subscribe('listing-1')
+            for price in range(5):
+                broker.publish('listing-1', {'price': price})
+            await asyncio.sleep(0)
+            messages = [await sub.get(), await sub.get()]
+            sub.close()
+            return messages, sub.dropped
+
+        messages, dropped = asyncio.run(scenario())
+        self.assertEqual(messages, [{'price': 3}, {'price': 4}])
+        self.assertEqual(dropped, 3)
+        self.assertEqual(broker._channels, {})
+
+    def test_socket_brokers_register_each_other(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        first = pubsub.SocketBroker(directory.name)
+        self.addCleanup(first.close)
+        second = pubsub.SocketBroker(directory.name)
+        self.addCleanup(second.close)
+        deadline = time.monotonic() + 2
+        while len(first.peers()) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(first.peers(), second.peers())
+
+        async def scenario():
+            sub = first.subscribe('listing-1')
+            second.publish('listing-1', {'price': 20})
+            message = await asyncio.wait_for(sub.get(), 2)
+            sub.close()
+            return message
+
+        self.assertEqual(asyncio.run(scenario()), {'price': 20})
+
+        second.close()
+        deadline = time.monotonic() + 2
+        while len(first.peers()) > 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(first.peers(), [first._address])
+        self.assertEqual(len(os.listdir(directory.name)), 1)
+
+    def test_event_stream(self):
+        broker = pubsub.LocalBroker()
+        sent = []
+
+        async def scenario():
+            disconnect = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if message['type'] == 'http.response.start':
+                    broker.publish('listing-1', {'price': 20})
+                else:
+                    disconnect.set()
+
+            await streaming.listing_events({}, receive, send, listing_id=1)
+
+        with mock.patch.object(pubsub, '_broker', broker):
+            asyncio.run(scenario())
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual(sent[1]['body'], b'event: bid\ndata: {"price": 20}\n\n')
+        self.assertEqual(broker._channels, {})
+
+
+class PublishBidTests(TestCase):
+
+    def test_bid_count_comes_from_the_resolution(self):
+        owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        bidder = User.objects.create_user('bidder', 'bidder@example.com', 'pass')
+        listing = Listing.objects.create(title='Lamp', description='Desk lamp', owner=owner, starting_price=10)
+        self.client.force_login(bidder)
+        with mock.patch('auctions.views.get_broker') as get_broker, self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('new_bid', args=[listing.id]), {'amount': 15})
+        get_broker.return_value.publish.assert_called_once_with(f'listing-{listing.id}', {
+            'price': 15, 'min_bid': 16, 'bid_count': 1, 'highest_bidder': 'bidder'
+        })
+
+
+class ListingVersionTests(TestCase):
+
+    def test_saves_from_stale_copies_never_reuse_a_version(self):
+        owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        listing = Listing.objects.create(title='Lamp', description='Desk lamp', owner=owner, starting_price=10)
+        first, second = Listing.objects.get(pk=listing.pk), Listing.objects.get(pk=listing.pk)
+        Comment.objects.create(owner=owner, listing=listing, content='Still working?')
+
+        first.title = 'Desk lamp'
+        first.save()
+        second.description = 'Green desk lamp'
+        second.save(update_fields=['description'])
+        self.assertEqual((first.version, second.version), (listing.version + 2, listing.version + 3))
+        self.assertEqual(Listing.objects.get(pk=listing.pk).version, listing.version + 3)
+
+
+class ExpiryTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pass')
+        self.bidders = [User.objects.create_user(f'bidder{i}', f'bidder{i}@example.com', 'pass') for i in range(2)]
+        self.now = timezone.now()
+
+    def add_listings(self, count: int, ends_at):
+        return [
+            Listing.objects.create(title=f'Lamp {i}', description='Desk lamp', owner=self.owner, starting_price=10,
+                                   ends_at=ends_at)
+            for i in range(count)
+        ]
+
+    def test_earliest_top_bid_wins(self):
+        lamp, = self.add_listings(1, self.now - timedelta(minutes=1))
+        for bidder in self.bidders:
+            Bid.objects.create(bidder=bidder, listing=lamp, amount=20)
+        self.assertEqual(close_listings([lamp.id], self.now, only_due=True), 1)
+        lamp.refresh_from_db()
+        self.assertEqual((lamp.is_active, lamp.winner, lamp.closed_at), (False, self.bidders[0], self.now))
+        with self.assertRaisesMessage(ValueError, 'Auction for this listing has ended'):
+            proxybids.submit(lamp, self.bidders[1], 30)
+
+    def test_listings_not_due_or_closed_are_left_alone(self):
+        due, later = self.add_listings(1, self.now - timedelta(minutes=1)) + self.add_listings(1, self.now + timedelta(hours=1))
+        version = Listing.objects.get(pk=due.pk).version
+        self.assertEqual(close_listings([due.id, later.id], self.now, only_due=True), 1)
+        self.assertEqual(close_listings([due.id], self.now), 0)
+        self.assertEqual(Listing.objects.get(pk=due.pk).version, version + 1)
+        self.assertTrue(Listing.objects.get(pk=later.pk).is_active)
+
+    def test_burst_of_auctions_ending_together_is_closed_in_batches(self):
+        listings = self.add_listings(120, self.now - timedelta(seconds=30))
+        for listing in listings[::3]:
+            Bid.objects.create(bidder=self.bidders[0], listing=listing, amount=20)
+
+        scheduler = ExpiryScheduler(batch_size=50)
+        scheduler.refill(self.now)
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(scheduler.run_due(self.now), 120)
+        # A fixed number of queries per batch of 50, whatever the batch holds.
+        self.assertLessEqual(len(captured), 3 * 11)
+        self.assertFalse(Listing.objects.filter(is_active=True).exists())
+        self.assertEqual(Listing.objects.filter(winner=self.bidders[0]).count(), 40)
+        self.assertEqual(CategoryStats.objects.get(category='OTHR').active_listings, 0)
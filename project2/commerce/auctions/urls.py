@@ -1,5 +1,5 @@
 from collections import namedtuple
-from django.urls import path
+from django.urls import path, re_path
 
 from . import views
 
@@ -14,10 +14,25 @@ urlpatterns = [
     path("listings/<int:listing_id>/close-auction", views.close_auction, name="close_auction"),
     path("listings/<int:listing_id>/new-bid", views.new_bid, name="new_bid"),
     path("listings/<int:listing_id>/post-comment", views.post_comment, name="post_comment"),
+    path("listings/<int:listing_id>/comments", views.listing_comments, name="listing_comments"),
+    path("listings/<int:listing_id>/events", views.listing_events, name="listing_events"),
     path("categories", views.categories, name="categories"),
     path("categories/<str:category>", views.category, name="category"),
     path("watchlist", views.watchlist, name="watchlist"),
+    path("watchlist/update", views.update_watchlist, name="update_watchlist"),
     path("watchlist/<int:listing_id>/add", views.add_to_watchlist, name="add_to_watchlist"),
     path("watchlist/<int:listing_id>/remove", views.remove_from_watchlist, name="remove_from_watchlist"),
-    path("activity", views.activity, name="activity")
+    path("activity", views.activity, name="activity"),
+    path("inbox", views.inbox, name="inbox"),
+    path("export/<str:kind>", views.export, name="export"),
+    path("stats/fragment-cache", views.fragment_cache_stats, name="fragment_cache_stats"),
+    path("api/bulk-load", views.bulk_load, name="bulk_load"),
+    path("api/listings", views.api_listings, name="api_listings"),
+    path("api/listings/<int:listing_id>", views.api_listing, name="api_listing"),
+    path("api/listings/<int:listing_id>/bids", views.api_listing_bids, name="api_listing_bids"),
+    path("api/listings/<int:listing_id>/comments", views.api_listing_comments, name="api_listing_comments"),
+    path("api/categories", views.api_categories, name="api_categories"),
+    path("api/listings/<int:listing_id>/price-history", views.listing_price_history, name="listing_price_history"),
+    path("api/categories/<str:category>/bid-stats", views.category_bid_stats, name="category_bid_stats"),
+    re_path(r"^media/(?P<path>listing-images/.+)$", views.listing_image, name="listing_image")
 ]
@@ -1,55 +1,47 @@
+from functools import partial
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.core.cache import caches
+from django.core.paginator import Paginator
 from django.forms.models import inlineformset_factory
 from django.views.decorators.http import require_http_methods
-from django.db import IntegrityError
-from django.http import HttpRequest, HttpResponse, HttpResponseRedirect, HttpResponseNotFound, HttpResponseServerError
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse, HttpRequest, HttpResponse, HttpResponseRedirect, HttpResponseBadRequest, HttpResponseNotFound, HttpResponseServerError, StreamingHttpResponse
 from django.shortcuts import render
 from django.urls import reverse
-from django import forms
-
-from .models import User, Listing, Bid, Comment
-
-
-class ListingForm(forms.ModelForm):
-    class Meta:
-        model = Listing
-        exclude = ['created', 'owner', 'is_active']
+from django.views.static import serve
+
+from .activity import owned_listings, bidded_listings
+from . import api, bidstats, coalescing, proxybids, similar
+from . import categories as category_pages
+from .bulk import BulkLoader, read_records, text_stream
+from .comments import comments_page
+from .expiry import close_listings
+from . import exports, images
+from .forms import ListingForm, EditListingForm, BiddingForm, CommentForm
+from .models import (
+    User, Listing, Bid, ActivitySummary, InboxMessage, ListingBidStats, CategoryBidStats,
+    CategoryPricePercentiles, CategoryStats, ArchivedListing
+)
+from .pubsub import get_broker, listing_channel
+from . import watchlist as watchlists
+
+
+ACTIVITY_PAGE_SIZE = 20
+CATEGORY_PAGE_SIZE = 30
+# Longest window of the bid statistics endpoints, in hours.
+MAX_STATS_HOURS = 24 * 90
 
-class EditListingForm(forms.ModelForm):
-    class Meta:
-        model = Listing
-        fields = ['title', 'image_url', 'category']
-
-class BiddingForm(forms.ModelForm):
-    class Meta:
-        model = Bid
-        fields = ['amount']
-        labels = {
-            'amount': ''
-        }
-
-class CommentForm(forms.ModelForm):
-    class Meta:
-        model = Comment
-        fields = ['content']
-        labels = {
-            'content': ''
-        }
-        widgets = {
-            'content': forms.Textarea(
-                attrs={'cols': 45, 'rows': 1, 'placeholder': 'Write a comment...'}
-                )
-        }
 
 @require_http_methods(["GET"])
 def index(request: HttpRequest) -> HttpResponse:
-    listings = {
-        l: l.bids.first().amount if l.bids.exists() else l.starting_price
-        for l in Listing.objects.filter(is_active=True)
-    }
     return render(request, "auctions/index.html", {
-        "listings": listings
+        "listings": Listing.objects.filter(is_active=True).select_related('image'),
+        "watched": watchlists.watched_ids(request)
     })
 
 @require_http_methods(["GET", "POST"])
@@ -109,7 +101,7 @@ def register(request: HttpRequest) -> HttpResponse:
 def new_listing(request: HttpRequest) -> HttpResponse:
     # If method is POST, try to create a new listing based on the submitted form.
     if request.method == "POST":
-        form = ListingForm(request.POST)
+        form = ListingForm(request.POST, request.FILES)
         
         if not form.is_valid():
             return render(request, 'auctions/new-listing.html', {
@@ -119,7 +111,19 @@ def new_listing(request: HttpRequest) -> HttpResponse:
         
         listing = form.save(commit=False)
         listing.owner = request.user
+        if form.cleaned_data['upload']:
+            try:
+                listing.image = images.ingest(form.cleaned_data['upload'].read())
+            except ValueError as e:
+                form.add_error('upload', str(e))
+                return render(request, 'auctions/new-listing.html', {
+                    "listing_form": form,
+                    "error_field_message": ('upload', [str(e)])
+                }, status=400)
         listing.save()
+        if listing.image_url and not listing.image:
+            # Linked images are copied to local storage in the background.
+            transaction.on_commit(lambda: images.schedule(images.ingest_listing_url, listing.id))
         return HttpResponseRedirect(reverse('listing', args=[listing.id]))
     
     # If method is GET just return the empty form.
@@ -130,27 +134,45 @@ def new_listing(request: HttpRequest) -> HttpResponse:
 
 @require_http_methods(["GET"])
 def listing(request: HttpRequest, listing_id: int) -> HttpResponse:
+    # Anonymous visitors all see the same page, it is rendered once for all of
+    # them and briefly cached (see auctions.coalescing).
+    if not request.user.is_authenticated:
+        return coalescing.listing_pages.get_or_render(listing_id, lambda: render_listing(request, listing_id))
+    return render_listing(request, listing_id)
+
+def render_listing(request: HttpRequest, listing_id: int) -> HttpResponse:
     try:
-        listing = Listing.objects.get(pk=listing_id)
+        listing = Listing.objects.select_related('owner').get(pk=listing_id)
 
-        highest_bidder = listing.bids.first().bidder if listing.bids.exists() else None
+        highest_bidder = listing.bids.select_related('bidder').first().bidder if listing.bid_count else None
         # If no previous bids, minimum new bid is equal to the starting price of an item.
         # Else new bid must be at least +1 of the current value.
-        min_bid = listing.starting_price if not highest_bidder else listing.bids.first().amount + 1
+        min_bid = listing.starting_price if not highest_bidder else listing.current_price + 1
 
-        on_watchlist = listing.watchlist_users.filter(pk=request.user.id).exists()
+        on_watchlist = listing.id in watchlists.watched_ids(request)
+        max_bid = None
+        # Maxima are only ever recorded along with a bid.
+        if listing.bid_count and listing.is_active and request.user.is_authenticated and request.user != listing.owner:
+            max_bid = listing.proxy_bids.filter(bidder=request.user).values_list('max_amount', flat=True).first()
 
         return render(request, 'auctions/listing.html', {
             "listing": listing,
             "min_bid": min_bid,
             "highest_bidder": highest_bidder,
             "on_watchlist": on_watchlist,
+            "max_bid": max_bid,
             "bidding_form": BiddingForm(auto_id=False, initial={'amount': min_bid}),
             "comment_form": CommentForm(auto_id=False),
-            "comments": listing.listing_comments.all()
+            # Called by the template only when the comment thread is not cached.
+            "comments_page": partial(comments_page, listing.id),
+            "similar_listings": partial(similar.similar_listings, listing.id)
         })
 
     except Listing.DoesNotExist:
+        # Auctions closed long ago are served from the archive (see auctions.archive).
+        archived = ArchivedListing.objects.select_related('image', 'winner').filter(pk=listing_id).first()
+        if archived is not None:
+            return render(request, 'auctions/archived-listing.html', {"listing": archived})
         return HttpResponseNotFound(f"<strong>NOT FOUND!</strong><br>No listing with an id={listing_id}!")
     except Listing.MultipleObjectsReturned:
         return HttpResponseServerError(
@@ -187,10 +209,18 @@ def edit_listing(request: HttpRequest, listing_id: int) -> HttpResponse:
                     'error_field_message': next(iter(form.errors.items()))
                 }, status=400)
 
+            image_changed = listing.image_url != form.cleaned_data['image_url']
+            old_category = listing.category
             listing.title = form.cleaned_data['title']
             listing.image_url = form.cleaned_data['image_url']
             listing.category = form.cleaned_data['category']
-            listing.save()
+            if image_changed:
+                listing.image = None
+            with transaction.atomic():
+                listing.save()
+                category_pages.listing_moved(old_category, listing)
+            if image_changed and listing.image_url:
+                transaction.on_commit(lambda: images.schedule(images.ingest_listing_url, listing.id))
 
             return HttpResponseRedirect(reverse('listing', args=[listing_id]))
         else:
@@ -233,8 +263,7 @@ def close_auction(request: HttpRequest, listing_id: int) -> HttpResponse:
             cntxt['msg'] = 'Auction for this listing was already closed!'
             return render(request, 'auctions/error-msg-redirect.html', cntxt, status=400)
         
-        listing.is_active = False
-        listing.save()
+        close_listings([listing.id])
         return HttpResponseRedirect(reverse('listing', args=[listing.id]))
 
     except Listing.DoesNotExist:
@@ -260,27 +289,27 @@ def new_bid(request: HttpRequest, listing_id: int) -> HttpResponse:
             'redirect_arg': listing_id
         }
 
-        if request.user == listing.owner:
-            cntxt['msg'] = 'Cannot place a bid for a listing that you are an owner of!'
-            return render(request, 'auctions/error-msg-redirect.html', cntxt, status=400)
-
         form = BiddingForm(request.POST)
 
         if not form.is_valid():
             cntxt['field'], cntxt['msg'] = form.errors.popitem()
             return render(request, 'auctions/error-msg-redirect.html', cntxt, status=400)
 
-        min_bid = listing.starting_price if not listing.bids.exists() else listing.bids.first().amount + 1
-        bid_amount = form.cleaned_data['amount']
-        if min_bid >  bid_amount:
-            cntxt['msg'] = f'Minimal bid not met! Bid must be at least ${min_bid}'
+        # Plain bids and maxima are both resolved against the listing's order of
+        # proxy bids, see auctions.proxybids.
+        try:
+            resolution = proxybids.submit(
+                listing, request.user, form.cleaned_data['amount'], automatic=form.cleaned_data['automatic']
+            )
+        except ValueError as e:
+            cntxt['msg'] = str(e)
             return render(request, 'auctions/error-msg-redirect.html', cntxt, status=400)
 
-        else:
-            bid = Bid(bidder=request.user, amount=bid_amount, listing=listing)
-            bid.save()
-    
-            return HttpResponseRedirect(reverse('listing', args=[listing.id]))
+        if resolution.bids:
+            # The first of the highest bids is the winning one.
+            top = max(resolution.bids, key=lambda b: b.amount)
+            transaction.on_commit(lambda: publish_bid(top, resolution.bid_count))
+        return HttpResponseRedirect(reverse('listing', args=[listing.id]))
 
     except Listing.DoesNotExist:
         return HttpResponseNotFound(f"<strong>NOT FOUND!</strong><br>No listing with an id={listing_id}!")
@@ -295,6 +324,40 @@ def new_bid(request: HttpRequest, listing_id: int) -> HttpResponse:
             'redirect_arg': listing_id
         }, status=400)
 
+def publish_bid(bid: Bid, bid_count: int):
+    """Broadcasts the new state of the listing to everyone watching its page.
+    """
+    get_broker().publish(listing_channel(bid.listing_id), {
+        'price': bid.amount,
+        'min_bid': bid.amount + 1,
+        'bid_count': bid_count,
+        'highest_bidder': bid.bidder.username
+    })
+
+@require_http_methods(["GET"])
+def listing_comments(request: HttpRequest, listing_id: int) -> HttpResponse:
+    """Returns the HTML of the page of comments following the 'after' cursor, it is
+    appended to the thread on the listing page as the user scrolls down.
+    """
+    try:
+        page = comments_page(listing_id, request.GET.get('after'))
+    except ValueError:
+        return HttpResponseBadRequest('Invalid cursor.')
+    if not page.comments and not Listing.objects.filter(pk=listing_id).exists():
+        return HttpResponseNotFound(f"<strong>NOT FOUND!</strong><br>No listing with an id={listing_id}!")
+    return render(request, 'auctions/comment-list.html', {
+        'listing_id': listing_id,
+        'page': page
+    })
+
+@require_http_methods(["GET"])
+def listing_events(request: HttpRequest, listing_id: int) -> HttpResponse:
+    """Live bid updates are streamed by the ASGI application (see auctions.streaming).
+    When served over WSGI there is no stream, and 204 tells EventSource clients not
+    to reconnect.
+    """
+    return HttpResponse(status=204)
+
 @login_required
 @require_http_methods(["POST"])
 def post_comment(request: HttpRequest, listing_id: int) -> HttpResponse:
@@ -334,29 +397,57 @@ def post_comment(request: HttpRequest, listing_id: int) -> HttpResponse:
 
 @require_http_methods(["GET"])
 def categories(request: HttpRequest) -> HttpResponse:
+    """Lists the categories with the number of active listings and their price
+    range, read from the CategoryStats counters.
+    """
+    stats = CategoryStats.objects.in_bulk()
     return render(request, "auctions/categories.html", {
-        "categories": [(label.lower(), name) for label, name in Listing.LISTING_CATEGORIES]
+        "categories": [
+            (label.lower(), name, stats.get(label)) for label, name in Listing.LISTING_CATEGORIES
+        ]
     })
 
 @require_http_methods("GET")
 def category(request: HttpRequest, category: str) -> HttpResponse:
+    """Shows the active listings of a category page by page, narrowed down by the
+    'price' band and 'bids' facets and ordered by 'sort' (see auctions.categories).
+    """
     all_categories = { id: name for id, name in Listing.LISTING_CATEGORIES }
     category = category.upper()
 
     if category not in all_categories:
         return HttpResponseNotFound(f"<strong>NOT FOUND!</strong><br>No category with an id={category.lower()}!")
-    
-    name = all_categories[category]
+
+    facets = {name: request.GET.get(name, '') for name in ('price', 'bids', 'sort')}
+    try:
+        listings = category_pages.facet_listings(category, **facets)
+    except ValueError as e:
+        return render(request, 'auctions/error-msg-redirect.html', {
+            'msg': str(e),
+            'redirect_to': 'category',
+            'redirect_arg': category.lower()
+        }, status=400)
+
+    stats = CategoryStats.objects.filter(category=category).first()
+    paginator = Paginator(listings, CATEGORY_PAGE_SIZE)
+    if stats is not None and not facets['price'] and not facets['bids']:
+        # Without filters the counter has the total, the paginator need not count.
+        paginator.count = stats.active_listings
+
     return render(request, 'auctions/category.html', {
-        "title": name,
-        "listings": Listing.objects.filter(is_active=True).filter(category=category)
+        "title": all_categories[category],
+        "category": category.lower(),
+        "stats": stats,
+        "listings": paginator.get_page(request.GET.get('page')),
+        "facet_links": category_pages.facet_links(facets),
+        "query": urlencode({name: value for name, value in facets.items() if value}),
     })
 
 @login_required
 @require_http_methods(["GET"])
 def watchlist(request: HttpRequest) -> HttpResponse:
     return render(request, 'auctions/watchlist.html', {
-        'listings': request.user.watchlist.all()
+        'listings': Listing.objects.filter(pk__in=watchlists.watched_ids(request))
     })
 
 @login_required
@@ -370,7 +461,7 @@ def add_to_watchlist(request: HttpRequest, listing_id: int) -> HttpResponse:
                 'redirect_to': 'listing',
                 'redirect_arg': listing_id
             }, status=400)
-        request.user.watchlist.add(listing)
+        watchlists.add(request.user, [listing.id])
         return HttpResponseRedirect(reverse('listing', args=[listing_id]))
     except Listing.DoesNotExist:
         return HttpResponseNotFound(f"<strong>NOT FOUND!</strong><br>No listing with an id={listing_id}!")
@@ -384,7 +475,7 @@ def add_to_watchlist(request: HttpRequest, listing_id: int) -> HttpResponse:
 def remove_from_watchlist(request: HttpRequest, listing_id: int) -> HttpResponse:
     try:
         listing = Listing.objects.get(pk=listing_id)
-        request.user.watchlist.remove(listing)
+        watchlists.remove(request.user, [listing.id])
         return HttpResponseRedirect(reverse('listing', args=[listing_id]))
     except Listing.DoesNotExist:
         return HttpResponseNotFound(f"<strong>NOT FOUND!</strong><br>No listing with an id={listing_id}!")
@@ -393,23 +484,268 @@ def remove_from_watchlist(request: HttpRequest, listing_id: int) -> HttpResponse
             'Sorry! Something went wrong while processing your request, please try again later!'
             )
 
+@login_required
+@require_http_methods(["POST"])
+def update_watchlist(request: HttpRequest) -> HttpResponse:
+    """Adds and removes many listings at once, ids are given in the 'add' and
+    'remove' form fields. Redirects back to the watchlist.
+    """
+    try:
+        to_add = [int(pk) for pk in request.POST.getlist('add')]
+        to_remove = [int(pk) for pk in request.POST.getlist('remove')]
+    except ValueError:
+        return render(request, 'auctions/error-msg-redirect.html', {
+            'msg': 'Listing ids must be numbers.',
+            'redirect_to': 'watchlist'
+        }, status=400)
+
+    if to_add:
+        watchlists.add(request.user, to_add)
+    if to_remove:
+        watchlists.remove(request.user, to_remove)
+    return HttpResponseRedirect(reverse('watchlist'))
+
+@login_required
+@require_http_methods(["GET"])
+def inbox(request: HttpRequest) -> HttpResponse:
+    """Shows the latest notifications of the user and marks them as read.
+    """
+    messages = list(InboxMessage.objects.filter(user=request.user)[:50])
+    InboxMessage.objects.filter(pk__in=[m.pk for m in messages if not m.is_read]).update(is_read=True)
+    return render(request, 'auctions/inbox.html', {
+        'inbox_messages': messages
+    })
+
 @login_required
 @require_http_methods(["GET"])
 def activity(request: HttpRequest) -> HttpResponse:
-    owned_listings = { 
-        l: l.bids.first().amount if l.bids.exists() else l.starting_price 
-        for l in Listing.objects.filter(owner=request.user) 
-        }
-    
-    # User can bid multiple times on single listing -> use set
-    bidded_listings = { bid.listing for bid in Bid.objects.filter(bidder=request.user) }
-    bidded_listings = { 
-        l: l.bids.first().amount if l.bids.exists() else l.starting_price 
-        for l in bidded_listings 
-    }
+    """Lists the listings of the user and the listings the user has bid on, page
+    by page, with totals taken from the user's ActivitySummary.
+    """
+    owned_page = Paginator(owned_listings(request.user), ACTIVITY_PAGE_SIZE) \
+        .get_page(request.GET.get('owned_page'))
+    bidded_page = Paginator(bidded_listings(request.user), ACTIVITY_PAGE_SIZE) \
+        .get_page(request.GET.get('bidded_page'))
+
+    # Paging through one list keeps the page of the other one.
+    owned_query, bidded_query = request.GET.copy(), request.GET.copy()
+    owned_query.pop('owned_page', None)
+    bidded_query.pop('bidded_page', None)
 
     return render(request, 'auctions/activity.html', {
-        "owned_listings": owned_listings,
-        "bidded_listings": bidded_listings
+        "owned_listings": owned_page,
+        "owned_query": owned_query.urlencode(),
+        "bidded_listings": bidded_page,
+        "bidded_query": bidded_query.urlencode(),
+        "summary": ActivitySummary.objects.filter(user=request.user).first()
     })
-    
\ No newline at end of file
+
+@require_http_methods(["GET"])
+def listing_image(request: HttpRequest, path: str) -> HttpResponse:
+    """Serves stored listing images. Their names are content hashes, so they never
+    change and browsers may cache them for good.
+    """
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@staff_member_required
+@require_http_methods(["GET"])
+def fragment_cache_stats(request: HttpRequest) -> HttpResponse:
+    return JsonResponse(caches['fragments'].stats())
+
+@staff_member_required
+@require_http_methods(["POST"])
+def bulk_load(request: HttpRequest) -> HttpResponse:
+    """Loads listings, bids and comments streamed in the request body as JSON lines
+    (or CSV with ?format=csv), see auctions.bulk for the record format. Responds
+    with a report of loaded and rejected rows.
+    """
+    fmt = request.GET.get('format', 'jsonl')
+    if fmt not in ('csv', 'jsonl'):
+        return JsonResponse({'error': f"Unknown format '{fmt}'."}, status=400)
+    try:
+        chunk_size = int(request.GET.get('chunk_size', 1000))
+    except ValueError:
+        return JsonResponse({'error': 'chunk_size must be a number.'}, status=400)
+
+    try:
+        report = BulkLoader(chunk_size=max(chunk_size, 1)).load(
+            read_records(text_stream(request), fmt, request.GET.get('type'))
+        )
+    except (ValueError, UnicodeDecodeError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(report.as_dict())
+
+@login_required
+@require_http_methods(["GET"])
+def export(request: HttpRequest, kind: str) -> HttpResponse:
+    """Streams the user's listings ('listings') or the bids on them ('bids') as a
+    CSV or JSON-lines download (?format=csv|jsonl), gzipped with ?gzip=1.
+    """
+    fmt = request.GET.get('format', 'csv')
+    gzip = request.GET.get('gzip') == '1'
+    try:
+        content = exports.stream(kind, request.user, fmt, gzip=gzip)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    filename = f'{kind}.{fmt}' + ('.gz' if gzip else '')
+    response = StreamingHttpResponse(content, content_type='application/gzip' if gzip else exports.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def stats_hours(request: HttpRequest) -> int:
+    """Raises ValueError for an invalid 'hours' parameter.
+    """
+    hours = int(request.GET.get('hours', 24 * 7))
+    if not 1 <= hours <= MAX_STATS_HOURS:
+        raise ValueError
+    return hours
+
+@require_http_methods(["GET"])
+def listing_price_history(request: HttpRequest, listing_id: int) -> HttpResponse:
+    """Hourly bid count, min, max and average price of a listing over the last
+    'hours' hours (a week by default), read from the pre-aggregated buckets.
+    """
+    try:
+        hours = stats_hours(request)
+    except ValueError:
+        return JsonResponse({'error': f'hours must be a number between 1 and {MAX_STATS_HOURS}.'}, status=400)
+    listing = Listing.objects.filter(pk=listing_id).values('current_price', 'bid_count').first()
+    if listing is None:
+        return JsonResponse({'error': f'No listing with an id={listing_id}.'}, status=404)
+
+    return JsonResponse({
+        'listing': listing_id,
+        'current_price': listing['current_price'],
+        'bid_count': listing['bid_count'],
+        'buckets': bidstats.history(ListingBidStats.objects.filter(listing_id=listing_id), hours)
+    })
+
+@require_http_methods(["GET"])
+def category_bid_stats(request: HttpRequest, category: str) -> HttpResponse:
+    """Hourly bid statistics of a category, with the price percentiles of the last
+    run of the compute_price_percentiles job when there was one.
+    """
+    category = category.upper()
+    if category not in dict(Listing.LISTING_CATEGORIES):
+        return JsonResponse({'error': f'No category with an id={category.lower()}.'}, status=404)
+    try:
+        hours = stats_hours(request)
+    except ValueError:
+        return JsonResponse({'error': f'hours must be a number between 1 and {MAX_STATS_HOURS}.'}, status=400)
+
+    percentiles = CategoryPricePercentiles.objects.filter(category=category).first()
+    return JsonResponse({
+        'category': category.lower(),
+        'buckets': bidstats.history(CategoryBidStats.objects.filter(category=category), hours),
+        'percentiles': percentiles and {
+            'bids_count': percentiles.bids_count,
+            'values': percentiles.percentiles,
+            'computed': percentiles.computed.isoformat(),
+        }
+    })
+
+def api_fields_and_page(request: HttpRequest, available: dict, default: list = None):
+    """Raises ValueError with a message for the client.
+    """
+    fields = api.parse_fields(request, available, default)
+    try:
+        limit = api.page_size(request)
+    except ValueError:
+        raise ValueError(f'limit must be a number between 1 and {api.MAX_PAGE_SIZE}.')
+    return fields, limit
+
+@require_http_methods(["GET"])
+def api_listings(request: HttpRequest) -> HttpResponse:
+    """Listings with the ?fields= requested, either the ones given by ?ids=1,2,3 or
+    page by page in id order (?after=, ?limit=), optionally of one ?category= or
+    only ?active=1 or closed (?active=0) ones.
+    """
+    try:
+        fields, limit = api_fields_and_page(request, api.LISTING_FIELDS, api.DEFAULT_LISTING_FIELDS)
+    except ValueError as e:
+        return api.error(str(e))
+    try:
+        ids = api.parse_ids(request.GET['ids']) if 'ids' in request.GET else None
+        after = int(request.GET['after']) if request.GET.get('after') else None
+    except ValueError:
+        return api.error(f'ids and after must be numbers, with at most {api.MAX_PAGE_SIZE} ids.')
+
+    category = request.GET.get('category')
+    if category is not None:
+        category = category.upper()
+        if category not in dict(Listing.LISTING_CATEGORIES):
+            return api.error(f'No category with an id={category.lower()}.')
+    active = {'1': True, '0': False}.get(request.GET.get('active'))
+
+    versions, next_cursor = api.listing_versions(ids, after, limit, category, active)
+    etag = api.make_etag(versions)
+    response = api.not_modified(request, etag)
+    if response is not None:
+        return response
+    data = {'results': api.listings(fields, [pk for pk, _ in versions])}
+    if ids is None:
+        data['next'] = next_cursor
+    return api.json_response(data, etag=etag)
+
+@require_http_methods(["GET"])
+def api_listing(request: HttpRequest, listing_id: int) -> HttpResponse:
+    try:
+        fields = api.parse_fields(request, api.LISTING_FIELDS)
+    except ValueError as e:
+        return api.error(str(e))
+    versions, _ = api.listing_versions(ids=[listing_id])
+    if not versions:
+        return api.error(f'No listing with an id={listing_id}.', status=404)
+    etag = api.make_etag(versions)
+    response = api.not_modified(request, etag)
+    if response is not None:
+        return response
+    results = api.listings(fields, [listing_id])
+    if not results:
+        # Deleted since its version was read.
+        return api.error(f'No listing with an id={listing_id}.', status=404)
+    return api.json_response(results[0], etag=etag)
+
+def api_listing_children(request: HttpRequest, listing_id: int, available: dict, fetch) -> HttpResponse:
+    """Bids or comments of a listing. The version of the listing covers them, so
+    a client with a fresh copy gets a 304 before they are read.
+    """
+    try:
+        fields, limit = api_fields_and_page(request, available)
+    except ValueError as e:
+        return api.error(str(e))
+    version = Listing.objects.filter(pk=listing_id).values_list('version', flat=True).first()
+    if version is None:
+        return api.error(f'No listing with an id={listing_id}.', status=404)
+    etag = api.make_etag([(listing_id, version)])
+    response = api.not_modified(request, etag)
+    if response is not None:
+        return response
+
+    try:
+        results, next_cursor = fetch(listing_id, fields, request.GET.get('after') or None, limit)
+    except ValueError:
+        return api.error('Invalid cursor.')
+    return api.json_response({'results': results, 'next': next_cursor}, etag=etag)
+
+@require_http_methods(["GET"])
+def api_listing_bids(request: HttpRequest, listing_id: int) -> HttpResponse:
+    """Bids of a listing, oldest first (?after= the id of the last bid seen).
+    """
+    def fetch(listing_id, fields, after, limit):
+        return api.bids(listing_id, fields, int(after) if after else None, limit)
+    return api_listing_children(request, listing_id, api.BID_FIELDS, fetch)
+
+@require_http_methods(["GET"])
+def api_listing_comments(request: HttpRequest, listing_id: int) -> HttpResponse:
+    """Comments of a listing, oldest first (?after= the 'next' cursor of the
+    previous page).
+    """
+    return api_listing_children(request, listing_id, api.COMMENT_FIELDS, api.comments)
+
+@require_http_methods(["GET"])
+def api_categories(request: HttpRequest) -> HttpResponse:
+    return api.json_response({'results': api.categories()})
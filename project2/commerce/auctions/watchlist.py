@@ -0,0 +1,123 @@
+"""Watchlist membership, cached per session, and the reverse listing -> watchers
+lookup used to notify everybody watching a listing.
+"""
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.http import HttpRequest
+
+from . import backends
+from .models import User, Listing
+
+
+Watch = User.watchlist.through
+
+SESSION_KEY = '_watchlist'
+
+
+def _version_key(user_id: int) -> str:
+    return f'watchlist-version:{user_id}'
+
+
+def _changed(user: User):
+    """Invalidates the membership sets cached in all sessions of the user.
+    """
+    User.objects.filter(pk=user.pk).update(watchlist_version=F('watchlist_version') + 1)
+    user.watchlist_version = User.objects.values_list('watchlist_version', flat=True).get(pk=user.pk)
+    backends.forget_user(user.pk)
+    # Other processes may serve the user from their own cache until it expires,
+    # the new version is kept next to the sessions until then.
+    caches[settings.SESSION_CACHE_ALIAS].set(
+        _version_key(user.pk), user.watchlist_version, getattr(settings, 'AUCTIONS_USER_CACHE_TTL', 30)
+    )
+
+
+def _cookie_sessions() -> bool:
+    return settings.SESSION_ENGINE == 'django.contrib.sessions.backends.signed_cookies'
+
+
+def watched_ids(request: HttpRequest) -> frozenset:
+    """Returns the ids of the listings on the user's watchlist. The set is kept in
+    the session and only reloaded after the watchlist changes (the version it
+    is checked against comes with the user row loaded for every request, or
+    from the session cache when the row is older than the change), so checking
+    the watch state of any number of listings costs no queries.
+    """
+    if not request.user.is_authenticated:
+        return frozenset()
+
+    if _cookie_sessions():
+        # Cookies must stay small, a long watchlist would not fit in one.
+        return frozenset(Watch.objects.filter(user_id=request.user.id).values_list('listing_id', flat=True))
+
+    version = max(
+        request.user.watchlist_version,
+        caches[settings.SESSION_CACHE_ALIAS].get(_version_key(request.user.id), 0),
+    )
+    cached = request.session.get(SESSION_KEY)
+    if cached is None or cached['version'] != version:
+        cached = {
+            'version': version,
+            'ids': list(Watch.objects.filter(user_id=request.user.id).values_list('listing_id', flat=True)),
+        }
+        request.session[SESSION_KEY] = cached
+    return frozenset(cached['ids'])
+
+
+def add(user: User, listing_ids: Iterable[int]) -> int:
+    """Adds the listings to the user's watchlist, skipping missing listings, the
+    user's own listings and listings already on the watchlist. Returns the number
+    of listings added.
+    """
+    listing_ids = set(
+        Listing.objects.filter(pk__in=list(listing_ids)).exclude(owner=user).values_list('pk', flat=True)
+    )
+    listing_ids -= set(Watch.objects.filter(user=user, listing_id__in=listing_ids).values_list('listing_id', flat=True))
+    Watch.objects.bulk_create([Watch(user=user, listing_id=pk) for pk in listing_ids], ignore_conflicts=True)
+    _changed(user)
+    return len(listing_ids)
+
+
+def remove(user: User, listing_ids: Iterable[int]) -> int:
+    removed, _ = Watch.objects.filter(user=user, listing_id__in=list(listing_ids)).delete()
+    _changed(user)
+    return removed
+
+
+def watcher_batches(listing_id: int, batch_size: int = 1000, after: int = 0) -> Iterator[Tuple[int, List[int]]]:
+    """Yields the ids of the users watching a listing in batches, with the id of
+    the last watchlist row of each batch, which a later call can continue
+    'after'. Each batch is one query on the listing_id index of the watchlist
+    table, so memory use does not grow with the number of watchers.
+    """
+    last = after
+    while True:
+        batch = list(
+            Watch.objects.filter(listing_id=listing_id, pk__gt=last)
+            .order_by('pk')
+            .values_list('pk', 'user_id')[:batch_size]
+        )
+        if not batch:
+            return
+        last = batch[-1][0]
+        yield last, [user_id for _, user_id in batch]
+
+
+def watchers(listing_id: int, batch_size: int = 1000) -> Iterator[List[int]]:
+    """Yields the ids of the users watching a listing in batches.
+    """
+    for _, user_ids in watcher_batches(listing_id, batch_size):
+        yield user_ids
+
+
+def fan_out(listing_id: int, notify: Callable[[List[int]], None], batch_size: int = 1000) -> int:
+    """Calls notify() with every batch of watchers of a listing and returns the
+    total number of watchers notified.
+    """
+    notified = 0
+    for user_ids in watchers(listing_id, batch_size):
+        notify(user_ids)
+        notified += len(user_ids)
+    return notified
@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported only after Django is set up by get_asgi_application().
+from auctions.streaming import listing_events_router  # noqa: E402
+
+application = listing_events_router(django_application)
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'auctions.middleware.ReplicaStickinessMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -74,15 +75,91 @@ WSGI_APPLICATION = 'commerce.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# auctions.sqlite configures every connection for concurrent requests (WAL,
+# busy timeout, immediate transactions, see its docstring). Connections are
+# reused by the requests of a thread for CONN_MAX_AGE seconds and checked before
+# the first query of each request.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'auctions.sqlite',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas, given as a list of SQLite files separated by os.pathsep. Locally
+# they can be kept in sync with the primary by `manage.py sync_replicas`.
+DATABASE_REPLICAS = []
+for i, replica in enumerate(filter(None, os.environ.get('COMMERCE_DB_REPLICAS', '').split(os.pathsep))):
+    alias = f'replica{i + 1}'
+    DATABASES[alias] = {
+        'ENGINE': 'auctions.sqlite',
+        'NAME': replica,
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['auctions.routers.PrimaryReplicaRouter']
+
+# Seconds for which a session keeps reading from the primary after it wrote.
+REPLICA_STICKY_SECONDS = 5
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # A local memory cache only suits a single process: with several, a session
+    # ended in one of them would stay valid in the others until it expires there.
+    # Point COMMERCE_SESSION_CACHE_BACKEND/LOCATION at a shared cache for those.
+    'sessions': {
+        'BACKEND': os.environ.get('COMMERCE_SESSION_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('COMMERCE_SESSION_CACHE_LOCATION', 'sessions'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+    # Rendered listing cards and comment threads, keyed on Listing.version.
+    'fragments': {
+        'BACKEND': 'auctions.cache.StatsLocMemCache',
+        'LOCATION': 'auctions-fragments',
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', 10000)),
+            'CULL_FREQUENCY': 4,
+        },
+    },
+}
+
 AUTH_USER_MODEL = 'auctions.User'
 
+# Signed in users are served from an in-process LRU (see auctions.backends).
+# ModelBackend only keeps sessions created before the LRU was added signed in.
+AUTHENTICATION_BACKENDS = [
+    'auctions.backends.CachedUserBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+AUCTIONS_USER_CACHE_SIZE = 1000
+AUCTIONS_USER_CACHE_TTL = 30
+
+# Seconds anonymous listing pages are served from the per-process micro-cache
+# (see auctions.coalescing).
+AUCTIONS_LISTING_MICROCACHE_TTL = 2
+
+# Sessions
+# https://docs.djangoproject.com/en/3.2/topics/http/sessions/
+
+# 'cached_db' reads sessions from the 'sessions' cache and only falls back to the
+# database on a miss, 'signed_cookies' keeps them in the client altogether, 'db'
+# always uses the database.
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get('COMMERCE_SESSION_ENGINE', 'cached_db')
+SESSION_CACHE_ALIAS = 'sessions'
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Password validation
@@ -122,3 +199,44 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+# Uploaded and ingested listing images
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_URL = '/media/'
+
+# Widths of the thumbnails generated for listing images, and the number of
+# background threads generating them.
+AUCTIONS_THUMBNAIL_WIDTHS = (160, 320, 640)
+AUCTIONS_IMAGE_WORKERS = 2
+
+
+# Live listing updates
+# Use 'auctions.pubsub.SocketBroker' to fan updates out across several worker processes.
+
+AUCTIONS_PUBSUB = {
+    'BACKEND': 'auctions.pubsub.LocalBroker',
+    'OPTIONS': {
+        'max_pending': 16,
+    },
+}
+
+
+# Archive
+# Closed auctions are moved out of the live tables by `manage.py archive_listings`
+# this many days after closing.
+
+AUCTIONS_ARCHIVE_AFTER_DAYS = 30
+
+
+# Notifications
+# Digests are delivered by `manage.py deliver_notifications` to every sink listed here.
+
+AUCTIONS_NOTIFICATION_SINKS = [
+    'auctions.notifications.InboxSink',
+    'auctions.notifications.EmailSink',
+]
+
+EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
+
+DEFAULT_FROM_EMAIL = 'auctions@localhost'